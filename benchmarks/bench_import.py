@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the cold import time of ``sqlalchemy_sqlschema``.
+
+Each measurement imports the package in a fresh interpreter. The time to
+import SQL Alchemy core alone is reported as a baseline, so the difference is
+the cost of the package and whatever it pulls in. Run with
+``PYTHONPATH=. python benchmarks/bench_import.py`` in the repository root.
+"""
+from __future__ import print_function
+
+import subprocess
+import sys
+
+REPEAT = 15
+
+MEASURE = """
+import sys
+from timeit import default_timer as timer
+start = timer()
+import {module}
+elapsed = timer() - start
+print(elapsed, " ".join(
+    name for name in ("sqlalchemy.orm", "gevent", "six")
+    if name in sys.modules))
+"""
+
+
+def measure(module, repeat=REPEAT):
+    """Return the median import seconds of ``module`` and the notable modules
+    it imported."""
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, "-c", MEASURE.format(module=module)])
+        elapsed, _, imported = output.decode().strip().partition(" ")
+        timings.append(float(elapsed))
+    timings.sort()
+    return timings[len(timings) // 2], imported
+
+
+def main():
+    # pylint: disable=missing-docstring
+    for module in ("sqlalchemy", "sqlalchemy_sqlschema"):
+        median, imported = measure(module)
+        print("{0:<22} {1:7.1f} ms  imports: {2}".format(
+            module, median * 1e3, imported or "-"))
+
+
+if __name__ == "__main__":
+    main()
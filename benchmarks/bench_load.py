@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Load test of ``maintain_schema`` from many concurrent workers.
+
+Each request opens a session, enters ``maintain_schema`` for a tenant drawn
+from a uniform or Zipf distribution, executes a number of queries and closes
+the session. The database is SQLite, optionally wrapped so that every
+statement waits for an injected latency, to expose contention in the schema
+stack lookup, the event registry and the pool.
+
+Run with ``PYTHONPATH=. python benchmarks/bench_load.py --help`` in the
+repository root. Workers are threads by default, or greenlets with
+``--mode gevent`` (requires gevent, which is monkey-patched on startup). With
+``--mode asyncio``, requests run as asyncio tasks that hand the blocking
+session work to a thread pool, with the ``contextvars`` locality backend.
+
+Pass ``--json`` to print the report as JSON, e.g. to compare releases.
+Requires Python 3.
+"""
+from __future__ import print_function, division
+
+import sys
+
+if __name__ == "__main__" and "gevent" in sys.argv:
+    # patch before threading, sqlite3 and the pool are imported
+    from gevent import monkey
+    monkey.patch_all()
+
+import argparse
+import bisect
+import itertools
+import json
+import random
+import sqlite3
+import threading
+import time
+from timeit import default_timer as timer
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from sqlalchemy_sqlschema import maintain_schema, set_locality_backend
+from sqlalchemy_sqlschema.sql import GetSchema, SetSchema
+
+
+@compiles(GetSchema, "sqlite")
+def _sqlite_get_schema(element, compiler, **kw):
+    # pylint: disable=unused-argument, missing-docstring
+    return "SELECT 'main'"
+
+
+@compiles(SetSchema, "sqlite")
+def _sqlite_set_schema(element, compiler, **kw):
+    # pylint: disable=unused-argument, missing-docstring
+    return "SELECT '{0}'".format(element.schema)
+
+
+class _SlowCursor(object):
+    """A sqlite3 cursor waiting ``latency`` seconds before each statement."""
+
+    def __init__(self, cursor, latency):
+        self._cursor = cursor
+        self._latency = latency
+
+    def execute(self, *args):
+        # pylint: disable=missing-docstring
+        time.sleep(self._latency)
+        return self._cursor.execute(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _SlowConnection(object):
+    """A sqlite3 connection whose cursors are :class:`_SlowCursor`."""
+
+    def __init__(self, latency):
+        self._connection = sqlite3.connect(":memory:",
+                                           check_same_thread=False)
+        self._latency = latency
+
+    def cursor(self):
+        # pylint: disable=missing-docstring
+        return _SlowCursor(self._connection.cursor(), self._latency)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def create_load_engine(latency, pool_size):
+    """Return a SQLite engine with ``pool_size`` connections whose
+    statements wait ``latency`` seconds."""
+    if latency:
+        creator = lambda: _SlowConnection(latency)
+    else:
+        creator = lambda: sqlite3.connect(":memory:", check_same_thread=False)
+    return create_engine("sqlite://", creator=creator, poolclass=QueuePool,
+                         pool_size=pool_size, max_overflow=0, pool_timeout=60)
+
+
+def tenant_sampler(tenants, distribution, seed):
+    """Return a function drawing a tenant schema name.
+
+    :param distribution: ``"uniform"``, or ``"zipf:S"`` for a Zipf
+        distribution with exponent ``S``
+    """
+    rnd = random.Random(seed)
+    names = ["tenant{0}".format(i) for i in range(tenants)]
+    if distribution == "uniform":
+        return lambda: names[rnd.randrange(tenants)]
+    exponent = float(distribution.split(":", 1)[1])
+    weights = [1 / (rank ** exponent) for rank in range(1, tenants + 1)]
+    cumulative = list(itertools.accumulate(weights))
+    total = cumulative[-1]
+    return lambda: names[bisect.bisect(cumulative, rnd.random() * total)]
+
+
+def percentile(sorted_values, fraction):
+    """Return the ``fraction`` percentile of the sorted values."""
+    if not sorted_values:
+        return 0.0
+    position = min(int(round(fraction * (len(sorted_values) - 1))),
+                   len(sorted_values) - 1)
+    return sorted_values[position]
+
+
+def make_request(session_factory, queries):
+    """Return the function executing one request in a tenant schema."""
+    def request(tenant):
+        # pylint: disable=missing-docstring
+        session = session_factory()
+        try:
+            with maintain_schema(tenant, session):
+                for _ in range(queries):
+                    session.execute("SELECT 1").scalar()
+        finally:
+            session.close()
+    return request
+
+
+def run_threads(request, tenants, workers, requests):
+    """Run ``requests`` requests on ``workers`` threads (or greenlets if
+    threading was monkey-patched), returning the request latencies."""
+    latencies = []
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def work():
+        # pylint: disable=missing-docstring
+        own = []
+        while next(counter) < requests:
+            with lock:
+                tenant = tenants()
+            start = timer()
+            request(tenant)
+            own.append(timer() - start)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def run_asyncio(request, tenants, workers, requests):
+    """Run ``requests`` requests as asyncio tasks, ``workers`` at a time,
+    each handing the session work to a thread pool."""
+    import asyncio
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor
+
+    latencies = []
+
+    async def one(loop, executor, semaphore):
+        # pylint: disable=missing-docstring
+        async with semaphore:
+            tenant = tenants()
+            context = contextvars.copy_context()
+            start = timer()
+            await loop.run_in_executor(executor, context.run, request, tenant)
+            latencies.append(timer() - start)
+
+    async def main():
+        # pylint: disable=missing-docstring
+        loop = asyncio.get_event_loop()
+        semaphore = asyncio.Semaphore(workers)
+        with ThreadPoolExecutor(workers) as executor:
+            await asyncio.gather(*(one(loop, executor, semaphore)
+                                   for _ in range(requests)))
+
+    asyncio.run(main())
+    return latencies
+
+
+def run(args):
+    """Run the load test described by the parsed ``args`` and return the
+    report as a :class:`dict`."""
+    if args.mode == "asyncio":
+        set_locality_backend("contextvars")
+    else:
+        set_locality_backend()
+    engine = create_load_engine(args.latency / 1000, args.workers)
+    round_trips = itertools.count()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count(*args):
+        # pylint: disable=unused-argument, missing-docstring
+        next(round_trips)
+
+    session_factory = sessionmaker(bind=engine)
+    request = make_request(session_factory, args.queries)
+    tenants = tenant_sampler(args.tenants, args.distribution, args.seed)
+    runner = run_asyncio if args.mode == "asyncio" else run_threads
+
+    start = timer()
+    latencies = runner(request, tenants, args.workers, args.requests)
+    elapsed = timer() - start
+    latencies.sort()
+    engine.dispose()
+    set_locality_backend()
+    return {
+        "mode": args.mode,
+        "workers": args.workers,
+        "tenants": args.tenants,
+        "distribution": args.distribution,
+        "requests": len(latencies),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "round_trips_per_request":
+            next(round_trips) / len(latencies) if latencies else 0.0,
+    }
+
+
+def parse_args(argv=None):
+    # pylint: disable=missing-docstring
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=["threads", "gevent", "asyncio"],
+                        default="threads")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--tenants", type=int, default=100)
+    parser.add_argument("--distribution", default="uniform",
+                        help='"uniform" or "zipf:S", e.g. "zipf:1.1"')
+    parser.add_argument("--queries", type=int, default=2,
+                        help="queries per request")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="milliseconds injected before each statement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main():
+    # pylint: disable=missing-docstring
+    args = parse_args()
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return
+    print("{mode} x{workers}, {tenants} tenants ({distribution})"
+          .format(**report))
+    print("requests     {requests}".format(**report))
+    print("throughput   {throughput:10.1f} req/s".format(**report))
+    print("p50          {p50_ms:10.3f} ms".format(**report))
+    print("p99          {p99_ms:10.3f} ms".format(**report))
+    print("round trips  {round_trips_per_request:10.2f} per request"
+          .format(**report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the schema stack lookup cost of each locality backend.
+
+Run with ``PYTHONPATH=. python benchmarks/bench_locality.py`` in the repository
+root. Backends whose library is not installed are skipped.
+"""
+from __future__ import print_function
+
+import timeit
+
+from sqlalchemy_sqlschema import set_locality_backend
+from sqlalchemy_sqlschema.locality import BACKENDS
+from sqlalchemy_sqlschema.maintain_schema import SchemaContextManager
+
+NUMBER = 200000
+
+
+def bench_backend(backend, number=NUMBER):
+    """Return the seconds per ``_get_schema_stack`` call with ``backend``."""
+    set_locality_backend(backend)
+    session = object()
+    get_schema_stack = SchemaContextManager._get_schema_stack
+    get_schema_stack(session)
+    seconds = min(timeit.repeat(lambda: get_schema_stack(session),
+                                number=number, repeat=5))
+    return seconds / number
+
+
+def main():
+    # pylint: disable=missing-docstring
+    for backend in sorted(BACKENDS):
+        try:
+            per_call = bench_backend(backend)
+        except ImportError as exc:
+            print("{0:<12} skipped ({1})".format(backend, exc))
+        else:
+            print("{0:<12} {1:8.1f} ns/lookup".format(backend, per_call * 1e9))
+    set_locality_backend()
+
+
+if __name__ == "__main__":
+    main()
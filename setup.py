@@ -49,10 +49,11 @@ setup(
         'Topic :: Internet :: WWW/HTTP :: Dynamic Content',
         'Topic :: Software Development :: Libraries :: Python Modules'
     ],
-    install_requires=["sqlalchemy>=0.9", "six>=1.8"],
+    install_requires=["sqlalchemy>=0.9"],
     tests_require=tests_require,
     extras_require={
         'docs': ["Sphinx>=1.3.1", "alabaster>=0.7.4"],
+        'alembic': ["alembic>=0.7"],
         'tests': tests_require,
         'tests_postgres': tests_require_postgres,
         'tests_all': tests_require_all
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Provides :func:`bulk_write_by_schema`, which writes a batch of rows tagged with
+their schema, switching the schema once per schema instead of once per row.
+"""
+from collections import OrderedDict
+
+from .maintain_schema import maintain_schema
+
+__all__ = ["bulk_write_by_schema"]
+
+
+def _group_rows(rows, schema_key):
+    """Return an :class:`~collections.OrderedDict` mapping the schemas of
+    ``rows`` to their rows, in order of first appearance."""
+    groups = OrderedDict()
+    if callable(schema_key):
+        for row in rows:
+            groups.setdefault(schema_key(row), []).append(row)
+    else:
+        for row in rows:
+            row = dict(row)
+            groups.setdefault(row.pop(schema_key), []).append(row)
+    return groups
+
+
+def bulk_write_by_schema(session, model, rows, schema_key, chunk_size=1000,
+                         update=False):
+    """Insert (or update) ``rows`` of ``model``, each in the schema it is
+    tagged with.
+
+    The rows are grouped by schema, and written in a single
+    :func:`~sqlalchemy_sqlschema.maintain_schema` context that switches to
+    each schema in turn, restoring the previous schema once at the end. The
+    rows of each schema are written with
+    :meth:`~sqlalchemy.orm.session.Session.bulk_insert_mappings` (or
+    :meth:`~sqlalchemy.orm.session.Session.bulk_update_mappings`), which
+    execute a single executemany per chunk.
+
+    :Example:
+
+    >>> rows = [{"tenant": "tenant1", "id": 1, "amount": 10},
+    >>>         {"tenant": "tenant2", "id": 1, "amount": 20},
+    >>>         {"tenant": "tenant1", "id": 2, "amount": 30}]
+    >>> bulk_write_by_schema(session, Order, rows, "tenant")
+    OrderedDict([('tenant1', 2), ('tenant2', 1)])
+    >>> session.commit()
+
+    :param session: a :class:`~sqlalchemy.orm.session.Session`
+    :param model: the mapped class of the rows
+    :param rows: an iterable of :class:`dict` mapping attribute names of
+        ``model`` to values
+    :param schema_key: the key of the schema in each row, which is not
+        written, or a callable returning the schema of a row
+    :param chunk_size: :class:`int`, the maximum number of rows per
+        executemany
+    :param update: :class:`bool`, update the rows by primary key instead of
+        inserting them
+    :return: an :class:`~collections.OrderedDict` mapping each schema to the
+        number of rows written in it
+    """
+    write = session.bulk_update_mappings if update \
+        else session.bulk_insert_mappings
+    counts = OrderedDict()
+    groups = _group_rows(rows, schema_key)
+    if not groups:
+        return counts
+    with maintain_schema(next(iter(groups)), session) as context:
+        for schema, schema_rows in groups.items():
+            context.switch(schema)
+            for start in range(0, len(schema_rows), chunk_size):
+                write(model, schema_rows[start:start + chunk_size])
+            counts[schema] = len(schema_rows)
+    return counts
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Provides an optional result cache partitioned by SQL schema.
+
+Reads repeated inside :func:`~sqlalchemy_sqlschema.maintain_schema` blocks
+can be served from a :class:`SchemaResultCache` instead of the database. The
+cache key combines the schema maintained on the session, the compiled
+statement and its parameters, so the same statement run in different schemas
+is cached separately.
+"""
+import threading
+from collections import OrderedDict, defaultdict
+
+from sqlalchemy.sql.util import find_tables
+
+from .maintain_schema import active_schema
+
+__all__ = ["SchemaResultCache"]
+
+
+def _freeze(value):
+    """Return a hashable version of the parameter ``value``."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in
+                            value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class SchemaResultCache(object):
+    """A bounded LRU cache of statement results, partitioned by SQL schema.
+
+    Statements are only cached while a schema is maintained on the session,
+    outside of :func:`~sqlalchemy_sqlschema.maintain_schema` they are always
+    executed. Cached results are the list of rows returned by the statement.
+
+    :Example:
+
+    >>> cache = SchemaResultCache(maxsize=10000)
+    >>> with maintain_schema("tenant1", session):
+    >>>     rows = cache.execute(session, select([orders]))
+    >>>     # served from the cache
+    >>>     rows = cache.execute(session, select([orders]))
+    >>> # after writing to tenant1.orders
+    >>> cache.invalidate("tenant1", "orders")
+
+    :param maxsize: :class:`int`, the maximum number of cached results
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        #: number of results served from the cache
+        self.hits = 0
+        #: number of cacheable results read from the database
+        self.misses = 0
+        # key -> (rows, tables)
+        self._entries = OrderedDict()
+        # (schema, table name) -> keys of the entries that read the table
+        self._by_table = defaultdict(set)
+        # schema -> keys of the entries of the schema
+        self._by_schema = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def execute(self, session, statement, params=None):
+        """Execute ``statement`` with ``params`` on ``session`` and return the
+        list of its rows, reading it from the cache when possible.
+
+        :param session: a :class:`~sqlalchemy.orm.session.Session`
+        :param statement: an executable SQL Alchemy clause
+        :param params: optional :class:`dict` of bind parameter values
+        """
+        schema = active_schema(session)
+        if schema is None:
+            return session.execute(statement, params).fetchall()
+
+        compiled = statement.compile(dialect=session.get_bind().dialect)
+        bind_params = dict(compiled.params)
+        bind_params.update(params or {})
+        key = (schema, str(compiled), _freeze(bind_params))
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                # reinsert as the most recently used
+                self._entries[key] = entry
+                self.hits += 1
+                return list(entry[0])
+
+        rows = session.execute(statement, params).fetchall()
+        tables = frozenset(table.name for table in find_tables(
+            statement, include_crud=True, include_joins=True))
+        with self._lock:
+            self.misses += 1
+            self._store(key, rows, tables)
+        return list(rows)
+
+    def _store(self, key, rows, tables):
+        # pylint: disable=missing-docstring
+        self._discard(key)
+        self._entries[key] = (rows, tables)
+        schema = key[0]
+        self._by_schema[schema].add(key)
+        for table in tables:
+            self._by_table[(schema, table)].add(key)
+        while len(self._entries) > self.maxsize:
+            self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        # pylint: disable=missing-docstring
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        schema = key[0]
+        self._by_schema[schema].discard(key)
+        if not self._by_schema[schema]:
+            del self._by_schema[schema]
+        for table in entry[1]:
+            keys = self._by_table[(schema, table)]
+            keys.discard(key)
+            if not keys:
+                del self._by_table[(schema, table)]
+
+    def invalidate(self, schema, table=None):
+        """Discard the cached results of ``schema``, or only those reading
+        ``table`` if given.
+
+        Results of statements whose tables cannot be determined, such as
+        textual SQL, are only discarded when the whole ``schema`` is.
+
+        :param schema: :class:`str`, the SQL schema
+        :param table: optional :class:`str` name or
+            :class:`~sqlalchemy.schema.Table`
+        """
+        with self._lock:
+            if table is None:
+                keys = self._by_schema.get(schema, ())
+            else:
+                keys = self._by_table.get(
+                    (schema, getattr(table, "name", table)), ())
+            for key in list(keys):
+                self._discard(key)
+
+    def clear(self):
+        """Discard all the cached results."""
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._by_schema.clear()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Defers the schema restore of the outermost
+:func:`~sqlalchemy_sqlschema.maintain_schema` to the next user of the
+connection.
+
+Restoring the schema on exit is wasted when the next user of the connection
+switches to another schema right away. Once :func:`enable_deferred_restore`
+is called for an engine, exiting the outermost context executes no SQL and
+only marks the connection with the schema to restore. The next user of the
+connection then decides:
+
+- entering :func:`~sqlalchemy_sqlschema.maintain_schema` takes over the
+  connection, setting the schema only if it differs from the tracked schema
+  of the connection (see :mod:`~sqlalchemy_sqlschema.tracking`)
+- any other statement executed through SQL Alchemy first restores the marked
+  schema
+
+Statements executed directly on the DBAPI connection bypass the restore.
+"""
+from sqlalchemy import event
+
+from .sql import set_schema, SetSchema
+from .tracking import tracked_schema, _ensure_tracked
+
+__all__ = ["enable_deferred_restore", "pending_restore", "defers_restore"]
+
+# the key in the connection info holding the schema to be restored
+_PENDING_KEY = "sqlschema_deferred_restore"
+# the dialect attribute marking the engines deferring restores
+_ENABLED_KEY = "sqlschema_deferred_restore"
+
+# whether any engine defers restores, so other applications skip the
+# connection lookup in deferred_connection
+_enabled = False
+
+
+def _before_execute(conn, clauseelement, multiparams, params):
+    # pylint: disable=unused-argument, missing-docstring
+    schema = conn.info.pop(_PENDING_KEY, None)
+    if schema is None or isinstance(clauseelement, SetSchema) or \
+            tracked_schema(conn) == schema:
+        return
+    conn.execute(set_schema(schema))
+
+
+def enable_deferred_restore(engine):
+    """Defer the schema restore of the outermost
+    :func:`~sqlalchemy_sqlschema.maintain_schema` on the connections of
+    ``engine`` to their next user.
+
+    Enables the schema tracking of ``engine`` if needed.
+
+    :param engine: an :class:`~sqlalchemy.engine.Engine`
+    """
+    # pylint: disable=global-statement
+    global _enabled
+    _ensure_tracked(engine)
+    if not event.contains(engine, "before_execute", _before_execute):
+        event.listen(engine, "before_execute", _before_execute)
+    setattr(engine.dialect, _ENABLED_KEY, True)
+    _enabled = True
+
+
+def pending_restore(connection):
+    """Return the schema marked to be restored on ``connection``, or ``None``.
+
+    :param connection: a :class:`~sqlalchemy.engine.Connection`
+    """
+    return connection.info.get(_PENDING_KEY)
+
+
+def defers_restore(bind):
+    """Return whether ``bind`` defers restores.
+
+    :param bind: an :class:`~sqlalchemy.engine.Engine` or
+        :class:`~sqlalchemy.engine.Connection`
+    """
+    return _enabled and getattr(bind.dialect, _ENABLED_KEY, False)
+
+
+def deferred_connection(session):
+    """Return the connection of ``session`` if its engine defers restores,
+    otherwise ``None``."""
+    if not _enabled:
+        return None
+    connection = session.connection()
+    if not defers_restore(connection):
+        return None
+    return connection
+
+
+def claim(connection):
+    """Take over ``connection`` from its previous user, returning the schema
+    marked to be restored on it, or ``None``."""
+    return connection.info.pop(_PENDING_KEY, None)
+
+
+def defer(connection, schema):
+    """Mark ``connection`` to be restored to ``schema`` by its next user."""
+    if tracked_schema(connection) != schema:
+        connection.info[_PENDING_KEY] = schema
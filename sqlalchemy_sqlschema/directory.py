@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Provides :class:`TenantDirectory`, which maps schemas to the engines of the
+database servers they live on.
+
+When tenant schemas are sharded across several database servers, passing a
+directory to :func:`~sqlalchemy_sqlschema.maintain_schema` binds the session
+to the engine of the schema before applying it. The mapping is loaded from a
+table or a file and kept in memory, or read from a memory-mapped
+:class:`~sqlalchemy_sqlschema.index.SchemaIndex` shared across processes, so
+routing a schema needs no round trip until the mapping expires and is loaded
+again.
+"""
+import json
+import threading
+from timeit import default_timer as timer
+
+from sqlalchemy import select
+
+from .index import SchemaIndex
+
+__all__ = ["TenantDirectory", "UnknownSchemaError"]
+
+
+class UnknownSchemaError(KeyError):
+    """Raised when the directory has no entry for a schema."""
+
+
+class TenantDirectory(object):
+    """Maps schemas to engines, caching the mapping for ``ttl`` seconds.
+
+    :Example:
+
+    >>> directory = TenantDirectory.from_table(
+    >>>     control_engine, tenants_table,
+    >>>     engines={"eu1": eu1_engine, "us1": us1_engine})
+    >>> with maintain_schema("tenant7", session, directory=directory):
+    >>>     session.query(Order).all()  # on the server of tenant7
+
+    :param loader: a callable returning a mapping of schemas to the shard
+        names they live on, called again once the mapping expires
+    :param engines: :class:`dict` mapping shard names to
+        :class:`~sqlalchemy.engine.Engine` objects
+    :param ttl: seconds after which the mapping is loaded again, or ``None``
+        to keep it until :meth:`invalidate` is called
+    :param miss_interval: minimum seconds between loads triggered by unknown
+        schemas, so that tenants created since the last load are found
+        without every unknown schema causing a load
+    """
+
+    def __init__(self, loader, engines, ttl=300, miss_interval=1.0):
+        self.loader = loader
+        self.engines = engines
+        self.ttl = ttl
+        self.miss_interval = miss_interval
+        self._mapping = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_table(cls, bind, table, engines, schema_column="schema",
+                   shard_column="shard", **kwargs):
+        """Create a directory loading the mapping from ``table``.
+
+        :param bind: the :class:`~sqlalchemy.engine.Engine` of ``table``
+        :param table: a :class:`~sqlalchemy.schema.Table` with a row per
+            schema
+        :param schema_column: the name of the column holding the schemas
+        :param shard_column: the name of the column holding the shard names
+        """
+        query = select([table.c[schema_column], table.c[shard_column]])
+
+        def load():
+            # pylint: disable=missing-docstring
+            with bind.connect() as connection:
+                return dict(connection.execute(query).fetchall())
+        return cls(load, engines, **kwargs)
+
+    @classmethod
+    def from_file(cls, path, engines, **kwargs):
+        """Create a directory loading the mapping from the JSON object in the
+        file ``path``."""
+        def load():
+            # pylint: disable=missing-docstring
+            with open(path) as json_file:
+                return json.load(json_file)
+        return cls(load, engines, **kwargs)
+
+    @classmethod
+    def from_index(cls, path, engines, **kwargs):
+        """Create a directory whose mapping is the
+        :class:`~sqlalchemy_sqlschema.index.SchemaIndex` at ``path``.
+
+        The index is shared with the other processes opening it, and is
+        reopened when it expires only if the file was rebuilt.
+        """
+        opened = []
+
+        def load():
+            # pylint: disable=missing-docstring
+            if not opened or opened[0].is_stale():
+                opened[:] = [SchemaIndex(path)]
+            return opened[0]
+        return cls(load, engines, **kwargs)
+
+    def _load(self, loaded_at):
+        """Load the mapping unless it was loaded since ``loaded_at``."""
+        with self._lock:
+            if self._loaded_at is loaded_at:
+                mapping = self.loader()
+                self._mapping, self._loaded_at = mapping, timer()
+            return self._mapping
+
+    def shard(self, schema):
+        """Return the shard name of ``schema``.
+
+        :raise UnknownSchemaError: if ``schema`` is not in the directory
+        """
+        mapping, loaded_at = self._mapping, self._loaded_at
+        if mapping is None or \
+                self.ttl is not None and timer() - loaded_at > self.ttl:
+            mapping = self._load(loaded_at)
+        shard = mapping.get(schema)
+        if shard is None:
+            loaded_at = self._loaded_at
+            if loaded_at is None or \
+                    timer() - loaded_at > self.miss_interval:
+                shard = self._load(loaded_at).get(schema)
+            if shard is None:
+                raise UnknownSchemaError(schema)
+        return shard
+
+    def get_bind(self, schema):
+        """Return the :class:`~sqlalchemy.engine.Engine` of ``schema``.
+
+        :raise UnknownSchemaError: if ``schema`` is not in the directory
+        """
+        return self.engines[self.shard(schema)]
+
+    def invalidate(self):
+        """Discard the mapping, so it is loaded again on next use."""
+        with self._lock:
+            self._mapping = self._loaded_at = None
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Provides :func:`iter_export`, which streams a table from many schemas into a
+single CSV file-like sink.
+
+On PostgreSQL with psycopg2, the rows of each schema are written to the sink
+by ``COPY ... TO STDOUT``, without being turned into Python objects. Other
+dialects fetch the rows in chunks from a server-side cursor (the
+``stream_results`` execution option) and write them as CSV the way ``COPY``
+does for NULLs (unquoted empty fields), empty strings (quoted), quoting and
+booleans (``t`` and ``f``). Other values are written with :func:`str`, which
+can differ from the database's text output, e.g. for timestamps with a time
+zone or floats. Either way, memory stays flat regardless of the size of each
+schema.
+"""
+from sqlalchemy import select, literal, String
+
+from .maintain_schema import maintain_schema
+
+__all__ = ["iter_export", "export"]
+
+_STRING_TYPES = (str, type(u""))
+# the characters of the values that COPY quotes
+_QUOTED = frozenset(',"\r\n')
+
+
+def _export_query(table, schema, tag):
+    # pylint: disable=missing-docstring
+    columns = list(table.c)
+    if tag:
+        columns.insert(0, literal(schema, String).label(tag))
+    return select(columns)
+
+
+def _copy_to(connection, query, sink):
+    """Write the rows of ``query`` as CSV to ``sink`` with ``COPY``, returning
+    the number of rows."""
+    sql = str(query.compile(dialect=connection.dialect,
+                            compile_kwargs={"literal_binds": True}))
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert("COPY ({0}) TO STDOUT WITH CSV".format(sql), sink)
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def _csv_field(value):
+    """Format ``value`` as a CSV field the way ``COPY ... CSV`` does."""
+    if value is None:
+        # unquoted, unlike the empty string
+        return ""
+    if value is True or value is False:
+        return "t" if value else "f"
+    if not isinstance(value, _STRING_TYPES):
+        value = str(value)
+    if not value or value == "\\." or not _QUOTED.isdisjoint(value):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def _write_rows(sink, rows):
+    """Write ``rows`` as CSV lines to ``sink``."""
+    sink.write("".join(",".join(_csv_field(value) for value in row) + "\n"
+                       for row in rows))
+
+
+def _fetch_to(connection, query, sink, chunk_size):
+    """Write the rows of ``query`` as CSV to ``sink`` in chunks of
+    ``chunk_size`` rows, returning the number of rows."""
+    result = connection.execution_options(stream_results=True).execute(query)
+    count = 0
+    try:
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                return count
+            _write_rows(sink, rows)
+            count += len(rows)
+    finally:
+        result.close()
+
+
+def _can_copy(connection):
+    # pylint: disable=missing-docstring
+    return connection.dialect.name == "postgresql" and \
+        connection.dialect.driver == "psycopg2"
+
+
+def iter_export(session, schemas, table, sink, tag=None, header=False,
+                chunk_size=1000):
+    """Write the rows of ``table`` in each of ``schemas`` as CSV to ``sink``,
+    yielding ``(schema, rows)`` after each schema is written.
+
+    ``table`` is unqualified and resolved in each schema by
+    :func:`~sqlalchemy_sqlschema.maintain_schema`.
+
+    :Example:
+
+    >>> with open("orders.csv", "w") as sink:
+    >>>     for schema, rows in iter_export(session, tenants, orders, sink,
+    >>>                                     tag="tenant", header=True):
+    >>>         log.info("exported %d orders of %s", rows, schema)
+
+    :param session: a :class:`~sqlalchemy.orm.session.Session`
+    :param schemas: an iterable of schemas
+    :param table: the :class:`~sqlalchemy.schema.Table` to export
+    :param sink: a text file-like object
+    :param tag: optional column name, the schema of each row is written in a
+        first column if given
+    :param header: :class:`bool`, write a header row first
+    :param chunk_size: :class:`int`, the number of rows fetched at a time if
+        ``COPY`` is not available
+    """
+    if header:
+        names = [column.name for column in table.c]
+        if tag:
+            names.insert(0, tag)
+        _write_rows(sink, [names])
+    for schema in schemas:
+        with maintain_schema(schema, session):
+            connection = session.connection()
+            query = _export_query(table, schema, tag)
+            if _can_copy(connection):
+                rows = _copy_to(connection, query, sink)
+            else:
+                rows = _fetch_to(connection, query, sink, chunk_size)
+        yield schema, rows
+
+
+def export(session, schemas, table, sink, **kwargs):
+    """Write the rows of ``table`` in each of ``schemas`` to ``sink``, see
+    :func:`iter_export`.
+
+    :return: :class:`dict` mapping each schema to its number of rows
+    """
+    return dict(iter_export(session, schemas, table, sink, **kwargs))
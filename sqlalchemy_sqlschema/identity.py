@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Provides an opt-in :class:`~sqlalchemy.orm.session.Session` whose identity map
+is partitioned by SQL schema.
+
+By default, rows with the same primary key loaded in different schemas share
+the same identity key, so that a session entering one
+:func:`~sqlalchemy_sqlschema.maintain_schema` after another returns objects of
+the wrong schema from its identity map. With :class:`SchemaIdentitySession`,
+the schema maintained on the session becomes the identity token of every
+identity key, the same way the horizontal sharding extension uses the shard
+id, so one session can safely serve many schemas.
+
+Requires SQLAlchemy 1.2 or 1.3: :class:`SchemaQuery` overrides private hooks
+of :class:`~sqlalchemy.orm.query.Query` that only exist in these versions.
+"""
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Query, Session
+
+from .maintain_schema import active_schema
+from .util import require_sqlalchemy
+
+require_sqlalchemy(__name__, (1, 2), (1, 4))
+
+__all__ = ["SchemaQuery", "SchemaIdentitySession"]
+
+
+class SchemaQuery(Query):
+    """A :class:`~sqlalchemy.orm.query.Query` that uses the schema maintained
+    on its session as the identity token of the objects it loads and looks up.
+    """
+
+    def _execute_and_instances(self, querycontext):
+        if querycontext.identity_token is None:
+            querycontext.identity_token = active_schema(self.session)
+        return super(SchemaQuery, self)._execute_and_instances(querycontext)
+
+    def _identity_lookup(self, mapper, primary_key_identity,
+                         identity_token=None, **kw):
+        # pylint: disable=arguments-differ
+        if identity_token is None:
+            identity_token = active_schema(self.session)
+        return super(SchemaQuery, self)._identity_lookup(
+            mapper, primary_key_identity, identity_token=identity_token, **kw)
+
+    def _get_impl(self, primary_key_identity, db_load_fn,
+                  identity_token=None):
+        if identity_token is None:
+            identity_token = active_schema(self.session)
+        return super(SchemaQuery, self)._get_impl(
+            primary_key_identity, db_load_fn, identity_token=identity_token)
+
+
+class SchemaIdentitySession(Session):
+    """A :class:`~sqlalchemy.orm.session.Session` that includes the schema
+    maintained by :func:`~sqlalchemy_sqlschema.maintain_schema` in the
+    identity key of its objects, see :class:`SchemaQuery`. Pending objects
+    are keyed by the schema active when they are flushed.
+
+    :Example:
+
+    >>> Session = sessionmaker(bind=engine, class_=SchemaIdentitySession)
+    >>> session = Session()
+    >>> with maintain_schema("tenant1", session):
+    >>>     user1 = session.query(User).get(1)
+    >>> with maintain_schema("tenant2", session):
+    >>>     user2 = session.query(User).get(1)
+    >>> assert user1 is not user2
+    >>> inspect(user2).key
+    (<class 'User'>, (1,), 'tenant2')
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("query_cls", SchemaQuery)
+        super(SchemaIdentitySession, self).__init__(*args, **kwargs)
+
+
+@event.listens_for(SchemaIdentitySession, "before_flush")
+def _set_pending_identity_token(session, flush_context, instances):
+    # pylint: disable=unused-argument, missing-docstring
+    schema = active_schema(session)
+    for instance in session.new:
+        inspect(instance).identity_token = schema
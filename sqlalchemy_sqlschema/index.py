@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Provides :class:`SchemaIndex`, a compact read-only mapping of schemas to their
+routing metadata (e.g. shard names) stored in a binary file that is opened with
+:mod:`mmap`.
+
+Processes opening the same index share its pages through the operating
+system's page cache instead of each loading its own copy, and opening it costs
+no parsing, which suits prefork servers with many workers. The index is
+written with :func:`build_index`, which replaces the file atomically: opened
+indexes keep reading the previous file until they are reopened, see
+:meth:`SchemaIndex.is_stale`.
+
+The file holds a header, a table of fixed-size entries sorted by key, and the
+encoded keys and values they point to. Lookups binary search the table.
+"""
+import mmap
+import os
+import struct
+import tempfile
+
+__all__ = ["SchemaIndex", "build_index"]
+
+_MAGIC = b"SQLSIDX1"
+# magic, number of entries
+_HEADER = struct.Struct("<8sI")
+# key offset, key length, value offset, value length
+_ENTRY = struct.Struct("<IIII")
+
+_replace = getattr(os, "replace", os.rename)
+
+
+def _encode(text):
+    # pylint: disable=missing-docstring
+    return text if isinstance(text, bytes) else text.encode("utf-8")
+
+
+def _umask():
+    """Return the umask of the process."""
+    # the umask can only be read by setting it
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def build_index(path, mapping):
+    """Write the index of ``mapping`` to ``path``, atomically replacing the
+    file if it exists.
+
+    The index is written to a temporary file in the directory of ``path``,
+    flushed to disk and renamed over ``path``, so processes opening ``path``
+    see either the previous or the new index, never a partial one. The file
+    gets the permissions of a file created with :func:`open`.
+
+    :Example:
+
+    >>> build_index("/var/lib/app/tenants.idx", {"tenant1": "eu1",
+    >>>                                          "tenant2": "us1"})
+    >>> SchemaIndex("/var/lib/app/tenants.idx").get("tenant2")
+    'us1'
+
+    :param path: the path of the index file
+    :param mapping: a mapping of schemas to :class:`str` values
+    """
+    items = sorted((_encode(key), _encode(value))
+                   for key, value in mapping.items())
+    entries = []
+    blob = []
+    offset = _HEADER.size + _ENTRY.size * len(items)
+    for key, value in items:
+        entries.append(_ENTRY.pack(offset, len(key),
+                                   offset + len(key), len(value)))
+        blob.append(key)
+        blob.append(value)
+        offset += len(key) + len(value)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        # mkstemp creates the file readable by its owner only, give it the
+        # mode of a file created by open
+        os.chmod(temp_path, 0o666 & ~_umask())
+        with os.fdopen(fd, "wb") as index_file:
+            index_file.write(_HEADER.pack(_MAGIC, len(items)))
+            index_file.write(b"".join(entries))
+            index_file.write(b"".join(blob))
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        _replace(temp_path, path)
+    except:
+        os.unlink(temp_path)
+        raise
+
+
+class SchemaIndex(object):
+    """A read-only mapping of schemas to :class:`str` values, backed by the
+    memory-mapped index file at ``path`` written by :func:`build_index`.
+
+    It can be the mapping of a
+    :class:`~sqlalchemy_sqlschema.directory.TenantDirectory`, see
+    :meth:`~sqlalchemy_sqlschema.directory.TenantDirectory.from_index`.
+
+    :param path: the path of the index file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as index_file:
+            self._stat = os.fstat(index_file.fileno())
+            self._map = mmap.mmap(index_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size:
+            self._map.close()
+            raise ValueError("'{0}' is not a schema index".format(path))
+        magic, self._count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            self._map.close()
+            raise ValueError("'{0}' is not a schema index".format(path))
+        if len(self._map) < _HEADER.size + _ENTRY.size * self._count:
+            self._map.close()
+            raise ValueError("'{0}' is truncated".format(path))
+
+    def __len__(self):
+        return self._count
+
+    def _entry(self, position):
+        # pylint: disable=missing-docstring
+        return _ENTRY.unpack_from(self._map,
+                                  _HEADER.size + _ENTRY.size * position)
+
+    def _find(self, key):
+        """Return the entry of ``key``, or ``None``."""
+        key = _encode(key)
+        index_map = self._map
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._entry(middle)
+            found = index_map[entry[0]:entry[0] + entry[1]]
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                return entry
+        return None
+
+    def get(self, key, default=None):
+        """Return the value of ``key``, or ``default`` if it is missing."""
+        entry = self._find(key)
+        if entry is None:
+            return default
+        return self._map[entry[2]:entry[2] + entry[3]].decode("utf-8")
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __iter__(self):
+        for position in range(self._count):
+            entry = self._entry(position)
+            yield self._map[entry[0]:entry[0] + entry[1]].decode("utf-8")
+
+    def is_stale(self):
+        """Return whether the file at :attr:`path` was replaced since the
+        index was opened."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return (stat.st_ino, stat.st_dev, stat.st_mtime) != \
+            (self._stat.st_ino, self._stat.st_dev, self._stat.st_mtime)
+
+    def close(self):
+        """Unmap the index file."""
+        self._map.close()
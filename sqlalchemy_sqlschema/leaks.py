@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Detects pooled connections returned to the pool while set to a schema other
+than their default one, e.g. when
+:func:`~sqlalchemy_sqlschema.maintain_schema` could not restore the schema
+because the session was waiting for a rollback.
+
+The next user of such a connection either pays for a corrective
+:func:`~sqlalchemy_sqlschema.sql.set_schema` or reads the tables of the wrong
+schema. A :class:`LeakDetector` compares the schema tracked on each connection
+(see :mod:`~sqlalchemy_sqlschema.tracking`) to its default schema when it is
+checked in and out of the pool, counts the leaks, and optionally logs and
+repairs them. Connections whose restore is deferred to their next user (see
+:mod:`~sqlalchemy_sqlschema.deferred`) or until their streaming results are
+closed (see :mod:`~sqlalchemy_sqlschema.streaming`) are not leaks.
+"""
+import logging
+import threading
+from collections import Counter
+
+from sqlalchemy import event
+
+from . import deferred, streaming
+from .sql import get_schema, set_schema
+from .tracking import _ensure_tracked, _remember_schema, _SCHEMA_KEY
+
+__all__ = ["detect_leaks", "LeakDetector"]
+
+LOG = logging.getLogger(__name__)
+
+# the key in the connection info holding the default schema of the connection
+_DEFAULT_KEY = "sqlschema_default_schema"
+
+
+class LeakDetector(object):
+    """Counts, and optionally logs and repairs, the connections of an engine
+    checked in or out of its pool with a non-default schema, see
+    :func:`detect_leaks`."""
+
+    def __init__(self, engine, default_schema=None, log=False, repair=False):
+        self.engine = engine
+        self.default_schema = default_schema
+        self.log = log
+        self.repair = repair
+        #: the number of connections checked in with a non-default schema
+        self.checkin_leaks = 0
+        #: the number of connections checked out with a non-default schema
+        self.checkout_leaks = 0
+        #: the number of connections whose schema was repaired
+        self.repairs = 0
+        #: :class:`~collections.Counter` of the leaks by leaked schema
+        self.by_schema = Counter()
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """Return the leak counts as a :class:`dict`."""
+        with self._lock:
+            return {"checkin_leaks": self.checkin_leaks,
+                    "checkout_leaks": self.checkout_leaks,
+                    "repairs": self.repairs,
+                    "by_schema": dict(self.by_schema)}
+
+    def _execute(self, dbapi_connection, statement):
+        """Execute ``statement`` on the DBAPI connection and commit, returning
+        the first row."""
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(str(statement.compile(dialect=self.engine.dialect)))
+            row = cursor.fetchone() if cursor.description else None
+        finally:
+            cursor.close()
+        dbapi_connection.commit()
+        return row
+
+    def _connect(self, dbapi_connection, connection_record):
+        # pylint: disable=missing-docstring
+        default = self.default_schema
+        if default is None:
+            default = self._execute(dbapi_connection, get_schema())[0]
+        connection_record.info[_DEFAULT_KEY] = default
+        _remember_schema(connection_record.info, default)
+
+    def _check(self, dbapi_connection, connection_record, checkout):
+        """Count, log and repair the schema of the connection if it is not
+        its default one."""
+        info = connection_record.info
+        if deferred._PENDING_KEY in info or streaming._PENDING_KEY in info:
+            # restored by the next user or on checkin
+            return
+        schema = info.get(_SCHEMA_KEY)
+        default = info.get(_DEFAULT_KEY, self.default_schema)
+        if schema is None or default is None or schema == default:
+            return
+        with self._lock:
+            if checkout:
+                self.checkout_leaks += 1
+            else:
+                self.checkin_leaks += 1
+            self.by_schema[schema] += 1
+        if self.log:
+            LOG.warning("Connection %s the pool with schema '%s' instead of "
+                        "'%s'",
+                        "checked out of" if checkout else "returned to",
+                        schema, default)
+        if self.repair:
+            self._execute(dbapi_connection, set_schema(default))
+            _remember_schema(info, default)
+            with self._lock:
+                self.repairs += 1
+
+    def _checkin(self, dbapi_connection, connection_record):
+        # pylint: disable=missing-docstring
+        if dbapi_connection is not None:
+            self._check(dbapi_connection, connection_record, False)
+
+    def _checkout(self, dbapi_connection, connection_record,
+                  connection_proxy):
+        # pylint: disable=unused-argument, missing-docstring
+        self._check(dbapi_connection, connection_record, True)
+
+    def install(self):
+        """Listen to the pool events of the engine."""
+        _ensure_tracked(self.engine)
+        event.listen(self.engine, "connect", self._connect)
+        event.listen(self.engine, "checkin", self._checkin)
+        event.listen(self.engine, "checkout", self._checkout)
+
+    def remove(self):
+        """Stop listening to the pool events of the engine."""
+        event.remove(self.engine, "connect", self._connect)
+        event.remove(self.engine, "checkin", self._checkin)
+        event.remove(self.engine, "checkout", self._checkout)
+
+
+def detect_leaks(engine, default_schema=None, log=False, repair=False):
+    """Detect the connections of ``engine`` checked in or out of the pool with
+    a schema other than their default one.
+
+    Connections opened before this call are not checked, so it should be
+    called at startup.
+
+    :Example:
+
+    >>> detector = detect_leaks(engine, log=True, repair=True)
+    >>> # ... run the application
+    >>> detector.stats()
+    {'checkin_leaks': 3, 'checkout_leaks': 0, 'repairs': 3,
+     'by_schema': {'tenant7': 3}}
+
+    :param engine: an :class:`~sqlalchemy.engine.Engine`
+    :param default_schema: :class:`str`, the default schema of the
+        connections. If ``None``, the schema of each new connection is queried
+        with :func:`~sqlalchemy_sqlschema.sql.get_schema`.
+    :param log: :class:`bool`, log a warning for each leak
+    :param repair: :class:`bool`, set leaking connections back to their
+        default schema
+    :return: the installed :class:`LeakDetector`
+    """
+    detector = LeakDetector(engine, default_schema, log, repair)
+    detector.install()
+    return detector
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Provides the backends of the context-local storage holding the schema stacks.
+
+The backend is either selected explicitly with
+:func:`~sqlalchemy_sqlschema.set_locality_backend`, or detected on first use
+by checking whether gevent or eventlet actually monkey-patched threading.
+Merely having gevent or eventlet installed does not select them.
+"""
+import sys
+import threading
+
+__all__ = ["BACKENDS", "detect_backend", "create_local", "ContextLocal"]
+
+
+def _owner():
+    """Return the running :mod:`asyncio` task, or the current thread outside
+    of tasks."""
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is not None:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            # no running event loop
+            task = None
+        if task is not None:
+            return task
+    return threading.current_thread()
+
+
+def _attributes(local):
+    """Return the attributes of ``local`` in the current context, not to be
+    mutated."""
+    try:
+        owner, attributes = object.__getattribute__(local, "_var").get()
+    except LookupError:
+        return {}
+    # contexts are copied to new tasks and threads, which start afresh
+    return attributes if owner is _owner() else {}
+
+
+class ContextLocal(object):
+    """An object whose attributes are local to the current
+    :mod:`contextvars` context, e.g. to the current :mod:`asyncio` task.
+
+    Setting an attribute copies the attributes of the context, so that a
+    context copied by :func:`contextvars.copy_context` keeps its own. A new
+    task, or a thread running a copied context (e.g. through
+    :meth:`~asyncio.AbstractEventLoop.run_in_executor`), starts without
+    attributes instead of sharing the values, e.g. the schema stacks, of the
+    context it was copied from.
+
+    Requires Python 3.7 or higher.
+    """
+
+    def __init__(self):
+        from contextvars import ContextVar
+        object.__setattr__(self, "_var", ContextVar("sqlschema_local"))
+
+    def __getattribute__(self, name):
+        try:
+            return _attributes(self)[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        attributes = dict(_attributes(self))
+        attributes[name] = value
+        object.__getattribute__(self, "_var").set((_owner(), attributes))
+
+
+def _gevent_local():
+    # pylint: disable=missing-docstring
+    from gevent.local import local
+    return local()
+
+
+def _eventlet_local():
+    # pylint: disable=missing-docstring
+    from eventlet.corolocal import local
+    return local()
+
+
+#: The available backends, mapping their names to a factory of their local
+#: storage objects.
+BACKENDS = {
+    "threading": threading.local,
+    "gevent": _gevent_local,
+    "eventlet": _eventlet_local,
+    "contextvars": ContextLocal,
+}
+
+
+def detect_backend():
+    """Return the name of the backend matching the active monkey-patching:
+    ``"gevent"`` or ``"eventlet"`` if they patched threading, otherwise
+    ``"threading"``.
+
+    Neither gevent nor eventlet is imported if it was not imported already.
+    """
+    gevent_monkey = sys.modules.get("gevent.monkey")
+    if gevent_monkey is not None and \
+            gevent_monkey.is_module_patched("threading"):
+        return "gevent"
+    eventlet_patcher = sys.modules.get("eventlet.patcher")
+    if eventlet_patcher is not None and \
+            eventlet_patcher.is_monkey_patched("thread"):
+        return "eventlet"
+    return "threading"
+
+
+def create_local(backend=None):
+    """Return a new local storage object of ``backend``, or of the detected
+    backend if it is ``None``, see :func:`detect_backend`."""
+    if backend is None:
+        backend = detect_backend()
+    try:
+        factory = BACKENDS[backend]
+    except KeyError:
+        raise ValueError("Unknown locality backend '{0}', expected one of "
+                         "{1}".format(backend, sorted(BACKENDS)))
+    return factory()
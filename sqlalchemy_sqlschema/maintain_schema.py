@@ -2,22 +2,48 @@
 """
 Provides the :func:`maintain_schema` context manager.
 """
+import sys
 from functools import wraps
 from collections import defaultdict
 
 from sqlalchemy import event
-from sqlalchemy.orm import scoped_session
-from six import reraise
-
-try:
-    from gevent.local import local
-except ImportError:
-    from threading import local
+from sqlalchemy.engine import Connection
 
+from .locality import create_local
+from .deferred import deferred_connection, claim, defer
+from .oracle import read_current_schema
 from .sql import set_schema, get_schema
+from .streaming import defer_restore
+from .tracking import tracked_schema, _ensure_tracked
 from .util import Stack
 
-__all__ = ["maintain_schema"]
+__all__ = ["maintain_schema", "active_schema", "set_locality_backend"]
+
+# the key in the session info holding the connection of a sticky context
+# to be closed when the transaction of the session ends
+_UNPINNED_KEY = "sqlschema_unpinned_connection"
+
+
+def _resolve_session(session):
+    """Return the session behind ``session`` if it is a
+    :class:`~sqlalchemy.orm.scoping.scoped_session` proxy, else ``session``.
+
+    :mod:`sqlalchemy.orm` is not imported for this: if it was never imported,
+    ``session`` cannot be a proxy.
+    """
+    scoping = sys.modules.get("sqlalchemy.orm.scoping")
+    if scoping is not None and isinstance(session, scoping.scoped_session):
+        return session()
+    return session
+
+
+def _close_unpinned(session, transaction):
+    """Close the connection left pinned to the transaction of ``session`` by
+    a sticky context, once the transaction ends."""
+    if transaction.parent is None:
+        connection = session.info.pop(_UNPINNED_KEY, None)
+        if connection is not None:
+            connection.close()
 
 
 class SchemaContextManager(object):
@@ -25,16 +51,43 @@ class SchemaContextManager(object):
     :func:`maintain_schema`.
     """
     # pylint: disable=too-few-public-methods
-    def __init__(self, schema, session):
+    def __init__(self, schema, session, directory=None, sticky=False):
         self.schema = schema
         self.session = session
-        self.new_tx_listener = self._create_new_tx_listener(schema)
+        self.directory = directory
+        self.sticky = sticky
+        self.new_tx_listener = self._create_new_tx_listener(schema, sticky)
         # stores the schema to be restored on context manager exit
         self.prev_schema = None
         # stores the listener to be reinstated on context manager exit
         self.prev_listener = None
+        # stores the bind to be restored on context manager exit, if the
+        # directory routed the session to another bind
+        self.prev_bind = None
+        self.rerouted = False
+        # the depth of the schema stack when the session was rerouted, the
+        # entries from it on belong to the new bind
+        self.routed_depth = None
+        # stores the bind replaced by the pinned connection of a sticky
+        # context, restored on context manager exit
+        self.unpinned_bind = None
+        self.pinned = None
+        # the profiler that sampled the entry, which times the exit as well
+        self.sampled_by = None
+
+    #: A :class:`~sqlalchemy_sqlschema.profiling.SchemaProfiler` that samples
+    #: entries of the context manager, see
+    #: :func:`~sqlalchemy_sqlschema.profiling.enable_profiling`.
+    profiler = None
 
-    _local = local()
+    #: A :class:`~sqlalchemy_sqlschema.telemetry.SchemaUsageTracker` that
+    #: records the usage of each schema, see
+    #: :func:`~sqlalchemy_sqlschema.telemetry.enable_usage_tracking`.
+    tracker = None
+
+    # the context-local storage of the schema stacks, created on first use
+    # unless set by set_locality_backend
+    _local = None
 
     @classmethod
     def _get_schema_stack(cls, session):
@@ -43,20 +96,30 @@ class SchemaContextManager(object):
 
         We need to use a thread-local variable to store the previous active
         schema if we want to support nesting the context manager."""
-        if not hasattr(cls._local, "schema_stacks"):
-            cls._local.schema_stacks = defaultdict(Stack)
+        local = cls._local
+        if local is None:
+            local = cls._local = create_local()
+        try:
+            schema_stacks = local.schema_stacks
+        except AttributeError:
+            schema_stacks = local.schema_stacks = defaultdict(Stack)
         # make sure to get the session object, not the scoped_session proxy
-        session = session() if isinstance(session, scoped_session) else session
+        session = _resolve_session(session)
         # map a stack to the session
-        return cls._local.schema_stacks[session]
+        return schema_stacks[session]
 
     @staticmethod
-    def _create_new_tx_listener(schema):
+    def _create_new_tx_listener(schema, sticky=False):
         """Create and return a function to be used with the "after_begin" SQL
         Alchemy event that will set the schema to ``schema``.
+
+        If ``sticky``, the schema is not set when it is already the tracked
+        schema of the connection, see :mod:`~sqlalchemy_sqlschema.tracking`.
         """
         def set_schema_listener(session, transaction, connection):
             # pylint: disable=unused-argument, missing-docstring
+            if sticky and tracked_schema(connection) == schema:
+                return
             session.execute(set_schema(schema))
         return set_schema_listener
 
@@ -70,45 +133,227 @@ class SchemaContextManager(object):
         # pylint: disable=missing-docstring
         event.listen(session, "after_begin", new_tx_listener)
 
+    def _execute_get_schema(self):
+        """Return the active SQL schema as reported by the database, or by
+        the driver if it keeps it."""
+        schema = read_current_schema(self.session)
+        if schema is None:
+            schema = self.session.execute(get_schema()).scalar()
+        return schema
+
+    def _execute_set_schema(self, schema):
+        """Set the active SQL schema to ``schema``."""
+        self.session.execute(set_schema(schema))
+
+    def _defer_to_next_user(self):
+        """Leave the restore of the outermost context to the next user of
+        the connection if its engine defers restores, returning ``True`` if
+        so, see :mod:`~sqlalchemy_sqlschema.deferred`."""
+        if self.prev_listener is not None:
+            return False
+        connection = deferred_connection(self.session)
+        if connection is None:
+            return False
+        defer(connection, self.prev_schema)
+        return True
+
     def __enter__(self):
+        if self.tracker is not None:
+            self.tracker.entered(self)
+        if self.profiler is not None:
+            return self.profiler.profile_enter(self)
+        return self._enter()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.tracker is not None:
+            self.tracker.exited(self)
+        # the profiler of the entry, even if profiling was disabled since
+        if self.sampled_by is not None:
+            return self.sampled_by.profile_exit(self, exc_type, exc_val,
+                                                exc_tb)
+        return self._exit(exc_type, exc_val, exc_tb)
+
+    def _route(self, schema_stack):
+        """Bind the session to the engine of the schema in the directory.
+
+        If the bind changes, the schema stack continues from the schema found
+        on the new bind, and the listener of the previous bind is suppressed
+        until :meth:`_unroute`."""
+        bind = self.directory.get_bind(self.schema)
+        session = _resolve_session(self.session)
+        self.prev_bind = session.bind
+        self.rerouted = bind is not self.prev_bind
+        if not self.rerouted:
+            return
+        top = schema_stack.top
+        if top is not None and top[1]:
+            self._cancel_listener(top[1], self.session)
+        session.bind = bind
+        self.routed_depth = len(schema_stack)
+
+    def _unroute(self, schema_stack):
+        """Restore the bind replaced by :meth:`_route`."""
+        if not self.rerouted:
+            return
+        # the schema found on the new bind, if it was pushed
+        del schema_stack[self.routed_depth:]
+        _resolve_session(self.session).bind = self.prev_bind
+        top = schema_stack.top
+        if top is not None and top[1]:
+            self._enable_listener(top[1], self.session)
+
+    def _pin(self):
+        """Bind the session to a connection of its engine, so that all the
+        transactions within the context use the same connection.
+
+        Nothing is done if the session is already bound to a connection, e.g.
+        by an outer sticky context."""
+        session = _resolve_session(self.session)
+        if isinstance(session.bind, Connection):
+            return
+        transaction = session.transaction
+        if transaction is not None and transaction._connections:
+            raise ValueError("A sticky maintain_schema needs to be entered "
+                             "before the session acquires a connection")
+        engine = session.get_bind()
+        _ensure_tracked(engine)
+        self.unpinned_bind = session.bind
+        self.pinned = session.bind = engine.connect()
+
+    def _unpin(self):
+        """Restore the bind replaced by :meth:`_pin` and close the pinned
+        connection, or let the session close it when its transaction ends."""
+        session = _resolve_session(self.session)
+        connection, self.pinned = self.pinned, None
+        try:
+            if not connection.in_transaction():
+                connection.close()
+                return
+            # the session keeps using the connection until the transaction
+            # ends
+            session.info[_UNPINNED_KEY] = connection
+            if not event.contains(session, "after_transaction_end",
+                                  _close_unpinned):
+                event.listen(session, "after_transaction_end",
+                             _close_unpinned)
+        finally:
+            session.bind = self.unpinned_bind
+
+    def _restore_binds(self, schema_stack):
+        """Undo :meth:`_pin` and :meth:`_route`."""
+        try:
+            if self.pinned is not None:
+                self._unpin()
+        finally:
+            if self.directory is not None:
+                self._unroute(schema_stack)
+
+    def _enter(self):
+        # pylint: disable=missing-docstring
         schema_stack = self._get_schema_stack(self.session)
-        if schema_stack.top is None:
-            schema_stack.push(
-                (self.session.execute(get_schema()).scalar(), None))
-        # 1. get the prev_schema
-        self.prev_schema, self.prev_listener = schema_stack.top
-        # 2. supress previous listeners (will be reinstated in the __exit__)
-        if self.prev_listener:
-            self._cancel_listener(self.prev_listener, self.session)
-
-        # 3. set the new schema
-        self.session.execute(set_schema(self.schema))
+        if self.directory is not None:
+            self._route(schema_stack)
+        try:
+            if self.sticky:
+                self._pin()
+            # take over a connection whose restore was deferred by its last
+            # user
+            connection = deferred_connection(self.session)
+            pending = claim(connection) if connection is not None else None
+            if self.rerouted or schema_stack.top is None:
+                schema_stack.push(
+                    (pending or self._execute_get_schema(), None))
+            # 1. get the prev_schema
+            self.prev_schema, self.prev_listener = schema_stack.top
+            # 2. supress previous listeners (will be reinstated in the
+            # __exit__)
+            if self.prev_listener:
+                self._cancel_listener(self.prev_listener, self.session)
+            try:
+                # 3. set the new schema, unless a deferred restore left it set
+                if connection is None or \
+                        tracked_schema(connection) != self.schema:
+                    self._execute_set_schema(self.schema)
+            except:
+                if self.prev_listener:
+                    self._enable_listener(self.prev_listener, self.session)
+                raise
+        except:
+            # the context is not entered, undo the binds
+            self._restore_binds(schema_stack)
+            raise
         # 4. set a new listener for it
         self._enable_listener(self.new_tx_listener, self.session)
         # 5. push it to the stack
         schema_stack.push((self.schema, self.new_tx_listener))
         return self
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
+    def _exit(self, exc_type, exc_val, exc_tb):
+        # pylint: disable=missing-docstring
         schema_stack = self._get_schema_stack(self.session)
         # 1. remove schema from the stack
         schema_stack.pop()
         # 2. stop the current listener
         self._cancel_listener(self.new_tx_listener, self.session)
-        # 3. set the previous schema
-        if self.session.is_active:
-            # if not active, then we are in a partial rollback state waiting
-            # for rollback, in which case execute will fail
-            try:
-                self.session.execute(set_schema(self.prev_schema))
-            except:
-                if exc_type:
-                    # don't swallow the exception being raised
-                    reraise(exc_type, exc_val, exc_tb)
-                raise
-        # 4. bring back the previous listener
-        if self.prev_listener:
-            self._enable_listener(self.prev_listener, self.session)
+        try:
+            # 3. set the previous schema
+            if self.session.is_active:
+                # if not active, then we are in a partial rollback state
+                # waiting for rollback, in which case execute will fail
+                try:
+                    # the restore waits for open streaming results, if
+                    # tracked, and the outermost restore is left to the next
+                    # user, if deferred
+                    if not (defer_restore(self.session, self.prev_schema) or
+                            self._defer_to_next_user()):
+                        self._execute_set_schema(self.prev_schema)
+                except:
+                    if exc_type:
+                        # don't swallow the exception being raised, it
+                        # propagates once we return
+                        return False
+                    raise
+        finally:
+            # 4. bring back the previous listener
+            if self.prev_listener:
+                self._enable_listener(self.prev_listener, self.session)
+            # 5. bring back the previous bind
+            self._restore_binds(schema_stack)
+
+    def switch(self, schema):
+        """Switch the entered context to ``schema``, setting it directly
+        instead of restoring the previous schema in between as exiting and
+        entering another context would. The previous schema is restored once,
+        when the context exits.
+
+        :param schema: :class:`str`, the new SQL schema
+        :raises ValueError: if the context is not the innermost one on its
+            session, or if its directory routes ``schema`` to another bind
+        """
+        schema_stack = self._get_schema_stack(self.session)
+        top = schema_stack.top
+        if top is None or top[1] is not self.new_tx_listener:
+            raise ValueError("Only the innermost entered maintain_schema can "
+                             "switch schemas")
+        if self.directory is not None and \
+                self.directory.get_bind(schema) is not \
+                _resolve_session(self.session).bind:
+            raise ValueError("Cannot switch to schema '{0}' on another "
+                             "bind".format(schema))
+        if schema == self.schema:
+            return
+        self._execute_set_schema(schema)
+        if self.tracker is not None:
+            self.tracker.exited(self)
+        self._cancel_listener(self.new_tx_listener, self.session)
+        self.schema = schema
+        self.new_tx_listener = self._create_new_tx_listener(schema,
+                                                            self.sticky)
+        self._enable_listener(self.new_tx_listener, self.session)
+        schema_stack.pop()
+        schema_stack.push((schema, self.new_tx_listener))
+        if self.tracker is not None:
+            self.tracker.entered(self)
 
     def __call__(self, f):
         # pylint: disable=invalid-name, missing-docstring
@@ -119,7 +364,7 @@ class SchemaContextManager(object):
         return decorated
 
 
-def maintain_schema(schema, session):
+def maintain_schema(schema, session, directory=None, sticky=False):
     """Context manager/decorator that will apply the SQL schema ``schema`` using
     the ``session``. The ``schema`` will persist across different transactions,
     if these happen within the context manager's body.
@@ -130,6 +375,10 @@ def maintain_schema(schema, session):
     The context manager can also be nested. Exiting the nested context manager
     will restore the SQL schema set by the outer context manager.
 
+    The innermost entered context manager can switch to another schema with
+    its :meth:`~SchemaContextManager.switch` method, which sets the schema
+    directly instead of restoring the previous one in between.
+
     :Example:
 
     >>> assert session.execute('SHOW search_path').scalar() == 'public'
@@ -144,5 +393,45 @@ def maintain_schema(schema, session):
     :param schema: :class:`str` to be set as the SQL schema
     :param session: a :class:`~sqlalchemy.orm.session.Session` which will be
         used to set the SQL schema
+    :param directory: optional
+        :class:`~sqlalchemy_sqlschema.directory.TenantDirectory`, binding the
+        session to the engine of ``schema`` for the duration of the context
+    :param sticky: :class:`bool`, bind the session to a single connection
+        until the outermost sticky context exits, so that the schema is set
+        once per context instead of once per transaction. It needs to be
+        entered before the session acquires a connection.
+    """
+    return SchemaContextManager(schema, session, directory, sticky)
+
+
+def active_schema(session):
+    """Return the SQL schema that the innermost :func:`maintain_schema` has
+    applied on ``session``, or ``None`` if no schema is maintained.
+
+    No SQL is executed, the schema is looked up in the schema stack of the
+    ``session``.
+
+    :param session: a :class:`~sqlalchemy.orm.session.Session`
+    """
+    top = SchemaContextManager._get_schema_stack(session).top
+    # the bottom of the stack holds the schema found on entry and no listener
+    if top is None or top[1] is None:
+        return None
+    return top[0]
+
+
+def set_locality_backend(backend=None):
+    """Select the backend storing the schema stacks, which needs to match the
+    concurrency model of the application: ``"threading"``, ``"gevent"``,
+    ``"eventlet"`` or ``"contextvars"``.
+
+    If not called, or if ``backend`` is ``None``, the backend is detected on
+    first use: gevent or eventlet if they monkey-patched threading, otherwise
+    threading.
+
+    Schemas maintained when the backend is changed are forgotten, so this
+    should be called at startup.
+
+    :param backend: :class:`str`, the name of the backend
     """
-    return SchemaContextManager(schema, session)
+    SchemaContextManager._local = create_local(backend)
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a runner that migrates many schemas in parallel, each one through
+:func:`~sqlalchemy_sqlschema.maintain_schema`.
+
+Schemas are migrated on a bounded pool of processes. Every finished schema is
+appended to a checkpoint file, so an interrupted run can be resumed without
+migrating the completed schemas again.
+
+Also provides :func:`migration_status`, which reads the revision of many
+schemas with a few schema-qualified queries instead of entering every schema.
+"""
+import json
+import multiprocessing
+import os
+from timeit import default_timer as timer
+
+from sqlalchemy import (MetaData, String, create_engine, inspect, literal,
+                        pool, select)
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import column, table, union_all
+
+from .maintain_schema import maintain_schema
+from .reflection import alembic_version_table
+
+__all__ = ["MigrationRunner", "AlembicUpgrade", "Checkpoint",
+           "MigrationReport", "migration_status", "iter_migration_status"]
+
+# the dialects of the databases with an information_schema.tables view
+_INFORMATION_SCHEMA_DIALECTS = ("postgresql", "mysql", "mssql")
+_INFORMATION_SCHEMA_TABLES = table("tables", column("table_schema"),
+                                   column("table_name"))
+_INFORMATION_SCHEMA_TABLES.schema = "information_schema"
+
+
+class AlembicUpgrade(object):
+    """An upgrade function for :class:`MigrationRunner` that runs
+    ``alembic upgrade <revision>``.
+
+    The connection, on which the schema is already applied, is passed to
+    Alembic through ``config.attributes["connection"]`` and the schema name
+    through ``config.attributes["schema"]``. The ``env.py`` of the Alembic
+    environment needs to use that connection, as in
+    `sharing a connection with a series of migration commands
+    <http://alembic.zzzcomputing.com/en/latest/cookbook.html#sharing-a-connection-with-a-series-of-migration-commands-and-environments>`_.
+
+    Requires `Alembic <https://pypi.python.org/pypi/alembic>`_.
+
+    :param config_path: :class:`str`, the path to ``alembic.ini``
+    :param revision: :class:`str`, the revision to upgrade to
+    """
+
+    def __init__(self, config_path, revision="head"):
+        self.config_path = config_path
+        self.revision = revision
+
+    def __call__(self, connection, schema):
+        # pylint: disable=missing-docstring
+        from alembic import command
+        from alembic.config import Config
+
+        config = Config(self.config_path)
+        config.attributes["connection"] = connection
+        config.attributes["schema"] = schema
+        command.upgrade(config, self.revision)
+
+
+class Checkpoint(object):
+    """An append-only file recording the outcome of each migrated schema, one
+    JSON object per line.
+
+    :param path: :class:`str`, the path to the checkpoint file
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def completed(self):
+        """Return the :class:`set` of schemas that were migrated
+        successfully."""
+        completed = set()
+        if not os.path.isfile(self.path):
+            return completed
+        with open(self.path) as checkpoint:
+            for line in checkpoint:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a line left incomplete by an interrupted run
+                    continue
+                if record["ok"]:
+                    completed.add(record["schema"])
+                else:
+                    completed.discard(record["schema"])
+        return completed
+
+    def record(self, schema, ok, error=None):
+        """Append the outcome of migrating ``schema``."""
+        line = json.dumps(
+            {"schema": schema, "ok": ok, "error": error}).encode("utf-8")
+        with open(self.path, "ab+") as checkpoint:
+            checkpoint.seek(0, os.SEEK_END)
+            if checkpoint.tell():
+                # terminate a line left incomplete by an interrupted run
+                checkpoint.seek(-1, os.SEEK_END)
+                if checkpoint.read(1) != b"\n":
+                    line = b"\n" + line
+            checkpoint.write(line + b"\n")
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+
+
+class MigrationReport(object):
+    """The outcome of :meth:`MigrationRunner.run`."""
+
+    def __init__(self):
+        #: list of successfully migrated schemas
+        self.migrated = []
+        #: :class:`dict` mapping failed schemas to their error
+        self.failed = {}
+        #: list of schemas skipped as already completed by a previous run
+        self.skipped = []
+        #: wall clock seconds spent migrating
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self):
+        """Migrated and failed schemas per second."""
+        if not self.elapsed:
+            return 0.0
+        return (len(self.migrated) + len(self.failed)) / self.elapsed
+
+    def __repr__(self):
+        return ("<MigrationReport migrated={0} failed={1} skipped={2} "
+                "elapsed={3:.1f}s throughput={4:.1f}/s>").format(
+                    len(self.migrated), len(self.failed), len(self.skipped),
+                    self.elapsed, self.throughput)
+
+
+# the engine of a worker process, see _init_worker
+_engine = None
+
+
+def _init_worker(url):
+    # pylint: disable=global-statement, missing-docstring
+    global _engine
+    _engine = create_engine(url, poolclass=pool.NullPool)
+
+
+def _migrate(args):
+    """Run ``upgrade`` for ``schema`` in its own transaction and return the
+    outcome as a ``(schema, ok, error)`` tuple."""
+    schema, upgrade = args
+    session = Session(bind=_engine)
+    try:
+        with maintain_schema(schema, session):
+            upgrade(session.connection(), schema)
+            session.commit()
+    except Exception as exc:  # pylint: disable=broad-except
+        return schema, False, "{0}: {1}".format(type(exc).__name__, exc)
+    finally:
+        session.close()
+    return schema, True, None
+
+
+class MigrationRunner(object):
+    """Migrate many schemas on a bounded pool of processes.
+
+    :Example:
+
+    >>> runner = MigrationRunner(
+    >>>     "postgresql://localhost/app", AlembicUpgrade("alembic.ini"),
+    >>>     checkpoint="migrate.checkpoint", processes=8)
+    >>> report = runner.run(tenant_schemas)
+    >>> report.failed
+    {}
+
+    :param url: :class:`str`, the database URL each worker connects to
+    :param upgrade: a picklable callable accepting a
+        :class:`~sqlalchemy.engine.Connection` and a schema name, that
+        migrates the schema, e.g. :class:`AlembicUpgrade`
+    :param checkpoint: optional :class:`str` path to a :class:`Checkpoint`
+        file. Schemas it lists as completed are skipped.
+    :param processes: :class:`int`, the size of the process pool. If ``0``,
+        schemas are migrated serially in the current process.
+    :param on_result: optional callable invoked in the current process with
+        ``(schema, ok, error)`` as soon as a schema is done
+    """
+
+    def __init__(self, url, upgrade, checkpoint=None, processes=4,
+                 on_result=None):
+        self.url = url
+        self.upgrade = upgrade
+        self.checkpoint = Checkpoint(checkpoint) if checkpoint else None
+        self.processes = processes
+        self.on_result = on_result
+
+    def run(self, schemas):
+        """Migrate ``schemas`` and return a :class:`MigrationReport`."""
+        report = MigrationReport()
+        completed = self.checkpoint.completed() if self.checkpoint else set()
+        pending = []
+        for schema in schemas:
+            if schema in completed:
+                report.skipped.append(schema)
+            else:
+                pending.append(schema)
+
+        start = timer()
+        for schema, ok, error in self._results(pending):
+            if self.checkpoint:
+                self.checkpoint.record(schema, ok, error)
+            if ok:
+                report.migrated.append(schema)
+            else:
+                report.failed[schema] = error
+            if self.on_result:
+                self.on_result(schema, ok, error)
+        report.elapsed = timer() - start
+        return report
+
+    def _results(self, schemas):
+        """Yield the outcome of migrating each of ``schemas``."""
+        tasks = [(schema, self.upgrade) for schema in schemas]
+        if not self.processes:
+            _init_worker(self.url)
+            for task in tasks:
+                yield _migrate(task)
+            return
+        workers = multiprocessing.Pool(
+            self.processes, initializer=_init_worker, initargs=(self.url,))
+        try:
+            for result in workers.imap_unordered(_migrate, tasks):
+                yield result
+            workers.close()
+        except:
+            workers.terminate()
+            raise
+        finally:
+            workers.join()
+
+
+def iter_migration_status(connection, schemas, chunk_size=500):
+    """Yield a ``(schema, revision)`` tuple for every row of the
+    ``alembic_version`` table of each of ``schemas``.
+
+    Each chunk of ``chunk_size`` schemas is read with a single
+    ``UNION ALL`` query over their schema-qualified ``alembic_version`` tables,
+    and rows are yielded as each chunk arrives, so very large numbers of
+    schemas can be streamed. The schemas of the chunk having an
+    ``alembic_version`` table are looked up first, in
+    ``information_schema.tables`` with one query per chunk where the database
+    has it, otherwise with the inspector. A schema without an
+    ``alembic_version`` table, or that does not exist, yields
+    ``(schema, None)``, and a schema without a revision yields nothing.
+
+    :param connection: a :class:`~sqlalchemy.engine.Connection` or a
+        :class:`~sqlalchemy.orm.session.Session`
+    :param schemas: an iterable of :class:`str` schema names
+    :param chunk_size: :class:`int`, the number of schemas per query
+    """
+    if isinstance(connection, Session):
+        connection = connection.connection()
+    chunk = []
+    for schema in schemas:
+        chunk.append(schema)
+        if len(chunk) == chunk_size:
+            for row in _status_of_chunk(connection, chunk):
+                yield row
+            chunk = []
+    if chunk:
+        for row in _status_of_chunk(connection, chunk):
+            yield row
+
+
+def _versioned_schemas(connection, schemas):
+    """Return the set of ``schemas`` having an ``alembic_version`` table."""
+    if connection.dialect.name in _INFORMATION_SCHEMA_DIALECTS:
+        tables = _INFORMATION_SCHEMA_TABLES
+        query = select([tables.c.table_schema]).where(
+            (tables.c.table_name == "alembic_version") &
+            tables.c.table_schema.in_(schemas))
+        return set(row[0] for row in connection.execute(query))
+    inspector = inspect(connection)
+    existing = set(inspector.get_schema_names())
+    return set(schema for schema in schemas if schema in existing and
+               "alembic_version" in inspector.get_table_names(schema))
+
+
+def _status_of_chunk(connection, schemas):
+    # pylint: disable=missing-docstring
+    versioned = _versioned_schemas(connection, schemas)
+    metadata = MetaData()
+    selects = []
+    for schema in schemas:
+        if schema not in versioned:
+            yield schema, None
+            continue
+        version = alembic_version_table(schema, metadata)
+        selects.append(select([literal(schema, String).label("schema"),
+                               version.c.version_num]))
+    if not selects:
+        return
+    for row in connection.execute(union_all(*selects)):
+        yield row[0], row[1]
+
+
+def migration_status(connection, schemas, chunk_size=500):
+    """Return a :class:`dict` mapping each of ``schemas`` to its Alembic
+    revision, see :func:`iter_migration_status`.
+
+    A schema with multiple heads maps to a sorted :class:`tuple` of its
+    revisions, and a schema without an ``alembic_version`` table maps to
+    ``None``.
+
+    :Example:
+
+    >>> migration_status(session, ["tenant1", "tenant2", "tenant3"])
+    {'tenant1': '1975ea83b712', 'tenant2': 'ae1027a6acf', 'tenant3': None}
+    """
+    status = {}
+    for schema, revision in iter_migration_status(
+            connection, schemas, chunk_size):
+        if revision is not None and schema in status:
+            previous = status[schema]
+            if not isinstance(previous, tuple):
+                previous = (previous,)
+            revision = tuple(sorted(previous + (revision,)))
+        status[schema] = revision
+    return status
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Provides the ``sqlschema`` execution option, which runs a single statement or
+query in a schema without entering
+:func:`~sqlalchemy_sqlschema.maintain_schema`.
+
+The option renders the unqualified tables of the statement qualified with the
+schema, through SQL Alchemy's ``schema_translate_map``. No SQL is executed to
+switch schemas and the session is left untouched. The schema is part of the
+key of the compiled cache, so cached statements are not shared between
+schemas.
+
+The option is accepted wherever execution options are, e.g. by
+:meth:`~sqlalchemy.engine.Connection.execution_options`,
+:meth:`~sqlalchemy.orm.query.Query.execution_options` and
+:meth:`~sqlalchemy.sql.expression.Executable.execution_options` of
+statements, where it takes precedence over a connection's. Like
+``schema_translate_map``, which it sets, the option replaces the schema
+translate map of the connection. Objects loaded by a
+query in another schema are added to the identity map of the session like any
+other, see :mod:`sqlalchemy_sqlschema.identity` for keeping the objects of
+different schemas apart. Textual SQL is not affected.
+
+Requires SQLAlchemy 1.1 to 1.3.
+"""
+import weakref
+
+from sqlalchemy import event
+
+from .util import require_sqlalchemy
+
+require_sqlalchemy(__name__, (1, 1), (1, 4))
+
+__all__ = ["enable_schema_option"]
+
+#: The name of the execution option.
+OPTION = "sqlschema"
+
+# statement -> its _TranslatedStatement, one per statement as the options of
+# statements are immutable, dropped with the statement
+_translations = weakref.WeakKeyDictionary()
+
+
+def _translate_map(schema):
+    # pylint: disable=missing-docstring
+    return {"schema_translate_map": {None: schema}}
+
+
+def _set_connection_execution_options(conn, opts):
+    # pylint: disable=missing-docstring
+    if OPTION in opts:
+        conn.dialect.set_connection_execution_options(
+            conn, _translate_map(opts[OPTION]))
+
+
+def _set_engine_execution_options(engine, opts):
+    # pylint: disable=missing-docstring
+    if OPTION in opts:
+        engine.dialect.set_engine_execution_options(
+            engine, _translate_map(opts[OPTION]))
+
+
+class _TranslatedStatement(object):
+    """Stands for a statement in its execution, compiling it with unqualified
+    tables translated to ``schema``.
+
+    The same instance is used for each statement and schema, as it is the key
+    of the statement in compiled caches.
+    """
+
+    __slots__ = ("statement", "schema", "__weakref__")
+
+    def __init__(self, statement, schema):
+        # weak, the statement is the key of the instance in _translations
+        self.statement = weakref.ref(statement)
+        self.schema = schema
+
+    def compile(self, **kw):
+        # pylint: disable=missing-docstring
+        kw.update(_translate_map(self.schema))
+        return self.statement().compile(**kw)
+
+
+def _translated(statement, schema):
+    """Return the :class:`_TranslatedStatement` of ``statement`` and
+    ``schema``."""
+    translated = _translations.get(statement)
+    if translated is None or translated.schema != schema:
+        translated = _TranslatedStatement(statement, schema)
+        _translations[statement] = translated
+    return translated
+
+
+def _before_execute(conn, clauseelement, multiparams, params):
+    # pylint: disable=unused-argument, missing-docstring, protected-access
+    # the options of statements are only read once they are compiled
+    options = getattr(clauseelement, "_execution_options", None)
+    if options and OPTION in options:
+        clauseelement = _translated(clauseelement, options[OPTION])
+    return clauseelement, multiparams, params
+
+
+def enable_schema_option(engine):
+    """Honour the ``sqlschema`` execution option on ``engine``.
+
+    :Example:
+
+    >>> enable_schema_option(engine)
+    >>> session.query(Order).execution_options(sqlschema="tenant7").all()
+    >>> session.execute(
+    >>>     orders.select().execution_options(sqlschema="tenant7"))
+    >>> with engine.connect() as conn:
+    >>>     conn.execution_options(sqlschema="tenant7").execute(
+    >>>         orders.select())
+
+    :param engine: an :class:`~sqlalchemy.engine.Engine`, or the
+        :class:`~sqlalchemy.engine.Engine` class for all engines
+    """
+    for identifier, listener in (
+            ("set_connection_execution_options",
+             _set_connection_execution_options),
+            ("set_engine_execution_options", _set_engine_execution_options)):
+        if not event.contains(engine, identifier, listener):
+            event.listen(engine, identifier, listener)
+    if not event.contains(engine, "before_execute", _before_execute):
+        event.listen(engine, "before_execute", _before_execute, retval=True)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Sets and gets the Oracle schema through the ``current_schema`` attribute of
+cx_Oracle and python-oracledb connections.
+
+By default, :func:`~sqlalchemy_sqlschema.sql.set_schema` executes
+``ALTER SESSION SET CURRENT_SCHEMA`` and
+:func:`~sqlalchemy_sqlschema.sql.get_schema` queries ``dual``, each a round
+trip. Once :func:`use_current_schema_attribute` is called for an engine, the
+schema is set by assigning the attribute, which the driver sends along with
+the next call, and read from the attribute without a query if it was set.
+
+Schema changes executed as SQL (e.g. ``ALTER SESSION``) are not reflected in
+the attribute, so they should not be mixed with this mode.
+"""
+from sqlalchemy import event
+
+from .sql import SetSchema
+
+__all__ = ["use_current_schema_attribute", "read_current_schema"]
+
+# the dialect attribute marking the engines using current_schema
+_ENABLED_KEY = "sqlschema_current_schema_attribute"
+
+# whether any engine uses current_schema, so other applications skip the
+# connection lookup in read_current_schema
+_enabled = False
+
+
+def _do_execute(cursor, statement, parameters, context):
+    # pylint: disable=unused-argument, missing-docstring
+    # the context is None for the statements of the dialect initialization
+    compiled = context.compiled if context is not None else None
+    if compiled is None or not isinstance(compiled.statement, SetSchema):
+        return False
+    cursor.connection.current_schema = compiled.statement.schema
+    # the statement is handled, no execution
+    return True
+
+
+def use_current_schema_attribute(engine):
+    """Set and get the schema of the connections of ``engine`` through their
+    ``current_schema`` attribute instead of SQL statements.
+
+    :param engine: an :class:`~sqlalchemy.engine.Engine` whose driver
+        connections have a ``current_schema`` attribute
+    """
+    # pylint: disable=global-statement
+    global _enabled
+    if not event.contains(engine, "do_execute", _do_execute):
+        event.listen(engine, "do_execute", _do_execute)
+    setattr(engine.dialect, _ENABLED_KEY, True)
+    _enabled = True
+
+
+def read_current_schema(session):
+    """Return the ``current_schema`` attribute of the connection of
+    ``session`` if its engine uses it, or ``None`` if it is not used or not
+    set, in which case the schema needs to be queried.
+
+    :param session: a :class:`~sqlalchemy.orm.session.Session`
+    """
+    if not _enabled:
+        return None
+    connection = session.connection()
+    if not getattr(connection.dialect, _ENABLED_KEY, False):
+        return None
+    return connection.connection.current_schema or None
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Provides an opt-in sampling profiler for the enter/exit path of
+:func:`~sqlalchemy_sqlschema.maintain_schema`.
+
+When profiling is enabled, 1 in ``sample_every`` context manager entries (and
+their matching exits) is timed. The time is split between the Python-side
+overhead of the library (schema stack handling, event registry changes, clause
+construction and compilation) and the time spent waiting on the database
+cursor. Durations are collected into histograms that can be dumped on demand.
+
+When profiling is disabled, the hot path only pays for a single attribute
+check.
+"""
+import itertools
+import threading
+from collections import defaultdict
+from timeit import default_timer as timer
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .maintain_schema import SchemaContextManager
+
+__all__ = ["enable_profiling", "disable_profiling", "SchemaProfiler",
+           "Histogram"]
+
+# methods of SchemaContextManager that are timed on sampled instances, mapped
+# to the phase their duration is accounted to
+_PHASES = {
+    "_get_schema_stack": "stack",
+    "_cancel_listener": "events",
+    "_enable_listener": "events",
+    "_execute_get_schema": "sql",
+    "_execute_set_schema": "sql",
+}
+
+
+class Histogram(object):
+    """A histogram of durations with power-of-two microsecond buckets.
+
+    Bucket ``i`` counts the durations in the ``[2**(i-1), 2**i)`` microseconds
+    range, bucket ``0`` counts durations below one microsecond.
+    """
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        """Record a duration of ``seconds``."""
+        seconds = max(seconds, 0.0)
+        self.buckets[int(seconds * 1e6).bit_length()] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self):
+        """The mean duration in seconds, or 0 if empty."""
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        """Return the upper bound in seconds of the bucket containing the
+        ``percent`` percentile."""
+        if not self.count:
+            return 0.0
+        threshold = self.count * percent / 100.0
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= threshold:
+                return min((1 << bucket) / 1e6, self.max)
+        return self.max
+
+    def to_dict(self):
+        """Return the summary and the buckets as a :class:`dict`."""
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "buckets": dict(self.buckets),
+        }
+
+
+class SchemaProfiler(object):
+    """Samples 1 in ``sample_every`` :class:`SchemaContextManager` entries and
+    collects their timings into :class:`Histogram` objects.
+
+    Each sampled ``enter`` and ``exit`` records the following, in seconds:
+
+    - ``total``: the whole duration
+    - ``stack``: handling the thread-local schema stack
+    - ``events``: adding and removing the "after_begin" listeners
+    - ``compile``: clause construction, compilation and SQL Alchemy execution
+      overhead
+    - ``db``: time spent in the DBAPI cursor execution
+    - ``python``: ``total`` minus ``db``
+    """
+
+    def __init__(self, sample_every=100):
+        if sample_every < 1:
+            raise ValueError("sample_every must be a positive integer")
+        self.sample_every = sample_every
+        self._counter = itertools.count()
+        self._histograms = defaultdict(Histogram)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def profile_enter(self, context_manager):
+        """Run the ``__enter__`` of ``context_manager``, timing it if it is
+        sampled."""
+        if next(self._counter) % self.sample_every:
+            return context_manager._enter()
+        self._instrument(context_manager)
+        try:
+            return self._timed("enter", context_manager._enter)
+        except:
+            self._uninstrument(context_manager)
+            raise
+
+    def profile_exit(self, context_manager, exc_type, exc_val, exc_tb):
+        """Run the ``__exit__`` of ``context_manager``, timing it if its
+        entry was sampled."""
+        if context_manager.sampled_by is not self:
+            return context_manager._exit(exc_type, exc_val, exc_tb)
+        try:
+            return self._timed("exit", context_manager._exit,
+                               exc_type, exc_val, exc_tb)
+        finally:
+            self._uninstrument(context_manager)
+
+    def _instrument(self, context_manager):
+        """Shadow the methods of ``context_manager`` with timed versions."""
+        for name, phase in _PHASES.items():
+            setattr(context_manager, name,
+                    self._wrap(getattr(context_manager, name), phase))
+        context_manager.sampled_by = self
+
+    @staticmethod
+    def _uninstrument(context_manager):
+        # pylint: disable=missing-docstring
+        for name in _PHASES:
+            vars(context_manager).pop(name, None)
+        context_manager.sampled_by = None
+
+    def _wrap(self, func, phase):
+        # pylint: disable=missing-docstring
+        local = self._local
+
+        def timed(*args, **kwargs):
+            # pylint: disable=missing-docstring
+            start = timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                # no sample if the exit runs in another thread than the entry
+                sample = getattr(local, "sample", None)
+                if sample is not None:
+                    sample[phase] += timer() - start
+        return timed
+
+    def _timed(self, kind, func, *args):
+        # pylint: disable=missing-docstring
+        sample = self._local.sample = defaultdict(float)
+        start = timer()
+        try:
+            return func(*args)
+        finally:
+            total = timer() - start
+            self._local.sample = None
+            self._record(kind, total, sample)
+
+    def _record(self, kind, total, sample):
+        # pylint: disable=missing-docstring
+        db_time = sample["db"]
+        timings = {
+            "total": total,
+            "stack": sample["stack"],
+            "events": sample["events"],
+            "compile": sample["sql"] - db_time,
+            "db": db_time,
+            "python": total - db_time,
+        }
+        with self._lock:
+            for name, value in timings.items():
+                self._histograms[kind + "." + name].add(value)
+
+    def _before_cursor_execute(self, *args):
+        # pylint: disable=unused-argument, missing-docstring
+        if getattr(self._local, "sample", None) is not None:
+            self._local.cursor_start = timer()
+
+    def _after_cursor_execute(self, *args):
+        # pylint: disable=unused-argument, missing-docstring
+        sample = getattr(self._local, "sample", None)
+        if sample is not None:
+            sample["db"] += timer() - self._local.cursor_start
+
+    def listen(self):
+        """Start timing cursor executions of all engines."""
+        event.listen(Engine, "before_cursor_execute",
+                     self._before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute",
+                     self._after_cursor_execute)
+
+    def remove(self):
+        """Stop timing cursor executions, see :meth:`listen`."""
+        event.remove(Engine, "before_cursor_execute",
+                     self._before_cursor_execute)
+        event.remove(Engine, "after_cursor_execute",
+                     self._after_cursor_execute)
+
+    def dump(self):
+        """Return a :class:`dict` mapping names such as ``"enter.db"`` to the
+        summary of their :class:`Histogram`, see :meth:`Histogram.to_dict`.
+        """
+        with self._lock:
+            return dict((name, histogram.to_dict())
+                        for name, histogram in self._histograms.items())
+
+    def reset(self):
+        """Discard all the collected timings."""
+        with self._lock:
+            self._histograms.clear()
+
+
+def enable_profiling(sample_every=100):
+    """Enable profiling of :func:`~sqlalchemy_sqlschema.maintain_schema`,
+    sampling 1 in ``sample_every`` entries.
+
+    :Example:
+
+    >>> profiler = enable_profiling(sample_every=50)
+    >>> # ... run the application
+    >>> profiler.dump()["enter.db"]["p99"]
+    0.000512
+
+    :param sample_every: :class:`int`, the sampling period
+    :return: the active :class:`SchemaProfiler`
+    """
+    disable_profiling()
+    profiler = SchemaProfiler(sample_every)
+    profiler.listen()
+    SchemaContextManager.profiler = profiler
+    return profiler
+
+
+def disable_profiling():
+    """Disable profiling, see :func:`enable_profiling`.
+
+    :return: the :class:`SchemaProfiler` that was active, or ``None``
+    """
+    profiler = SchemaContextManager.profiler
+    if profiler is not None:
+        SchemaContextManager.profiler = None
+        profiler.remove()
+    return profiler
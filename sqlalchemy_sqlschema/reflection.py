@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a reflection cache shared by tenant schemas that have the same
+structure as a template schema.
+
+Reflecting the tables of every tenant schema repeats the same catalog queries
+once per schema. With a :class:`SchemaTemplate`, the template schema is
+reflected once and its tables are reused, unqualified, for every instance
+schema. Since :func:`~sqlalchemy_sqlschema.maintain_schema` makes unqualified
+tables resolve to the active schema, the same
+:class:`~sqlalchemy.schema.MetaData` serves all the tenants.
+
+An optional fingerprint (e.g. the Alembic revision of each schema) detects
+instance schemas that drifted from the template. These are reflected on their
+own and cached by fingerprint, so schemas sharing a drifted structure also
+share a single reflection.
+"""
+import threading
+
+from sqlalchemy import (MetaData, Table, Column, String, ForeignKeyConstraint,
+                        select)
+
+from .maintain_schema import active_schema
+
+__all__ = ["SchemaTemplate", "alembic_revision"]
+
+
+def alembic_version_table(schema, metadata=None):
+    """Return the ``alembic_version`` :class:`~sqlalchemy.schema.Table` of
+    ``schema``."""
+    return Table("alembic_version", metadata or MetaData(),
+                 Column("version_num", String(32), primary_key=True),
+                 schema=schema)
+
+
+def alembic_revision(connection, schema):
+    """A fingerprint function returning the Alembic revision(s) of
+    ``schema`` as a sorted :class:`tuple`.
+
+    :param connection: a :class:`~sqlalchemy.engine.Connection`
+    :param schema: :class:`str`, the schema to fingerprint
+    """
+    version = alembic_version_table(schema)
+    return tuple(sorted(
+        row[0] for row in connection.execute(select([version.c.version_num]))))
+
+
+def _copy_foreign_key(constraint, schema):
+    """Copy the :class:`~sqlalchemy.schema.ForeignKeyConstraint`, making its
+    references to tables of ``schema`` unqualified."""
+    refcolumns = []
+    for element in constraint.elements:
+        column = element.column
+        if column.table.schema == schema:
+            refcolumns.append("%s.%s" % (column.table.name, column.name))
+        else:
+            refcolumns.append("%s.%s" % (column.table.fullname, column.name))
+    return ForeignKeyConstraint(
+        [element.parent.name for element in constraint.elements], refcolumns,
+        name=constraint.name, onupdate=constraint.onupdate,
+        ondelete=constraint.ondelete)
+
+
+class SchemaTemplate(object):
+    """A reflection cache for the instances of the ``template`` schema.
+
+    :Example:
+
+    >>> tenants = SchemaTemplate("tenant_template",
+    >>>                          fingerprint=alembic_revision)
+    >>> with maintain_schema("tenant_42", session):
+    >>>     orders = tenants.metadata(session).tables["orders"]
+    >>>     session.execute(orders.select())
+
+    :param template: :class:`str`, the schema that is reflected on behalf of
+        all its instances
+    :param fingerprint: optional callable accepting a
+        :class:`~sqlalchemy.engine.Connection` and a schema name, and returning
+        a hashable value that is equal for schemas of the same structure, e.g.
+        :func:`alembic_revision`. If not provided, instances are assumed to
+        never drift from the template.
+    :param only: optional list of table names to reflect, see
+        :meth:`~sqlalchemy.schema.MetaData.reflect`
+    """
+
+    def __init__(self, template, fingerprint=None, only=None):
+        self.template = template
+        self.fingerprint = fingerprint
+        self.only = only
+        #: the instance schemas whose fingerprint differs from the template's
+        self.drifted = set()
+        # fingerprint -> MetaData
+        self._metadatas = {}
+        # schema -> fingerprint, so each schema is only fingerprinted once
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def metadata(self, session, schema=None):
+        """Return a :class:`~sqlalchemy.schema.MetaData` with the unqualified
+        tables of ``schema``.
+
+        The template is reflected on first use. Instance schemas cost at most
+        one fingerprint query, and are only reflected if their fingerprint
+        differs from every structure reflected so far.
+
+        :param session: a :class:`~sqlalchemy.orm.session.Session`
+        :param schema: :class:`str`, the instance schema. Defaults to the
+            schema maintained on ``session``, or the template if there is none.
+        """
+        if schema is None:
+            schema = active_schema(session) or self.template
+        try:
+            return self._metadatas[self._fingerprints[schema]]
+        except KeyError:
+            pass
+        with self._lock:
+            if self.template not in self._fingerprints:
+                self._load(session, self.template)
+            if schema not in self._fingerprints:
+                self._load(session, schema)
+            return self._metadatas[self._fingerprints[schema]]
+
+    def _load(self, session, schema):
+        """Fingerprint ``schema`` and reflect it unless a schema of the same
+        fingerprint was already reflected."""
+        connection = session.connection()
+        if self.fingerprint is None:
+            fingerprint = None
+        else:
+            fingerprint = self.fingerprint(connection, schema)
+        if fingerprint not in self._metadatas:
+            self._metadatas[fingerprint] = self._reflect(connection, schema)
+        if schema != self.template and \
+                fingerprint != self._fingerprints[self.template]:
+            self.drifted.add(schema)
+        self._fingerprints[schema] = fingerprint
+
+    def _reflect(self, connection, schema):
+        """Reflect ``schema`` and return copies of its tables, with their
+        columns and foreign keys, in a new :class:`~sqlalchemy.schema.MetaData`
+        without a schema."""
+        reflected = MetaData()
+        reflected.reflect(bind=connection, schema=schema, only=self.only)
+
+        metadata = MetaData()
+        for table in reflected.sorted_tables:
+            args = [column.copy() for column in table.columns]
+            args.extend(_copy_foreign_key(constraint, schema)
+                        for constraint in table.foreign_key_constraints)
+            Table(table.name, metadata, *args)
+        return metadata
+
+    def invalidate(self, schema=None):
+        """Forget the fingerprint of ``schema`` so it is checked again on next
+        use. If ``schema`` is ``None``, forget everything including the
+        reflected structures."""
+        with self._lock:
+            if schema is None:
+                self._metadatas.clear()
+                self._fingerprints.clear()
+                self.drifted.clear()
+            else:
+                self._fingerprints.pop(schema, None)
+                self.drifted.discard(schema)
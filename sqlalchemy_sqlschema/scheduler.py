@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Provides :class:`SchemaBatchScheduler`, which runs queued tasks of many
+schemas in batches of the same schema, to switch schemas less often than in
+queue order.
+
+The scheduler buffers a window of tasks pulled from the queue and runs the
+tasks of one schema at a time, in a single
+:func:`~sqlalchemy_sqlschema.maintain_schema` context on a single connection.
+The schema with the most buffered tasks runs next, unless the tasks of
+another schema are starving: they waited for too many batches or too long, in
+which case the schema of the oldest starving task runs first. Batches are cut
+short after a number of tasks or seconds, so that a busy schema does not hold
+up the others. Consecutive batches of the same schema share their context, so
+the schema is only switched when the schema of the batches changes.
+"""
+import sys
+from collections import deque, OrderedDict
+from timeit import default_timer as timer
+
+from .maintain_schema import maintain_schema
+
+__all__ = ["SchemaBatchScheduler"]
+
+
+class SchemaBatchScheduler(object):
+    """Runs the tasks returned by ``fetch`` with ``handler``, in batches of
+    tasks of the same schema.
+
+    Each batch runs in a :func:`~sqlalchemy_sqlschema.maintain_schema`
+    context on ``session``, which is committed after each batch. The context
+    is kept open for the next batch if it has the same schema, and exited
+    when the schema changes, when no task is left or on :meth:`close`.
+
+    :Example:
+
+    >>> def fetch(count):
+    >>>     return queue.pop_many(count)
+    >>> def handle(session, job):
+    >>>     session.add(Invoice(order_id=job["order_id"]))
+    >>> scheduler = SchemaBatchScheduler(session, fetch, handle, "tenant",
+    >>>                                  window=500, max_batch_latency=1.0)
+    >>> scheduler.run()
+    >>> scheduler.stats()
+    {'tasks': 2000, 'batches': 41, 'switches': 41, 'queue_switches': 1874,
+     'switches_saved': 1833}
+
+    :param session: a :class:`~sqlalchemy.orm.session.Session`, not in a
+        transaction when a batch switches schemas if ``sticky``
+    :param fetch: a callable taking the maximum number of tasks to return
+        and returning an iterable of tasks, empty if the queue is empty
+    :param handler: a callable taking ``session`` and a task, running the
+        task in the schema of the batch
+    :param schema_key: the key of the schema in each task, or a callable
+        returning the schema of a task
+    :param window: :class:`int`, the number of tasks to buffer
+    :param max_batch: :class:`int`, the maximum number of tasks per batch, or
+        ``None``
+    :param max_batch_latency: :class:`float`, the number of seconds after
+        which a batch stops taking tasks, or ``None``
+    :param max_skips: :class:`int`, the number of batches a task can wait for
+        before it is starving, or ``None``
+    :param max_wait: :class:`float`, the number of seconds a task can wait
+        for before it is starving, or ``None``
+    :param sticky: :class:`bool`, pin a connection for the batches of each
+        schema, see :func:`~sqlalchemy_sqlschema.maintain_schema`
+    :param commit: :class:`bool`, commit ``session`` after each batch and
+        after exiting the context of a schema, or roll it back if a task
+        raises
+    """
+
+    def __init__(self, session, fetch, handler, schema_key, window=100,
+                 max_batch=None, max_batch_latency=None, max_skips=10,
+                 max_wait=None, sticky=True, commit=True):
+        # pylint: disable=too-many-arguments
+        self.session = session
+        self.fetch = fetch
+        self.handler = handler
+        self.schema_key = schema_key
+        self.window = window
+        self.max_batch = max_batch
+        self.max_batch_latency = max_batch_latency
+        self.max_skips = max_skips
+        self.max_wait = max_wait
+        self.sticky = sticky
+        self.commit = commit
+        #: the number of tasks run
+        self.tasks = 0
+        #: the number of batches run
+        self.batches = 0
+        #: the number of schema switches, i.e. the number of contexts entered
+        self.switches = 0
+        #: the number of schema switches running the tasks in queue order
+        self.queue_switches = 0
+        # schema -> deque of (task, batches run, time) when it was buffered,
+        # in order of arrival of the oldest buffered task of each schema
+        self._buffer = OrderedDict()
+        self._buffered = 0
+        self._last_queued = None
+        # the open context of the schema of the last batch
+        self._context = None
+
+    def stats(self):
+        """Return the counts of the scheduler as a :class:`dict`.
+
+        ``switches_saved`` is the number of schema switches avoided compared
+        to running the tasks fetched so far in queue order.
+        """
+        return {"tasks": self.tasks,
+                "batches": self.batches,
+                "switches": self.switches,
+                "queue_switches": self.queue_switches,
+                "switches_saved": self.queue_switches - self.switches}
+
+    @property
+    def buffered(self):
+        """The number of buffered tasks."""
+        return self._buffered
+
+    def _schema_of(self, task):
+        # pylint: disable=missing-docstring
+        if callable(self.schema_key):
+            return self.schema_key(task)
+        return task[self.schema_key]
+
+    def _refill(self):
+        """Buffer tasks from ``fetch`` up to the window size."""
+        if self._buffered >= self.window:
+            return
+        now = timer()
+        for task in self.fetch(self.window - self._buffered):
+            schema = self._schema_of(task)
+            if schema != self._last_queued:
+                self.queue_switches += 1
+                self._last_queued = schema
+            if schema not in self._buffer:
+                self._buffer[schema] = deque()
+            self._buffer[schema].append((task, self.batches, now))
+            self._buffered += 1
+
+    def _starving(self, entry, now):
+        """Return whether the buffered ``entry`` waited for too long."""
+        _, batches, buffered_at = entry
+        return (self.max_skips is not None and
+                self.batches - batches >= self.max_skips) or \
+            (self.max_wait is not None and now - buffered_at >= self.max_wait)
+
+    def _next_schema(self):
+        """Return the schema of the next batch, or ``None`` if no task is
+        buffered."""
+        if not self._buffer:
+            return None
+        now = timer()
+        # the oldest task of each schema heads its deque, and the schemas are
+        # ordered by their oldest task, so the first starving one is the
+        # oldest
+        for schema, tasks in self._buffer.items():
+            if self._starving(tasks[0], now):
+                return schema
+        # max returns the first of the largest, the oldest on ties
+        return max(self._buffer, key=lambda schema: len(self._buffer[schema]))
+
+    def _enter(self, schema):
+        """Enter the context of ``schema``, unless it is already open."""
+        if self._context is not None:
+            if self._context.schema == schema:
+                return
+            self.close()
+        context = maintain_schema(schema, self.session, sticky=self.sticky)
+        context.__enter__()
+        self._context = context
+        self.switches += 1
+
+    def close(self, exc_info=(None, None, None)):
+        """Exit the open context, if any, and commit.
+
+        To be called when stopping before :meth:`step` returns ``None``.
+        """
+        context, self._context = self._context, None
+        if context is None:
+            return
+        context.__exit__(*exc_info)
+        if self.commit:
+            self.session.commit()
+
+    def _run_batch(self, schema):
+        """Run the buffered tasks of ``schema`` within the batch limits,
+        returning the number of tasks run."""
+        tasks = self._buffer[schema]
+        count = 0
+        start = timer()
+        try:
+            self._enter(schema)
+            while tasks:
+                task = tasks.popleft()[0]
+                self._buffered -= 1
+                count += 1
+                self.handler(self.session, task)
+                if self.max_batch is not None and count >= self.max_batch:
+                    break
+                if self.max_batch_latency is not None and \
+                        timer() - start >= self.max_batch_latency:
+                    break
+            if self.commit:
+                self.session.commit()
+        except:
+            exc_info = sys.exc_info()
+            if self.commit:
+                self.session.rollback()
+            self.close(exc_info)
+            raise
+        finally:
+            if not tasks:
+                del self._buffer[schema]
+            # a failed task counts as run, it is not retried
+            self.tasks += count
+            self.batches += 1
+        return count
+
+    def step(self):
+        """Refill the buffer and run a batch.
+
+        If a task raises, the context is exited and the exception propagates
+        after the remaining tasks of the batch are left buffered for a later
+        batch.
+
+        :return: a tuple of the schema of the batch and the number of tasks
+            run, or ``None`` if no task is left, in which case the context is
+            exited
+        """
+        self._refill()
+        schema = self._next_schema()
+        if schema is None:
+            self.close()
+            return None
+        return schema, self._run_batch(schema)
+
+    def run(self):
+        """Run batches until no task is left.
+
+        :return: :class:`int`, the number of tasks run
+        """
+        count = 0
+        while True:
+            batch = self.step()
+            if batch is None:
+                return count
+            count += batch[1]
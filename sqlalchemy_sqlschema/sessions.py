@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Provides :func:`schema_sessionmaker`, a session factory returning sessions
+that are already in a schema and are recycled once closed.
+
+Building a :class:`~sqlalchemy.orm.session.Session` per request, joining its
+event dispatcher on the first listener and looking up the schema found on the
+connection with :class:`~sqlalchemy_sqlschema.sql.GetSchema` all add up at
+high request rates. Sessions of a :class:`SchemaSessionFactory` start in the
+given schema without a ``GetSchema`` if the initial schema of the connections
+is known, and are kept in a bounded free list when closed, to be handed out
+again instead of allocating new ones.
+"""
+from collections import deque
+
+from sqlalchemy.orm import Session
+
+from .maintain_schema import SchemaContextManager
+
+__all__ = ["schema_sessionmaker", "SchemaSessionFactory"]
+
+
+class _SchemaSessionMixin(object):
+    """Exits the schema context of the session when it is closed, and returns
+    the session to its factory."""
+
+    # the context manager entered for the session by its factory
+    _schema_context = None
+    # the factory of the session
+    _schema_factory = None
+
+    @property
+    def schema(self):
+        """The schema the session was created for, or ``None`` once it is
+        closed."""
+        context = self._schema_context
+        return context.schema if context is not None else None
+
+    def close(self):
+        """Restore the initial schema, close the session and return it to the
+        free list of its factory.
+
+        The session must not be used after it is closed, since it can be
+        handed out by the factory again.
+        """
+        context = self._schema_context
+        if context is None:
+            super(_SchemaSessionMixin, self).close()
+            return
+        self._schema_context = None
+        try:
+            # closing would roll the restore back along with the pending
+            # work, and the schema setting is transactional on e.g.
+            # PostgreSQL, so the restore is committed on its own
+            self.rollback()
+            context.__exit__(None, None, None)
+            self.commit()
+        except:
+            # the connection state is unknown, don't recycle the session
+            super(_SchemaSessionMixin, self).close()
+            raise
+        super(_SchemaSessionMixin, self).close()
+        self._schema_factory.release(self)
+
+
+class SchemaSessionFactory(object):
+    """Creates sessions in a schema, see :func:`schema_sessionmaker`."""
+
+    def __init__(self, bind=None, initial_schema=None, free_list_size=32,
+                 class_=Session, **kwargs):
+        self.bind = bind
+        self.initial_schema = initial_schema
+        self.kwargs = kwargs
+        self.class_ = type("Schema" + class_.__name__,
+                           (_SchemaSessionMixin, class_), {})
+        self._free = deque(maxlen=free_list_size)
+
+    def __call__(self, schema):
+        """Return a session in ``schema``, recycling a closed one if
+        available."""
+        try:
+            session = self._free.pop()
+        except IndexError:
+            session = self.class_(bind=self.bind, **self.kwargs)
+            session._schema_factory = self
+        if self.initial_schema is not None:
+            schema_stack = SchemaContextManager._get_schema_stack(session)
+            if schema_stack.top is None:
+                schema_stack.push((self.initial_schema, None))
+        context = SchemaContextManager(schema, session)
+        context.__enter__()
+        session._schema_context = context
+        return session
+
+    def release(self, session):
+        """Add the closed ``session`` to the free list, dropping the oldest
+        session if it is full."""
+        session.info.clear()
+        self._free.append(session)
+
+    @property
+    def free(self):
+        """The number of sessions in the free list."""
+        return len(self._free)
+
+
+def schema_sessionmaker(bind=None, initial_schema=None, free_list_size=32,
+                        class_=Session, **kwargs):
+    """Return a :class:`SchemaSessionFactory`, a session factory called with
+    a schema that returns a session in which
+    :func:`~sqlalchemy_sqlschema.maintain_schema` is already entered for that
+    schema. Closing the session exits the context manager and recycles the
+    session.
+
+    :Example:
+
+    >>> Session = schema_sessionmaker(bind=engine, initial_schema="public")
+    >>> session = Session("tenant7")  # no GetSchema
+    >>> session.query(Order).all()
+    >>> session.close()  # back to "public" and to the free list
+
+    :param bind: the bind of the sessions
+    :param initial_schema: :class:`str`, the schema of the connections of
+        ``bind`` before any schema is set, e.g. the default ``search_path``.
+        If ``None`` it is looked up on the first use of each session.
+    :param free_list_size: :class:`int`, the number of closed sessions kept
+        for reuse
+    :param class_: the :class:`~sqlalchemy.orm.session.Session` subclass to
+        create
+    :param kwargs: passed to the constructor of ``class_``
+    """
+    return SchemaSessionFactory(bind, initial_schema, free_list_size, class_,
+                                **kwargs)
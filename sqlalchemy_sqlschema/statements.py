@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Keeps the prepared statement caches of DBAPI drivers correct across SQL
+schema switches.
+
+Server-side prepared statements are planned against the ``search_path`` that
+was active when they were prepared. Once
+:func:`~sqlalchemy_sqlschema.sql.set_schema` changes it, a cached statement
+either fails (``cached plan must not change result type``) or reads the
+tables of the previous schema. :func:`namespace_statement_cache` watches the
+schema switches executed on an engine's connections and, whenever the schema
+actually changes, calls the handler registered for the driver of the engine,
+which namespaces or invalidates the statement cache of the DBAPI connection.
+
+No handler is built in: the statement caches are internals of each driver
+and its SQL Alchemy dialect, so handlers are registered by the application
+with :func:`register_statement_cache_handler`, for the driver versions it
+uses. Connections of drivers without a handler are not affected.
+
+:Example:
+
+>>> def deallocate(dbapi_connection, info, prev_schema, schema):
+>>>     cursor = dbapi_connection.cursor()
+>>>     cursor.execute("DEALLOCATE ALL")
+>>>     cursor.close()
+>>> register_statement_cache_handler("psycopg2", deallocate)
+>>> namespace_statement_cache(engine)
+"""
+from sqlalchemy import event
+
+from .sql import SetSchema
+
+__all__ = ["namespace_statement_cache", "register_statement_cache_handler"]
+
+# the key in the connection info holding the schema last set on it
+_SCHEMA_KEY = "sqlschema_statement_cache_schema"
+
+_handlers = {}
+
+
+def register_statement_cache_handler(driver, handler):
+    """Register the ``handler`` of the statement cache of ``driver``.
+
+    :param driver: :class:`str`, the DBAPI driver name as in
+        :attr:`~sqlalchemy.engine.interfaces.Dialect.driver`
+    :param handler: a callable accepting the DBAPI connection, the connection
+        ``info`` :class:`dict`, the previous schema and the new schema, called
+        after the schema of the connection changed
+    """
+    _handlers[driver] = handler
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    # pylint: disable=unused-argument, missing-docstring
+    compiled = context.compiled
+    if compiled is None or not isinstance(compiled.statement, SetSchema):
+        return
+    handler = _handlers.get(conn.dialect.driver)
+    if handler is None:
+        return
+    schema = compiled.statement.schema
+    prev_schema = conn.info.get(_SCHEMA_KEY)
+    conn.info[_SCHEMA_KEY] = schema
+    if prev_schema != schema:
+        handler(conn.connection.connection, conn.info, prev_schema, schema)
+
+
+def namespace_statement_cache(engine):
+    """Namespace or invalidate the prepared statement cache of the connections
+    of ``engine`` whenever their SQL schema changes, so that statement caching
+    can stay enabled while switching schemas.
+
+    Only drivers with a registered handler are affected, see
+    :func:`register_statement_cache_handler`.
+
+    :param engine: an :class:`~sqlalchemy.engine.Engine`
+    """
+    if not event.contains(engine, "after_cursor_execute",
+                          _after_cursor_execute):
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
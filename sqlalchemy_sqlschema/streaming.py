@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Defers the schema restore of :func:`~sqlalchemy_sqlschema.maintain_schema`
+while results are still streaming from a server-side cursor.
+
+Executing the restore on a connection whose cursor is still streaming either
+fails or forces the driver to buffer the whole result. Once an engine is
+tracked with :func:`track_streaming_results`, exiting the context manager with
+open streaming results on the session's connection only records the restore,
+which is executed as soon as one of the following happens:
+
+- the last streaming result is closed or exhausted
+- another statement is executed on the connection
+- the connection is returned to the pool
+
+Tracking requires SQLAlchemy 1.0 to 1.3, it wraps the private soft close of
+their result proxies.
+"""
+import weakref
+
+from sqlalchemy import event
+
+from .sql import set_schema
+from .tracking import _remember_schema, _SCHEMA_KEY
+from .util import require_sqlalchemy
+
+__all__ = ["track_streaming_results", "open_streams"]
+
+# the key in the connection info holding the streaming results
+_STREAMS_KEY = "sqlschema_streams"
+# the key in the connection info holding the schema to be restored
+_PENDING_KEY = "sqlschema_pending_restore"
+
+# whether any engine is tracked, so untracked applications skip the lookup
+_tracking = False
+
+
+def _is_streaming(result):
+    # pylint: disable=missing-docstring
+    context = getattr(result, "context", None)
+    if context is None:
+        return False
+    return bool(getattr(context, "_is_server_side", False) or
+                context.execution_options.get("stream_results"))
+
+
+def open_streams(connection):
+    """Return the list of streaming results of ``connection`` whose cursor
+    is still open.
+
+    :param connection: a :class:`~sqlalchemy.engine.Connection`
+    """
+    return [result for result in connection.info.get(_STREAMS_KEY, ())
+            if result.cursor is not None]
+
+
+def _restore(connection):
+    """Execute the pending restore of ``connection``, if any."""
+    schema = connection.info.pop(_PENDING_KEY, None)
+    if schema is not None:
+        # the connection may be branched with the stream_results option,
+        # close the result so it is not tracked as an open stream
+        connection.execute(set_schema(schema)).close()
+
+
+def _after_execute(conn, clauseelement, multiparams, params, result):
+    # pylint: disable=unused-argument, missing-docstring
+    if result is None or not _is_streaming(result):
+        return
+    conn.info.setdefault(_STREAMS_KEY, weakref.WeakSet()).add(result)
+    soft_close = result._soft_close
+
+    def _soft_close(*args, **kwargs):
+        # pylint: disable=missing-docstring
+        soft_close(*args, **kwargs)
+        if _PENDING_KEY in conn.info and not conn.closed and \
+                not open_streams(conn):
+            _restore(conn)
+    result._soft_close = _soft_close
+
+
+def _before_execute(conn, clauseelement, multiparams, params):
+    # pylint: disable=unused-argument, missing-docstring
+    if _PENDING_KEY in conn.info:
+        _restore(conn)
+
+
+def track_streaming_results(engine):
+    """Track the streaming results of ``engine``, so that exiting
+    :func:`~sqlalchemy_sqlschema.maintain_schema` defers the schema restore
+    until they are closed.
+
+    Results are streaming when they are executed with the ``stream_results``
+    execution option, e.g. by :meth:`~sqlalchemy.orm.query.Query.yield_per`,
+    or use a server-side cursor.
+
+    :param engine: an :class:`~sqlalchemy.engine.Engine`
+    :raises ImportError: if the version of SQLAlchemy is not supported
+    """
+    # pylint: disable=global-statement
+    global _tracking
+    # not checked on import, maintain_schema imports the module
+    require_sqlalchemy("track_streaming_results", (1, 0), (1, 4))
+    if event.contains(engine, "after_execute", _after_execute):
+        return
+    dialect = engine.dialect
+
+    def checkin(dbapi_connection, connection_record):
+        # pylint: disable=missing-docstring
+        info = connection_record.info
+        schema = info.pop(_PENDING_KEY, None)
+        # invalidated connections are checked in without a DBAPI connection
+        if schema is None or dbapi_connection is None:
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(str(set_schema(schema).compile(dialect=dialect)))
+        finally:
+            cursor.close()
+        dbapi_connection.commit()
+        if _SCHEMA_KEY in info:
+            _remember_schema(info, schema)
+
+    event.listen(engine, "after_execute", _after_execute)
+    event.listen(engine, "before_execute", _before_execute)
+    event.listen(engine, "checkin", checkin)
+    _tracking = True
+
+
+def defer_restore(session, schema):
+    """Record the restore of ``schema`` on the connection of ``session`` if
+    it has open streaming results.
+
+    :return: ``True`` if the restore was deferred, ``False`` if it needs to be
+        executed now
+    """
+    if not _tracking:
+        return False
+    connection = session.connection()
+    if not open_streams(connection):
+        return False
+    connection.info[_PENDING_KEY] = schema
+    return True
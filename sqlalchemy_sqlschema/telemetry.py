@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Provides opt-in, fixed-memory telemetry of the schemas entered with
+:func:`~sqlalchemy_sqlschema.maintain_schema`.
+
+Keeping exact counts for every schema costs memory proportional to the number
+of schemas. Instead, :class:`SpaceSaving` implements the Space-Saving
+heavy-hitters algorithm (Metwally et al., 2005), which monitors a fixed number
+of schemas and reports the most frequent ones with a bound on the error of
+their counts.
+"""
+import heapq
+import threading
+from collections import namedtuple
+from timeit import default_timer as timer
+
+from .maintain_schema import SchemaContextManager
+
+__all__ = ["SpaceSaving", "SchemaUsage", "SchemaUsageTracker",
+           "enable_usage_tracking", "disable_usage_tracking"]
+
+
+SchemaUsage = namedtuple("SchemaUsage", "schema count error hold_time")
+SchemaUsage.__doc__ = """The usage of a schema reported by
+:meth:`SchemaUsageTracker.top`.
+
+- ``count``: an upper bound of the number of entries of the schema
+- ``error``: the maximum overestimation of ``count``, i.e. the schema was
+  entered at least ``count - error`` times
+- ``hold_time``: the seconds spent inside the context manager for the entries
+  that were recorded while the schema was monitored
+"""
+
+
+class SpaceSaving(object):
+    """The Space-Saving algorithm, monitoring at most ``capacity`` items.
+
+    Every item whose true count exceeds ``1/capacity`` of the total is
+    guaranteed to be monitored, and each monitored count overestimates the
+    true count by at most its error.
+
+    :param capacity: :class:`int`, the number of monitored items
+    """
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("capacity must be a positive integer")
+        self.capacity = capacity
+        #: the total number of added items
+        self.total = 0
+        # item -> [count, error, weight]
+        self._counters = {}
+        # one (count, item) entry per monitored item, the count may be stale
+        # (lower than the actual one) since the heap is only fixed on eviction
+        self._heap = []
+
+    def __len__(self):
+        return len(self._counters)
+
+    def __contains__(self, item):
+        return item in self._counters
+
+    def add(self, item):
+        """Count one occurrence of ``item``."""
+        self.total += 1
+        counter = self._counters.get(item)
+        if counter is not None:
+            counter[0] += 1
+            return
+        if len(self._counters) < self.capacity:
+            self._counters[item] = [1, 0, 0.0]
+            heapq.heappush(self._heap, (1, item))
+            return
+        # replace the item with the minimum count
+        while True:
+            count, evicted = self._heap[0]
+            actual = self._counters[evicted][0]
+            if count == actual:
+                break
+            heapq.heapreplace(self._heap, (actual, evicted))
+        del self._counters[evicted]
+        self._counters[item] = [count + 1, count, 0.0]
+        heapq.heapreplace(self._heap, (count + 1, item))
+
+    def add_weight(self, item, weight):
+        """Add ``weight`` to the weight of ``item``, if it is monitored."""
+        counter = self._counters.get(item)
+        if counter is not None:
+            counter[2] += weight
+
+    def top(self, k):
+        """Return the ``k`` monitored items with the highest counts as
+        ``(item, count, error, weight)`` tuples."""
+        return heapq.nlargest(
+            k, ((item, count, error, weight) for item, (count, error, weight)
+                in self._counters.items()),
+            key=lambda entry: entry[1])
+
+
+class SchemaUsageTracker(object):
+    """Records the entries and hold durations of the schemas of
+    :class:`~sqlalchemy_sqlschema.maintain_schema.SchemaContextManager` in a
+    :class:`SpaceSaving` summary.
+
+    :param capacity: :class:`int`, the number of monitored schemas
+    """
+
+    def __init__(self, capacity=1000):
+        self._summary = SpaceSaving(capacity)
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        """The total number of recorded entries."""
+        return self._summary.total
+
+    def entered(self, context_manager):
+        """Record the entry of ``context_manager``."""
+        context_manager._entered_at = timer()
+        with self._lock:
+            self._summary.add(context_manager.schema)
+
+    def exited(self, context_manager):
+        """Record the hold duration of ``context_manager``."""
+        entered_at = vars(context_manager).pop("_entered_at", None)
+        if entered_at is None:
+            # entered before tracking was enabled
+            return
+        with self._lock:
+            self._summary.add_weight(context_manager.schema,
+                                     timer() - entered_at)
+
+    def top(self, k=10):
+        """Return a list of the :class:`SchemaUsage` of the ``k`` most
+        frequently entered schemas."""
+        with self._lock:
+            return [SchemaUsage(*entry) for entry in self._summary.top(k)]
+
+
+def enable_usage_tracking(capacity=1000):
+    """Start recording the usage of the schemas entered with
+    :func:`~sqlalchemy_sqlschema.maintain_schema`.
+
+    :Example:
+
+    >>> tracker = enable_usage_tracking(capacity=500)
+    >>> # ... run the application
+    >>> tracker.top(3)
+    [SchemaUsage(schema='tenant7', count=5120, error=0, hold_time=12.5), ...]
+
+    :param capacity: :class:`int`, the number of monitored schemas, which
+        bounds the memory used
+    :return: the active :class:`SchemaUsageTracker`
+    """
+    tracker = SchemaUsageTracker(capacity)
+    SchemaContextManager.tracker = tracker
+    return tracker
+
+
+def disable_usage_tracking():
+    """Stop recording the usage of schemas, see
+    :func:`enable_usage_tracking`.
+
+    :return: the :class:`SchemaUsageTracker` that was active, or ``None``
+    """
+    tracker = SchemaContextManager.tracker
+    SchemaContextManager.tracker = None
+    return tracker
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Tracks the SQL schema active on each connection of an engine, so that the
+schema of a connection can be known without a
+:class:`~sqlalchemy_sqlschema.sql.GetSchema` round trip.
+
+The tracked schema is updated by every
+:class:`~sqlalchemy_sqlschema.sql.SetSchema` executed on the connection. Raw
+statements changing the schema outside the library, e.g. ``SET search_path``
+or ``ALTER SESSION SET CURRENT_SCHEMA`` executed by application code or a
+third-party library, are recognized by a statement sniffer, which only parses
+statements starting with ``SET`` or ``ALTER``.
+
+On dialects where the schema setting is transactional (e.g. PostgreSQL), the
+tracked schema reverts to the last committed one when a transaction is rolled
+back or the connection is reset by the pool, and is forgotten when a savepoint
+is rolled back.
+"""
+import re
+
+from sqlalchemy import event
+
+from .sql import SetSchema
+
+__all__ = ["track_schema", "tracked_schema", "forget_schema", "sniff_schema"]
+
+# the key in the connection info holding the tracked schema
+_SCHEMA_KEY = "sqlschema_schema"
+# the key in the connection info holding the schema as of the last commit
+_COMMITTED_KEY = "sqlschema_committed_schema"
+
+# dialects whose schema setting survives a rollback
+_NON_TRANSACTIONAL = frozenset(["oracle", "mysql"])
+
+_SET_SEARCH_PATH = re.compile(
+    r"^\s*SET\s+(?:(SESSION|LOCAL)\s+)?search_path\s*(?:TO|=)"
+    r"\s*(.*?)\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL)
+_SET_SCHEMA = re.compile(
+    r"^\s*SET\s+(?:(SESSION|LOCAL)\s+)?SCHEMA\s+(.*?)\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL)
+_ALTER_SESSION = re.compile(
+    r"^\s*ALTER\s+SESSION\s+SET\s+CURRENT_SCHEMA\s*=\s*(.*?)\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL)
+
+# the patterns of the statements changing the schema on each dialect, as
+# compiled by sqlalchemy_sqlschema.sql
+_PATTERNS = {
+    "postgresql": (_SET_SEARCH_PATH, _SET_SCHEMA),
+    "oracle": (_ALTER_SESSION,),
+}
+_DEFAULT_PATTERNS = (_SET_SCHEMA,)
+
+
+def _first_schema(value):
+    """Return the first schema of a ``search_path`` or schema value, or
+    ``None`` if it is not a plain name."""
+    first = value.split(",", 1)[0].strip()
+    if first[:1] in ("'", '"') and first[-1:] == first[:1]:
+        first = first[1:-1]
+    elif not first or first.upper() == "DEFAULT" or \
+            not re.match(r"^[\w$]+$", first):
+        return None
+    # a placeholder for the schema named after the user, if it exists
+    if first == "$user":
+        return None
+    return first
+
+
+def sniff_schema(statement, dialect_name):
+    """Recognize a raw ``statement`` changing the schema on ``dialect_name``.
+
+    :return: ``(False, None)`` if ``statement`` does not change the schema,
+        otherwise ``(True, schema)`` where ``schema`` is the new schema or
+        ``None`` if it cannot be known, e.g. for ``SET LOCAL`` or ``DEFAULT``
+    """
+    head = statement[:32].lstrip()[:5].upper()
+    if not (head.startswith("SET") or head == "ALTER"):
+        return False, None
+    for pattern in _PATTERNS.get(dialect_name, _DEFAULT_PATTERNS):
+        match = pattern.match(statement)
+        if match is None:
+            continue
+        groups = match.groups()
+        if len(groups) == 2 and groups[0] and groups[0].upper() == "LOCAL":
+            # reverts at the end of the transaction
+            return True, None
+        return True, _first_schema(groups[-1])
+    return False, None
+
+
+def tracked_schema(connection):
+    """Return the schema tracked on ``connection``, or ``None`` if it is not
+    known.
+
+    :param connection: a :class:`~sqlalchemy.engine.Connection`
+    """
+    return connection.info.get(_SCHEMA_KEY)
+
+
+def forget_schema(connection):
+    """Forget the schema tracked on ``connection``."""
+    connection.info.pop(_SCHEMA_KEY, None)
+    connection.info.pop(_COMMITTED_KEY, None)
+
+
+def _remember_schema(info, schema):
+    """Record ``schema`` as the current and committed schema in the
+    connection ``info``."""
+    info[_SCHEMA_KEY] = info[_COMMITTED_KEY] = schema
+
+
+def _revert(info):
+    """Revert the tracked schema in the connection ``info`` to the last
+    committed one."""
+    committed = info.get(_COMMITTED_KEY)
+    if committed is None:
+        info.pop(_SCHEMA_KEY, None)
+    else:
+        info[_SCHEMA_KEY] = committed
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    # pylint: disable=unused-argument, missing-docstring
+    compiled = context.compiled
+    if compiled is not None and isinstance(compiled.statement, SetSchema):
+        conn.info[_SCHEMA_KEY] = compiled.statement.schema
+        return
+    matched, schema = sniff_schema(statement, conn.dialect.name)
+    if not matched:
+        return
+    if schema is None:
+        conn.info.pop(_SCHEMA_KEY, None)
+    else:
+        conn.info[_SCHEMA_KEY] = schema
+
+
+def _after_cursor_execute_no_sniff(conn, cursor, statement, parameters,
+                                   context, executemany):
+    # pylint: disable=unused-argument, missing-docstring
+    compiled = context.compiled
+    if compiled is not None and isinstance(compiled.statement, SetSchema):
+        conn.info[_SCHEMA_KEY] = compiled.statement.schema
+
+
+def _commit(conn):
+    # pylint: disable=missing-docstring
+    schema = conn.info.get(_SCHEMA_KEY)
+    if schema is None:
+        conn.info.pop(_COMMITTED_KEY, None)
+    else:
+        conn.info[_COMMITTED_KEY] = schema
+
+
+def _rollback(conn):
+    # pylint: disable=missing-docstring
+    _revert(conn.info)
+
+
+def _rollback_savepoint(conn, *args):
+    # pylint: disable=unused-argument, missing-docstring
+    conn.info.pop(_SCHEMA_KEY, None)
+
+
+def _reset(dbapi_connection, connection_record):
+    # pylint: disable=unused-argument, missing-docstring
+    _revert(connection_record.info)
+
+
+def track_schema(engine, sniff=True):
+    """Track the schema of the connections of ``engine``, see
+    :func:`tracked_schema`.
+
+    :param engine: an :class:`~sqlalchemy.engine.Engine`
+    :param sniff: :class:`bool`, whether raw statements changing the schema
+        are recognized. Without it, the tracked schema is wrong once such a
+        statement is executed.
+    """
+    listener = _after_cursor_execute if sniff \
+        else _after_cursor_execute_no_sniff
+    for other in (_after_cursor_execute, _after_cursor_execute_no_sniff):
+        if other is not listener and \
+                event.contains(engine, "after_cursor_execute", other):
+            event.remove(engine, "after_cursor_execute", other)
+    if event.contains(engine, "after_cursor_execute", listener):
+        return
+    event.listen(engine, "after_cursor_execute", listener)
+    if engine.dialect.name not in _NON_TRANSACTIONAL and \
+            not event.contains(engine, "rollback", _rollback):
+        event.listen(engine, "commit", _commit)
+        event.listen(engine, "rollback", _rollback)
+        event.listen(engine, "rollback_savepoint", _rollback_savepoint)
+        event.listen(engine, "reset", _reset)
+
+
+def _ensure_tracked(engine):
+    """Track the schema of the connections of ``engine`` unless already
+    tracked, with or without sniffing."""
+    if not event.contains(engine, "after_cursor_execute",
+                          _after_cursor_execute) and \
+            not event.contains(engine, "after_cursor_execute",
+                               _after_cursor_execute_no_sniff):
+        track_schema(engine)
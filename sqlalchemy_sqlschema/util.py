@@ -2,6 +2,9 @@
 """
 Utils.
 """
+import re
+
+import sqlalchemy
 
 
 class Stack(list):
@@ -23,3 +26,28 @@ class Stack(list):
             return list.pop(self)
         except IndexError:
             return None
+
+
+def sqlalchemy_version():
+    """Return the ``(major, minor)`` version of the installed SQL Alchemy."""
+    major, minor = re.match(r"(\d+)\.(\d+)", sqlalchemy.__version__).groups()
+    return int(major), int(minor)
+
+
+def require_sqlalchemy(feature, minimum, below=None):
+    """Raise :class:`ImportError` if the installed SQL Alchemy version is
+    older than ``minimum``, or not older than ``below``.
+
+    :param feature: :class:`str`, the name of the feature needing the version
+    :param minimum: the ``(major, minor)`` minimum version
+    :param below: the ``(major, minor)`` first unsupported version, or
+        ``None``
+    """
+    version = sqlalchemy_version()
+    if version >= minimum and (below is None or version < below):
+        return
+    supported = ">={0}.{1}".format(*minimum)
+    if below is not None:
+        supported += ",<{0}.{1}".format(*below)
+    raise ImportError("{0} requires SQLAlchemy {1}, found {2}".format(
+        feature, supported, sqlalchemy.__version__))
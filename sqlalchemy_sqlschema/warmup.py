@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Provides :func:`prewarm_pool`, which opens pooled connections for the hot
+schemas ahead of time, e.g. at worker startup.
+
+Each connection is opened, set to its schema and optionally warmed up with a
+statement, then returned to the pool, so the first requests after a deploy do
+not pay for connection establishment.
+
+The connections are restored to their default schema before they are
+returned to the pool, unless the engine defers restores (see
+:mod:`~sqlalchemy_sqlschema.deferred`). In that case they keep their schema
+for the next user, which skips setting it if it needs the same one.
+"""
+import threading
+from collections import defaultdict
+from timeit import default_timer as timer
+
+from .deferred import defers_restore, defer
+from .sql import get_schema, set_schema
+
+__all__ = ["prewarm_pool", "PrewarmReport"]
+
+
+class PrewarmReport(object):
+    """The outcome of :func:`prewarm_pool`."""
+
+    def __init__(self):
+        #: :class:`dict` mapping schemas to the list of seconds it took to
+        #: open and prepare each of their connections
+        self.durations = defaultdict(list)
+        #: :class:`dict` mapping schemas to the list of errors raised while
+        #: preparing their connections
+        self.errors = defaultdict(list)
+        #: wall clock seconds the whole warm-up took
+        self.elapsed = 0.0
+
+    @property
+    def connections(self):
+        """The number of connections that were prepared."""
+        return sum(len(durations) for durations in self.durations.values())
+
+    def __repr__(self):
+        return "<PrewarmReport connections={0} errors={1} elapsed={2:.3f}s>" \
+            .format(self.connections,
+                    sum(len(errors) for errors in self.errors.values()),
+                    self.elapsed)
+
+
+def prewarm_pool(engine, schemas, warmup=None, concurrency=8):
+    """Open and prepare pooled connections of ``engine`` for ``schemas``.
+
+    Every connection is set to its schema, runs the ``warmup`` statement
+    if given, is restored to its default schema (or marked to be restored by
+    its next user if the engine defers restores), and commits. All the
+    connections are held until every one of them is prepared and then
+    returned to the pool together, so the pool needs to be large enough to
+    hold the total number of connections.
+
+    :Example:
+
+    >>> report = prewarm_pool(engine, {"tenant1": 4, "tenant2": 2},
+    >>>                       warmup="SELECT 1 FROM orders LIMIT 1")
+    >>> report.elapsed
+    0.0521
+
+    :param engine: an :class:`~sqlalchemy.engine.Engine`
+    :param schemas: :class:`dict` mapping schemas to the number of
+        connections to prepare for them
+    :param warmup: optional statement to execute in each schema, or a
+        callable accepting a :class:`~sqlalchemy.engine.Connection` and the
+        schema name
+    :param concurrency: :class:`int`, the number of connections prepared
+        concurrently
+    :return: a :class:`PrewarmReport`
+    """
+    report = PrewarmReport()
+    tasks = [schema for schema, count in schemas.items()
+             for _ in range(count)]
+    tasks.reverse()
+    connections = []
+    lock = threading.Lock()
+
+    def prepare(schema):
+        # pylint: disable=missing-docstring
+        start = timer()
+        connection = engine.connect()
+        with lock:
+            connections.append(connection)
+        with connection.begin():
+            default = connection.execute(get_schema()).scalar()
+            connection.execute(set_schema(schema))
+            if callable(warmup):
+                warmup(connection, schema)
+            elif warmup is not None:
+                connection.execute(warmup)
+            if defers_restore(connection):
+                defer(connection, default)
+            else:
+                connection.execute(set_schema(default))
+        return timer() - start
+
+    def work():
+        # pylint: disable=missing-docstring
+        while True:
+            with lock:
+                if not tasks:
+                    return
+                schema = tasks.pop()
+            try:
+                duration = prepare(schema)
+            except Exception as exc:  # pylint: disable=broad-except
+                with lock:
+                    report.errors[schema].append(exc)
+            else:
+                with lock:
+                    report.durations[schema].append(duration)
+
+    start = timer()
+    workers = [threading.Thread(target=work)
+               for _ in range(min(concurrency, len(tasks)))]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        for connection in connections:
+            connection.close()
+    report.elapsed = timer() - start
+    return report
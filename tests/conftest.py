@@ -5,14 +5,22 @@ Py.test fixtures to setup database engines and the test schema.
 from __future__ import print_function
 
 import os
+import sys
 try:
     from configparser import ConfigParser
 except ImportError:
     from ConfigParser import SafeConfigParser as ConfigParser
 
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 import pytest
 from sqlalchemy import create_engine, pool, event
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker, Session
+
+from sqlalchemy_sqlschema.sql import GetSchema, SetSchema
 
 CONFIG_FILE = os.path.join(
     os.path.dirname(os.path.realpath(__file__)),
@@ -20,6 +28,23 @@ CONFIG_FILE = os.path.join(
 
 DEFAULT_TEST_SCHEMA = "test_schema"
 
+# modules using syntax or libraries of newer Python versions
+collect_ignore = []
+if sys.version_info < (3, 7):
+    collect_ignore.append("test_locality_asyncio.py")
+
+
+@compiles(GetSchema, "sqlite")
+def _sqlite_get_schema(element, compiler, **kw):
+    """SQLite cannot switch schemas, make the get schema statement a harmless
+    stand-in so that the context manager can run on SQLite in tests."""
+    return "SELECT 'main'"
+
+@compiles(SetSchema, "sqlite")
+def _sqlite_set_schema(element, compiler, **kw):
+    """See :func:`_sqlite_get_schema`."""
+    return "SELECT '{0}'".format(element.schema)
+
 class DbConfig(object):
 
     @classmethod
@@ -297,3 +322,59 @@ def maintain_oracle_test_schema(oracle_engine, oracle_schema1):
     clear_event = execute_sql_on_connection(oracle_engine, set_schema_sql)
     yield
     clear_event()
+
+
+@pytest.fixture(scope="session")
+def engine():
+    return create_engine('sqlite://')
+
+def _mock_session(engine):
+    """Return an sqlite session where get and set schema execution is mocked
+    out."""
+    session = Session(engine)
+    original_execute = session.execute
+    class GetSchemaResult:
+        def scalar(self):
+            return "default_schema"
+
+    def execute(stmt, *args, **kwargs):
+        if isinstance(stmt, GetSchema):
+            return GetSchemaResult()
+        elif isinstance(stmt, SetSchema):
+            return original_execute("select 1")
+        else:
+            return original_execute(stmt, *args, **kwargs)
+
+    patcher = mock.patch.object(session, "execute", autospec=True, side_effect=execute)
+    return session, patcher
+
+@pytest.yield_fixture
+def mock_session(engine):
+    session, patcher = _mock_session(engine)
+    patcher.start()
+    yield session
+    patcher.stop()
+    session.close()
+
+@pytest.yield_fixture
+def mock_session2(engine):
+    session, patcher = _mock_session(engine)
+    patcher.start()
+    yield session
+    patcher.stop()
+    session.close()
+
+@pytest.fixture(scope="session")
+def Model(engine):
+    from sqlalchemy import Column, Integer
+    from sqlalchemy.ext.declarative import declarative_base
+
+    Base = declarative_base()
+
+    class Model(Base):
+        __tablename__ = "model"
+        id = Column(Integer, primary_key=True)
+
+    Base.metadata.create_all(engine)
+    # no cleanup needed, sqlite in-memory destroyed on test exit
+    return Model
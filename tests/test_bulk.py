@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Test writing rows grouped by schema.
+"""
+import pytest
+from sqlalchemy import create_engine, event, Column, Integer
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+
+from sqlalchemy_sqlschema.bulk import bulk_write_by_schema
+
+Base = declarative_base()
+
+
+class Order(Base):
+    __tablename__ = "orders"
+    id = Column(Integer, primary_key=True)
+    amount = Column(Integer)
+
+
+@pytest.yield_fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    session.statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        session.statements.append((statement, executemany))
+    yield session
+    session.close()
+
+
+def test_insert(session):
+    rows = [{"tenant": "tenant{0}".format(i % 2), "id": i, "amount": i}
+            for i in range(5)]
+    counts = bulk_write_by_schema(session, Order, rows, "tenant",
+                                  chunk_size=2)
+    assert list(counts.items()) == [("tenant0", 3), ("tenant1", 2)]
+    # the rows are not modified
+    assert "tenant" in rows[0]
+    assert session.statements == [
+        ("SELECT 'main'", False),
+        ("SELECT 'tenant0'", False),
+        ("INSERT INTO orders (id, amount) VALUES (?, ?)", True),
+        ("INSERT INTO orders (id, amount) VALUES (?, ?)", False),
+        ("SELECT 'tenant1'", False),
+        ("INSERT INTO orders (id, amount) VALUES (?, ?)", True),
+        ("SELECT 'main'", False),
+    ]
+    assert session.query(Order).count() == 5
+
+
+def test_update_with_callable_key(session):
+    session.add_all([Order(id=1, amount=1), Order(id=2, amount=2)])
+    session.flush()
+    rows = [{"id": 1, "amount": 10}, {"id": 2, "amount": 20}]
+    counts = bulk_write_by_schema(session, Order, rows,
+                                  lambda row: "tenant1", update=True)
+    assert counts == {"tenant1": 2}
+    assert sorted(amount for amount, in session.query(Order.amount)) == \
+        [10, 20]
+
+
+def test_no_rows(session):
+    assert bulk_write_by_schema(session, Order, [], "tenant") == {}
+    assert session.statements == []
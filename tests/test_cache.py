@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Test the schema-partitioned result cache, against a SQLite database where the
+schema switch is a stand-in.
+"""
+try:
+    from unittest import mock
+except:
+    import mock
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from sqlalchemy_sqlschema import maintain_schema
+from sqlalchemy_sqlschema.cache import SchemaResultCache
+
+
+@pytest.yield_fixture
+def session(engine, Model):
+    session = Session(engine)
+    session.add_all([Model(id=20), Model(id=21)])
+    session.commit()
+    with mock.patch.object(session, "execute",
+                           side_effect=session.execute) as execute:
+        yield session
+    session.rollback()
+    session.query(Model).filter(Model.id.in_([20, 21])).delete(
+        synchronize_session=False)
+    session.commit()
+    session.close()
+
+
+def executed(session):
+    """Number of executed statements, excluding the schema switches"""
+    return len([c for c in session.execute.call_args_list
+                if "SCHEMA" not in str(c[0][0])])
+
+
+def test_cached_per_schema(session, Model):
+    cache = SchemaResultCache()
+    stmt = select([Model.__table__]).where(Model.id == 20)
+    with maintain_schema("tenant1", session):
+        assert cache.execute(session, stmt) == [(20,)]
+        assert cache.execute(session, stmt) == [(20,)]
+        assert executed(session) == 1
+        # different bound values are cached separately
+        other = select([Model.__table__]).where(Model.id == 21)
+        assert cache.execute(session, other) == [(21,)]
+        assert executed(session) == 2
+    with maintain_schema("tenant2", session):
+        cache.execute(session, stmt)
+        assert executed(session) == 3
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    # not cached outside of maintain_schema
+    cache.execute(session, stmt)
+    cache.execute(session, stmt)
+    assert executed(session) == 5
+    assert len(cache) == 3
+
+
+def test_params(session, Model):
+    cache = SchemaResultCache()
+    stmt = text("SELECT id FROM model WHERE id = :id")
+    with maintain_schema("tenant1", session):
+        assert cache.execute(session, stmt, {"id": 20}) == [(20,)]
+        assert cache.execute(session, stmt, {"id": 21}) == [(21,)]
+        assert cache.execute(session, stmt, {"id": 20}) == [(20,)]
+    assert executed(session) == 2
+
+
+def test_lru_eviction(session, Model):
+    cache = SchemaResultCache(maxsize=2)
+    stmts = [select([Model.__table__]).where(Model.id == i)
+             for i in range(3)]
+    with maintain_schema("tenant1", session):
+        cache.execute(session, stmts[0])
+        cache.execute(session, stmts[1])
+        # stmts[0] becomes the most recently used
+        cache.execute(session, stmts[0])
+        cache.execute(session, stmts[2])
+        assert len(cache) == 2
+        assert executed(session) == 3
+        cache.execute(session, stmts[0])
+        assert executed(session) == 3
+        cache.execute(session, stmts[1])
+        assert executed(session) == 4
+
+
+def test_invalidate(session, Model):
+    cache = SchemaResultCache()
+    table_stmt = select([Model.__table__])
+    text_stmt = text("SELECT 1")
+    for schema in ("tenant1", "tenant2"):
+        with maintain_schema(schema, session):
+            cache.execute(session, table_stmt)
+            cache.execute(session, text_stmt)
+    assert len(cache) == 4
+
+    cache.invalidate("tenant1", Model.__table__)
+    assert len(cache) == 3
+    cache.invalidate("tenant1", "model")
+    assert len(cache) == 3
+    cache.invalidate("tenant2")
+    assert len(cache) == 1
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Test deferring the schema restore to the next user of the connection.
+"""
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from sqlalchemy_sqlschema import maintain_schema
+from sqlalchemy_sqlschema.deferred import (
+    enable_deferred_restore, pending_restore)
+from sqlalchemy_sqlschema.sql import set_schema
+from sqlalchemy_sqlschema.tracking import tracked_schema
+
+
+class Statements(list):
+    """The statements executed on :attr:`engine`, which defers restores."""
+
+    def __init__(self):
+        super(Statements, self).__init__()
+        self.engine = create_engine("sqlite://")
+        enable_deferred_restore(self.engine)
+        enable_deferred_restore(self.engine)
+        event.listen(self.engine, "before_cursor_execute", self.record)
+
+    def record(self, conn, cursor, statement, *args):
+        self.append(statement)
+
+
+@pytest.fixture
+def statements():
+    return Statements()
+
+
+def test_exit_executes_nothing(statements):
+    session = Session(bind=statements.engine)
+    with maintain_schema("tenant1", session):
+        session.execute("SELECT 1")
+    assert statements == ["SELECT 'main'", "SELECT 'tenant1'", "SELECT 1"]
+    assert pending_restore(session.connection()) == "main"
+    session.close()
+
+
+def test_nested_exit_restores(statements):
+    session = Session(bind=statements.engine)
+    with maintain_schema("tenant1", session):
+        with maintain_schema("tenant2", session):
+            pass
+        assert statements[-1] == "SELECT 'tenant1'"
+        assert pending_restore(session.connection()) is None
+    session.close()
+
+
+def test_same_schema_not_set_again(statements):
+    session = Session(bind=statements.engine)
+    with maintain_schema("tenant1", session):
+        pass
+    session.commit()
+    del statements[:]
+    other = Session(bind=statements.engine)
+    with maintain_schema("tenant1", other):
+        # the connection is taken over, no restore before the statement
+        other.execute("SELECT 1")
+    assert statements == ["SELECT 1"]
+    other.close()
+
+
+def test_other_schema_set(statements):
+    session = Session(bind=statements.engine)
+    with maintain_schema("tenant1", session):
+        pass
+    session.commit()
+    del statements[:]
+    other = Session(bind=statements.engine)
+    with maintain_schema("tenant2", other):
+        other.execute("SELECT 1")
+    assert statements == ["SELECT 'tenant2'", "SELECT 1"]
+    other.close()
+
+
+def test_restored_before_other_statements(statements):
+    session = Session(bind=statements.engine)
+    with maintain_schema("tenant1", session):
+        pass
+    session.execute("SELECT 1")
+    assert statements[-2:] == ["SELECT 'main'", "SELECT 1"]
+    assert tracked_schema(session.connection()) == "main"
+    session.execute("SELECT 2")
+    assert statements[-2:] == ["SELECT 1", "SELECT 2"]
+    session.close()
+
+
+def test_restored_for_core_users(statements):
+    session = Session(bind=statements.engine)
+    with maintain_schema("tenant1", session):
+        pass
+    session.commit()
+    with statements.engine.connect() as conn:
+        conn.execute("SELECT 1")
+    assert statements[-2:] == ["SELECT 'main'", "SELECT 1"]
+
+
+def test_set_schema_takes_over(statements):
+    session = Session(bind=statements.engine)
+    with maintain_schema("tenant1", session):
+        pass
+    session.execute(set_schema("tenant2"))
+    session.execute("SELECT 1")
+    assert statements[-2:] == ["SELECT 'tenant2'", "SELECT 1"]
+    session.close()
+
+
+def test_not_deferred_by_default():
+    engine = create_engine("sqlite://")
+    session = Session(bind=engine)
+    with maintain_schema("tenant1", session):
+        pass
+    assert pending_restore(session.connection()) is None
+    session.close()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Test routing schemas to engines with the tenant directory.
+"""
+import json
+
+try:
+    from unittest import mock
+except:
+    import mock
+import pytest
+from sqlalchemy import create_engine, event, MetaData, Table, Column, String
+from sqlalchemy.orm import sessionmaker
+
+from sqlalchemy_sqlschema import maintain_schema, active_schema
+from sqlalchemy_sqlschema.directory import TenantDirectory, UnknownSchemaError
+from sqlalchemy_sqlschema.maintain_schema import SchemaContextManager
+
+
+def recording_engine():
+    engine = create_engine("sqlite://")
+    engine.statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, *args):
+        engine.statements.append(statement)
+    return engine
+
+
+@pytest.fixture
+def engines():
+    return {"eu1": recording_engine(), "us1": recording_engine()}
+
+
+def test_from_table(engines):
+    control = create_engine("sqlite://")
+    tenants = Table("tenants", MetaData(), Column("name", String),
+                    Column("shard", String))
+    tenants.create(control)
+    control.execute(tenants.insert(), [{"name": "tenant1", "shard": "eu1"},
+                                       {"name": "tenant2", "shard": "us1"}])
+    directory = TenantDirectory.from_table(control, tenants, engines,
+                                           schema_column="name")
+    assert directory.get_bind("tenant1") is engines["eu1"]
+    assert directory.get_bind("tenant2") is engines["us1"]
+
+
+def test_from_file(tmpdir, engines):
+    path = tmpdir.join("tenants.json")
+    path.write(json.dumps({"tenant1": "us1"}))
+    directory = TenantDirectory.from_file(str(path), engines)
+    assert directory.get_bind("tenant1") is engines["us1"]
+
+
+def test_ttl(engines):
+    loader = mock.Mock(return_value={"tenant1": "eu1"})
+    directory = TenantDirectory(loader, engines, ttl=10)
+    with mock.patch("sqlalchemy_sqlschema.directory.timer",
+                    return_value=100.0) as timer:
+        directory.shard("tenant1")
+        directory.shard("tenant1")
+        assert loader.call_count == 1
+        timer.return_value = 111.0
+        loader.return_value = {"tenant1": "us1"}
+        assert directory.shard("tenant1") == "us1"
+        assert loader.call_count == 2
+        directory.invalidate()
+        directory.shard("tenant1")
+        assert loader.call_count == 3
+
+
+def test_unknown_schema(engines):
+    loader = mock.Mock(return_value={"tenant1": "eu1"})
+    directory = TenantDirectory(loader, engines, miss_interval=5)
+    with mock.patch("sqlalchemy_sqlschema.directory.timer",
+                    return_value=100.0) as timer:
+        with pytest.raises(UnknownSchemaError):
+            directory.shard("tenant2")
+        assert loader.call_count == 1
+        # a new tenant is found once the miss interval passed
+        loader.return_value = {"tenant1": "eu1", "tenant2": "us1"}
+        timer.return_value = 106.0
+        assert directory.shard("tenant2") == "us1"
+        assert loader.call_count == 2
+
+
+def test_maintain_schema_routes_bind(engines):
+    eu1, us1 = engines["eu1"], engines["us1"]
+    directory = TenantDirectory(
+        lambda: {"tenant1": "eu1", "tenant2": "us1"}, engines)
+    session = sessionmaker(bind=eu1)()
+    with maintain_schema("tenant1", session, directory=directory):
+        assert session.bind is eu1
+        with maintain_schema("tenant2", session, directory=directory):
+            assert session.bind is us1
+            assert active_schema(session) == "tenant2"
+            session.execute("SELECT 1")
+        assert session.bind is eu1
+        assert active_schema(session) == "tenant1"
+        # the listener of tenant1 is back on the new transaction
+        session.rollback()
+        session.execute("SELECT 2")
+    assert session.bind is eu1
+    assert eu1.statements == ["SELECT 'main'", "SELECT 'tenant1'",
+                              "SELECT 'tenant1'", "SELECT 2", "SELECT 'main'"]
+    assert us1.statements == ["SELECT 'main'", "SELECT 'tenant2'", "SELECT 1",
+                              "SELECT 'main'"]
+    session.close()
+
+
+def failing_set_schema(failing):
+    """Patch the context manager to fail setting the schema ``failing``."""
+    original = SchemaContextManager._execute_set_schema
+
+    def execute_set_schema(self, schema):
+        if schema == failing:
+            raise ValueError(schema)
+        original(self, schema)
+    return mock.patch.object(SchemaContextManager, "_execute_set_schema",
+                             execute_set_schema)
+
+
+@pytest.mark.parametrize("failing", ["tenant2", "main"])
+def test_route_undone_on_failure(engines, failing):
+    eu1, us1 = engines["eu1"], engines["us1"]
+    directory = TenantDirectory(
+        lambda: {"tenant1": "eu1", "tenant2": "us1"}, engines)
+    session = sessionmaker(bind=eu1)()
+    with maintain_schema("tenant1", session, directory=directory):
+        with pytest.raises(ValueError):
+            with failing_set_schema(failing):
+                # fails on enter, or on exit while an exception propagates
+                with maintain_schema("tenant2", session, directory=directory):
+                    raise ValueError()
+        assert session.bind is eu1
+        assert active_schema(session) == "tenant1"
+        assert len(SchemaContextManager._get_schema_stack(session)) == 2
+        del eu1.statements[:]
+        session.rollback()
+        session.execute("SELECT 2")
+        assert eu1.statements == ["SELECT 'tenant1'", "SELECT 2"]
+    session.close()
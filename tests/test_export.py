@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Test exporting a table from many schemas.
+"""
+import io
+
+try:
+    from unittest import mock
+except:
+    import mock
+import pytest
+from sqlalchemy import (
+    create_engine, MetaData, Table, Column, Integer, String, Boolean)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from sqlalchemy_sqlschema.export import (
+    iter_export, export, _copy_to, _export_query, _csv_field)
+
+metadata = MetaData()
+orders = Table("orders", metadata, Column("id", Integer),
+               Column("amount", Integer))
+
+
+@pytest.yield_fixture
+def session():
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    engine.execute(orders.insert(), [{"id": i, "amount": i * 10}
+                                     for i in range(5)])
+    session = Session(engine)
+    yield session
+    session.close()
+
+
+def test_iter_export(session):
+    sink = io.StringIO() if str is not bytes else io.BytesIO()
+    exported = iter_export(session, ["tenant1", "tenant2"], orders, sink,
+                           tag="tenant", header=True, chunk_size=2)
+    assert next(exported) == ("tenant1", 5)
+    assert sink.getvalue().splitlines()[:3] == [
+        "tenant,id,amount", "tenant1,0,0", "tenant1,1,10"]
+    assert list(exported) == [("tenant2", 5)]
+    lines = sink.getvalue().splitlines()
+    assert len(lines) == 11
+    assert lines[-1] == "tenant2,4,40"
+
+
+def test_export(session):
+    sink = io.StringIO() if str is not bytes else io.BytesIO()
+    assert export(session, ["tenant1"], orders, sink) == {"tenant1": 5}
+    assert sink.getvalue().splitlines()[0] == "0,0"
+
+
+def test_copy_to():
+    cursor = mock.Mock(rowcount=5)
+    connection = mock.Mock(dialect=postgresql.dialect())
+    connection.connection.cursor.return_value = cursor
+    sink = object()
+    query = _export_query(orders, "tenant1", "tenant")
+    assert _copy_to(connection, query, sink) == 5
+    cursor.copy_expert.assert_called_once_with(
+        "COPY (SELECT 'tenant1' AS tenant, orders.id, orders.amount \n"
+        "FROM orders) TO STDOUT WITH CSV", sink)
+    assert cursor.close.called
+
+
+@pytest.mark.parametrize("value, field", [
+    (None, ""),
+    ("", '""'),
+    ("plain", "plain"),
+    ('a "b", c', '"a ""b"", c"'),
+    ("two\nlines", '"two\nlines"'),
+    ("\\.", '"\\."'),
+    (True, "t"),
+    (False, "f"),
+    (1.5, "1.5"),
+])
+def test_csv_field(value, field):
+    assert _csv_field(value) == field
+
+
+def test_export_nulls(session):
+    notes = Table("notes", MetaData(), Column("id", Integer),
+                  Column("text", String), Column("done", Boolean))
+    notes.create(session.bind)
+    session.bind.execute(notes.insert(), [
+        {"id": 1, "text": None, "done": True},
+        {"id": 2, "text": "", "done": False}])
+    sink = io.StringIO() if str is not bytes else io.BytesIO()
+    export(session, ["tenant1"], notes, sink)
+    assert sink.getvalue() == '1,,t\n2,"",f\n'
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Test the schema-qualified identity keys of SchemaIdentitySession, against a
+SQLite database where the schema switch is a stand-in.
+"""
+import pytest
+from sqlalchemy import inspect
+
+from sqlalchemy_sqlschema import maintain_schema
+
+SchemaIdentitySession = pytest.importorskip(
+    "sqlalchemy_sqlschema.identity").SchemaIdentitySession
+
+
+@pytest.yield_fixture
+def session(engine, Model):
+    session = SchemaIdentitySession(engine)
+    session.add(Model(id=10))
+    session.commit()
+    yield session
+    session.query(Model).filter_by(id=10).delete()
+    session.commit()
+    session.close()
+
+
+def test_same_key_different_schemas(session, Model):
+    with maintain_schema("tenant1", session):
+        obj1 = session.query(Model).filter_by(id=10).one()
+        assert session.query(Model).get(10) is obj1
+    with maintain_schema("tenant2", session):
+        obj2 = session.query(Model).get(10)
+        assert session.query(Model).filter_by(id=10).one() is obj2
+
+    assert obj1 is not obj2
+    assert inspect(obj1).key[2] == "tenant1"
+    assert inspect(obj2).key[2] == "tenant2"
+    # the identity map keeps the objects of both schemas
+    assert inspect(obj1).key in session.identity_map
+    assert inspect(obj2).key in session.identity_map
+
+
+def test_pending_identity(session, Model):
+    with maintain_schema("tenant1", session):
+        obj = Model(id=11)
+        session.add(obj)
+        session.flush()
+        assert inspect(obj).key[2] == "tenant1"
+        assert session.query(Model).get(11) is obj
+        session.rollback()
+
+
+def test_no_schema(session, Model):
+    obj = session.query(Model).get(10)
+    assert inspect(obj).key[2] is None
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Test the memory-mapped schema index.
+"""
+import os
+
+import pytest
+
+from sqlalchemy_sqlschema.directory import TenantDirectory
+from sqlalchemy_sqlschema.index import SchemaIndex, build_index
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join("tenants.idx"))
+
+
+def test_lookup(path):
+    mapping = dict(("tenant{0}".format(i), "shard{0}".format(i % 7))
+                   for i in range(1000))
+    mapping[u"t\xe9nant"] = u"\xe9u1"
+    build_index(path, mapping)
+    index = SchemaIndex(path)
+    assert len(index) == 1001
+    for key, value in mapping.items():
+        assert index[key] == value
+    assert index.get("missing") is None
+    assert "tenant999" in index
+    assert "tenant1000" not in index
+    with pytest.raises(KeyError):
+        index["missing"]
+    assert sorted(index) == sorted(mapping)
+    index.close()
+
+
+def test_empty(path):
+    build_index(path, {})
+    index = SchemaIndex(path)
+    assert len(index) == 0
+    assert index.get("tenant1") is None
+
+
+def test_not_an_index(path):
+    with open(path, "wb") as index_file:
+        index_file.write(b"\0" * 64)
+    with pytest.raises(ValueError):
+        SchemaIndex(path)
+
+
+def test_truncated(path):
+    with open(path, "wb") as index_file:
+        index_file.write(b"SQLS")
+    with pytest.raises(ValueError):
+        SchemaIndex(path)
+    build_index(path, {"tenant1": "eu1", "tenant2": "us1"})
+    with open(path, "r+b") as index_file:
+        index_file.truncate(16)
+    with pytest.raises(ValueError):
+        SchemaIndex(path)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX permissions")
+def test_file_mode(path):
+    umask = os.umask(0o027)
+    try:
+        build_index(path, {"tenant1": "eu1"})
+    finally:
+        os.umask(umask)
+    assert os.stat(path).st_mode & 0o777 == 0o640
+
+
+def test_atomic_swap(path, tmpdir):
+    build_index(path, {"tenant1": "eu1"})
+    index = SchemaIndex(path)
+    assert not index.is_stale()
+    build_index(path, {"tenant1": "us1"})
+    # the opened index keeps reading the previous file
+    assert index["tenant1"] == "eu1"
+    assert index.is_stale()
+    assert SchemaIndex(path)["tenant1"] == "us1"
+    # no temporary files are left behind
+    assert os.listdir(str(tmpdir)) == ["tenants.idx"]
+
+
+def test_directory_from_index(path):
+    engines = {"eu1": object(), "us1": object()}
+    build_index(path, {"tenant1": "eu1"})
+    directory = TenantDirectory.from_index(path, engines, ttl=None)
+    assert directory.get_bind("tenant1") is engines["eu1"]
+    build_index(path, {"tenant1": "us1"})
+    directory.invalidate()
+    assert directory.get_bind("tenant1") is engines["us1"]
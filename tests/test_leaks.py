@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Test detecting connections returned to the pool with a non-default schema.
+"""
+import logging
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from sqlalchemy_sqlschema import maintain_schema
+from sqlalchemy_sqlschema.deferred import (
+    enable_deferred_restore, pending_restore)
+from sqlalchemy_sqlschema.leaks import detect_leaks
+from sqlalchemy_sqlschema.sql import set_schema
+from sqlalchemy_sqlschema.streaming import track_streaming_results
+from sqlalchemy_sqlschema.tracking import tracked_schema
+from sqlalchemy_sqlschema.util import sqlalchemy_version
+
+
+def leak(engine, schema):
+    with engine.connect() as conn:
+        with conn.begin():
+            conn.execute(set_schema(schema))
+
+
+def test_detect_leaks():
+    engine = create_engine("sqlite://")
+    detector = detect_leaks(engine)
+    with engine.connect() as conn:
+        # the default schema is queried on connect
+        assert tracked_schema(conn) == "main"
+        conn.execute(set_schema("tenant1"))
+    # not committed, reverted by the pool reset
+    assert detector.checkin_leaks == 0
+
+    leak(engine, "tenant1")
+    assert detector.stats() == {"checkin_leaks": 1, "checkout_leaks": 0,
+                                "repairs": 0, "by_schema": {"tenant1": 1}}
+    with engine.connect() as conn:
+        assert tracked_schema(conn) == "tenant1"
+    assert detector.checkout_leaks == 1
+    detector.remove()
+
+
+def test_repair_and_log(caplog):
+    engine = create_engine("sqlite://")
+    statements = []
+
+    @event.listens_for(engine, "connect")
+    def record_raw(dbapi_connection, connection_record):
+        dbapi_connection.set_trace_callback(statements.append)
+    detector = detect_leaks(engine, default_schema="main", log=True,
+                            repair=True)
+    with caplog.at_level(logging.WARNING, logger="sqlalchemy_sqlschema"):
+        leak(engine, "tenant1")
+    assert "'tenant1' instead of 'main'" in caplog.text
+    assert statements[-1] == "SELECT 'main'"
+    assert detector.repairs == 1
+    with engine.connect() as conn:
+        assert tracked_schema(conn) == "main"
+    assert detector.checkout_leaks == 0
+    detector.remove()
+
+
+def test_deferred_restore_not_leaking():
+    engine = create_engine("sqlite://")
+    enable_deferred_restore(engine)
+    detector = detect_leaks(engine, repair=True)
+    session = Session(bind=engine)
+    with maintain_schema("tenant1", session):
+        pass
+    session.commit()
+    session.close()
+    with engine.connect() as conn:
+        assert tracked_schema(conn) == "tenant1"
+        assert pending_restore(conn) == "main"
+    assert detector.stats() == {"checkin_leaks": 0, "checkout_leaks": 0,
+                                "repairs": 0, "by_schema": {}}
+    detector.remove()
+
+
+@pytest.mark.skipif(not (1, 0) <= sqlalchemy_version() < (1, 4),
+                    reason="Tracking streaming results requires SQLAlchemy "
+                           "1.0 to 1.3")
+def test_streaming_restore_not_leaking():
+    engine = create_engine("sqlite://")
+    # checked in before the streaming restore runs
+    detector = detect_leaks(engine)
+    track_streaming_results(engine)
+    session = Session(bind=engine)
+    with maintain_schema("tenant1", session):
+        result = session.connection().execution_options(
+            stream_results=True).execute("SELECT 1")
+    session.commit()
+    session.close()
+    with engine.connect() as conn:
+        assert tracked_schema(conn) == "main"
+    assert detector.stats() == {"checkin_leaks": 0, "checkout_leaks": 0,
+                                "repairs": 0, "by_schema": {}}
+    result.close()
+    detector.remove()
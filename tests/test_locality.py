@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Test the selection of the context-local storage backend
+"""
+import sys
+import threading
+try:
+    from unittest import mock
+except:
+    import mock
+import pytest
+
+from sqlalchemy_sqlschema import set_locality_backend
+from sqlalchemy_sqlschema.maintain_schema import SchemaContextManager
+from sqlalchemy_sqlschema.locality import (
+    detect_backend, create_local, ContextLocal)
+
+
+@pytest.yield_fixture
+def restore_local():
+    local = SchemaContextManager._local
+    yield
+    SchemaContextManager._local = local
+
+
+def test_detect_unpatched():
+    with mock.patch.dict(sys.modules, {"gevent.monkey": None,
+                                       "eventlet.patcher": None}):
+        assert detect_backend() == "threading"
+
+
+def test_detect_installed_but_unpatched():
+    gevent_monkey = mock.Mock(**{"is_module_patched.return_value": False})
+    with mock.patch.dict(sys.modules, {"gevent.monkey": gevent_monkey}):
+        assert detect_backend() == "threading"
+    gevent_monkey.is_module_patched.assert_called_once_with("threading")
+
+
+def test_detect_patched():
+    gevent_monkey = mock.Mock(**{"is_module_patched.return_value": True})
+    with mock.patch.dict(sys.modules, {"gevent.monkey": gevent_monkey}):
+        assert detect_backend() == "gevent"
+    eventlet_patcher = mock.Mock(**{"is_monkey_patched.return_value": True})
+    with mock.patch.dict(sys.modules, {"gevent.monkey": None,
+                                       "eventlet.patcher": eventlet_patcher}):
+        assert detect_backend() == "eventlet"
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_local("twisted")
+
+
+def test_set_backend(restore_local):
+    set_locality_backend("threading")
+    assert isinstance(SchemaContextManager._local, threading.local)
+    session = object()
+    stack = SchemaContextManager._get_schema_stack(session)
+    assert SchemaContextManager._get_schema_stack(session) is stack
+
+    set_locality_backend()
+    assert SchemaContextManager._get_schema_stack(session) is not stack
+
+
+def test_context_local():
+    contextvars = pytest.importorskip("contextvars")
+    local = ContextLocal()
+    assert not hasattr(local, "value")
+    local.value = 1
+    assert local.value == 1
+
+    def in_new_context():
+        assert not hasattr(local, "value")
+        local.value = 2
+        return local.value
+    assert contextvars.Context().run(in_new_context) == 2
+    assert local.value == 1
+
+
+def test_context_local_copied_context():
+    contextvars = pytest.importorskip("contextvars")
+    local = ContextLocal()
+    local.value = 1
+
+    def in_copied_context():
+        assert local.value == 1
+        local.value = 2
+        local.other = 3
+    contextvars.copy_context().run(in_copied_context)
+    assert local.value == 1
+    assert not hasattr(local, "other")
+
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Test the contextvars locality backend with asyncio tasks. Requires Python 3.7
+or higher, see conftest.py.
+"""
+import asyncio
+
+import pytest
+
+from sqlalchemy_sqlschema import set_locality_backend
+from sqlalchemy_sqlschema.maintain_schema import SchemaContextManager
+
+
+@pytest.yield_fixture
+def restore_local():
+    local = SchemaContextManager._local
+    yield
+    SchemaContextManager._local = local
+
+
+def test_schema_stacks_local_to_tasks(restore_local):
+    set_locality_backend("contextvars")
+    session = object()
+    # the stacks are touched before the tasks copy the context
+    parent = SchemaContextManager._get_schema_stack(session)
+    parent.push(("parent", None))
+
+    async def task(schema):
+        stack = SchemaContextManager._get_schema_stack(session)
+        assert stack.top is None
+        stack.push((schema, None))
+        await asyncio.sleep(0)
+        return list(stack), SchemaContextManager._local.schema_stacks
+
+    async def main():
+        return await asyncio.gather(task("tenant1"), task("tenant2"))
+    (stack1, stacks1), (stack2, stacks2) = asyncio.run(main())
+    assert stack1 == [("tenant1", None)]
+    assert stack2 == [("tenant2", None)]
+    assert stacks1 is not stacks2
+    assert list(parent) == [("parent", None)]
@@ -7,11 +7,10 @@ try:
 except:
     import mock
 import pytest
-from sqlalchemy import create_engine
 from sqlalchemy.orm.exc import FlushError
 from sqlalchemy.orm import Session, scoped_session
 
-from sqlalchemy_sqlschema import maintain_schema
+from sqlalchemy_sqlschema import maintain_schema, active_schema
 from sqlalchemy_sqlschema.maintain_schema import SchemaContextManager
 from sqlalchemy_sqlschema.sql import GetSchema, SetSchema
 
@@ -35,62 +34,6 @@ def test_decorator():
         assert m.__exit__.call_count == 1
 
 
-@pytest.fixture(scope="session")
-def engine():
-    return create_engine('sqlite://')
-
-def _mock_session(engine):
-    """Return an sqlite session where get and set schema execution is mocked
-    out."""
-    session = Session(engine)
-    original_execute = session.execute
-    class GetSchemaResult:
-        def scalar(self):
-            return "default_schema"
-
-    def execute(stmt, *args, **kwargs):
-        if isinstance(stmt, GetSchema):
-            return GetSchemaResult()
-        elif isinstance(stmt, SetSchema):
-            return original_execute("select 1")
-        else:
-            return original_execute(stmt, *args, **kwargs)
-
-    patcher = mock.patch.object(session, "execute", autospec=True, side_effect=execute)
-    return session, patcher
-
-@pytest.yield_fixture
-def mock_session(engine):
-    session, patcher = _mock_session(engine)
-    patcher.start()
-    yield session
-    patcher.stop()
-    session.close()
-
-@pytest.yield_fixture
-def mock_session2(engine):
-    session, patcher = _mock_session(engine)
-    patcher.start()
-    yield session
-    patcher.stop()
-    session.close()
-
-@pytest.fixture(scope="session")
-def Model(engine):
-    from sqlalchemy import Column, Integer
-    from sqlalchemy.ext.declarative import declarative_base
-
-    Base = declarative_base()
-
-    class Model(Base):
-        __tablename__ = "model"
-        id = Column(Integer, primary_key=True)
-
-    Base.metadata.create_all(engine)
-    # no cleanup needed, sqlite in-memory destroyed on test exit
-    return Model
-
-
 class TestSessionMaintainSchema(object):
 
     @pytest.yield_fixture(autouse=True)
@@ -311,7 +254,7 @@ def scoped_ses(engine):
         return d["id"]
 
     def create_session():
-        return _mock_session(engine)
+        return Session(engine)
     return scoped_session(create_session, scopefunc=session_id)
 
 def test_get_schema_stack_scoped_session(scoped_ses):
@@ -322,3 +265,159 @@ def test_get_schema_stack_scoped_session(scoped_ses):
     stack = SchemaContextManager._get_schema_stack(scoped_ses)
     stack2 = SchemaContextManager._get_schema_stack(scoped_ses)
     assert stack is not stack2
+
+
+def test_active_schema(mock_session):
+    """Test that the active schema is read from the schema stack"""
+    assert active_schema(mock_session) is None
+    with maintain_schema("schema2", mock_session):
+        assert active_schema(mock_session) == "schema2"
+        with maintain_schema("schema3", mock_session):
+            assert active_schema(mock_session) == "schema3"
+        assert active_schema(mock_session) == "schema2"
+    # the schema found on entry is not maintained by the context manager
+    assert active_schema(mock_session) is None
+
+
+def test_import_is_lazy():
+    """Test that importing the package does not import the ORM, gevent or
+    six"""
+    import subprocess
+    import sys
+    output = subprocess.check_output([sys.executable, "-c", (
+        "import sys, sqlalchemy_sqlschema;"
+        "print([m for m in ('sqlalchemy.orm', 'gevent', 'six') "
+        "if m in sys.modules])")])
+    assert output.decode().strip() == "[]"
+
+
+class TestSticky(object):
+
+    @pytest.fixture(autouse=True)
+    def sticky_engine(self):
+        from sqlalchemy import create_engine, event
+        from sqlalchemy.orm import Session
+        self.engine = create_engine("sqlite://")
+        self.statements = []
+        self.checkouts = []
+
+        @event.listens_for(self.engine, "before_cursor_execute")
+        def record(conn, cursor, statement, *args):
+            self.statements.append(statement)
+
+        @event.listens_for(self.engine, "checkout")
+        def checkout(*args):
+            self.checkouts.append(args)
+        self.session = Session(self.engine)
+
+    def test_schema_set_once(self):
+        """Test that the schema is set once for all the transactions of a
+        sticky context"""
+        with maintain_schema("schema2", self.session, sticky=True):
+            for _ in range(3):
+                self.session.execute("SELECT 1")
+                self.session.commit()
+        assert self.statements == ["SELECT 'main'", "SELECT 'schema2'"] + \
+            ["SELECT 1"] * 3 + ["SELECT 'main'"]
+        assert len(self.checkouts) == 1
+        assert self.session.bind is self.engine
+        self.session.close()
+
+    def test_schema_set_again_after_rollback(self):
+        """Test that the schema is set again if a rollback may have reverted
+        it"""
+        with maintain_schema("schema2", self.session, sticky=True):
+            self.session.rollback()
+            self.session.execute("SELECT 1")
+            self.session.commit()
+        assert self.statements == ["SELECT 'main'", "SELECT 'schema2'",
+                                   "SELECT 'schema2'", "SELECT 1",
+                                   "SELECT 'main'"]
+        self.session.close()
+
+    def test_nested(self):
+        """Test that the outermost sticky context pins the connection"""
+        with maintain_schema("schema2", self.session, sticky=True):
+            pinned = self.session.bind
+            with maintain_schema("schema3", self.session, sticky=True):
+                assert self.session.bind is pinned
+                self.session.commit()
+            assert self.session.bind is pinned
+        assert self.session.bind is self.engine
+        assert len(self.checkouts) == 1
+        self.session.close()
+
+    def test_open_transaction_closes_connection_later(self):
+        """Test that a transaction left open by a sticky context keeps its
+        connection until it ends"""
+        with maintain_schema("schema2", self.session, sticky=True):
+            pinned = self.session.bind
+        assert self.session.bind is self.engine
+        assert not pinned.closed
+        assert self.session.connection() is pinned
+        self.session.commit()
+        assert pinned.closed
+        self.session.close()
+
+    def test_session_with_connection(self):
+        """Test that a sticky context cannot pin once the session holds a
+        connection"""
+        self.session.execute("SELECT 1")
+        with pytest.raises(ValueError):
+            with maintain_schema("schema2", self.session, sticky=True):
+                pass
+        self.session.close()
+
+    @pytest.mark.parametrize("failing", ["schema2", "main"])
+    def test_connection_released_on_failure(self, failing):
+        """Test that the pinned connection is released when setting or
+        restoring the schema fails"""
+        original = SchemaContextManager._execute_set_schema
+        pinned = []
+
+        def execute_set_schema(cm, schema):
+            pinned.append(cm.session.bind)
+            if schema == failing:
+                raise ValueError(schema)
+            original(cm, schema)
+        with mock.patch.object(SchemaContextManager, "_execute_set_schema",
+                               execute_set_schema):
+            with pytest.raises(ValueError):
+                with maintain_schema("schema2", self.session, sticky=True):
+                    raise ValueError()
+        assert self.session.bind is self.engine
+        assert active_schema(self.session) is None
+        # the pinned connection is closed once its transaction ends
+        assert not pinned[0].closed
+        self.session.rollback()
+        assert pinned[0].closed
+        self.session.close()
+
+
+def test_switch():
+    """Test switching the schema of an entered context"""
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import Session
+    engine = create_engine("sqlite://")
+    statements = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args:
+                 statements.append(statement))
+    session = Session(engine)
+    with maintain_schema("schema1", session) as context:
+        context.switch("schema1")
+        context.switch("schema2")
+        assert active_schema(session) == "schema2"
+        # the listener sets the new schema on new transactions
+        session.rollback()
+        session.execute("SELECT 1")
+        with maintain_schema("schema3", session):
+            with pytest.raises(ValueError):
+                context.switch("schema4")
+        assert active_schema(session) == "schema2"
+    assert active_schema(session) is None
+    assert statements == ["SELECT 'main'", "SELECT 'schema1'",
+                          "SELECT 'schema2'", "SELECT 'schema2'", "SELECT 1",
+                          "SELECT 'schema3'", "SELECT 'schema2'",
+                          "SELECT 'main'"]
+    session.close()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Test the multi-schema migration runner against a SQLite database file.
+"""
+import json
+try:
+    from unittest import mock
+except:
+    import mock
+
+import pytest
+from sqlalchemy import create_engine, event
+
+from sqlalchemy_sqlschema.migrations import (
+    MigrationRunner, Checkpoint, AlembicUpgrade, migration_status,
+    iter_migration_status, _versioned_schemas)
+
+
+def record_upgrade(connection, schema):
+    """Stand-in for an Alembic upgrade"""
+    if schema == "bad":
+        raise ValueError("broken migration")
+    connection.execute("INSERT INTO migrated VALUES (?)", schema)
+
+
+@pytest.fixture
+def db_url(tmpdir):
+    url = "sqlite:///" + str(tmpdir.join("db.sqlite"))
+    create_engine(url).execute("CREATE TABLE migrated (schema VARCHAR)")
+    return url
+
+
+def migrated(db_url):
+    return sorted(row[0] for row in create_engine(db_url).execute(
+        "SELECT schema FROM migrated"))
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_run(db_url, processes):
+    schemas = ["tenant{0}".format(i) for i in range(6)]
+    results = []
+    runner = MigrationRunner(db_url, record_upgrade, processes=processes,
+                             on_result=lambda *args: results.append(args))
+    report = runner.run(schemas + ["bad"])
+
+    assert sorted(report.migrated) == schemas
+    assert list(report.failed) == ["bad"]
+    assert "broken migration" in report.failed["bad"]
+    assert report.skipped == []
+    assert report.throughput > 0
+    assert len(results) == 7
+    assert migrated(db_url) == schemas
+
+
+def test_resume_from_checkpoint(db_url, tmpdir):
+    checkpoint = str(tmpdir.join("checkpoint"))
+    runner = MigrationRunner(db_url, record_upgrade, checkpoint=checkpoint,
+                             processes=0)
+    runner.run(["tenant1", "bad"])
+    # an interrupted run leaves a partial line
+    with open(checkpoint, "a") as f:
+        f.write('{"schema": "ten')
+
+    report = runner.run(["tenant1", "tenant2", "bad"])
+    assert report.skipped == ["tenant1"]
+    assert report.migrated == ["tenant2"]
+    assert list(report.failed) == ["bad"]
+    assert migrated(db_url) == ["tenant1", "tenant2"]
+    assert Checkpoint(checkpoint).completed() == {"tenant1", "tenant2"}
+
+
+def test_checkpoint_failure_after_success(tmpdir):
+    checkpoint = Checkpoint(str(tmpdir.join("checkpoint")))
+    assert checkpoint.completed() == set()
+    checkpoint.record("tenant1", True)
+    checkpoint.record("tenant1", False, "error")
+    assert checkpoint.completed() == set()
+    with open(checkpoint.path) as f:
+        assert json.loads(f.readline()) == \
+               {"schema": "tenant1", "ok": True, "error": None}
+
+
+def test_alembic_upgrade(db_url, tmpdir):
+    pytest.importorskip("alembic")
+    script_location = tmpdir.mkdir("alembic")
+    script_location.mkdir("versions")
+    script_location.join("env.py").write(
+        "from alembic import context\n"
+        "connection = context.config.attributes['connection']\n"
+        "context.configure(connection=connection)\n"
+        "with context.begin_transaction():\n"
+        "    context.run_migrations()\n")
+    script_location.join("script.py.mako").write("")
+    script_location.join("versions", "rev1_.py").write(
+        "from alembic import op\n"
+        "revision = 'rev1'\n"
+        "down_revision = None\n"
+        "def upgrade():\n"
+        "    op.execute('CREATE TABLE upgraded (id INTEGER)')\n")
+    config = tmpdir.join("alembic.ini")
+    config.write("[alembic]\nscript_location = {0}\n".format(script_location))
+
+    report = MigrationRunner(
+        db_url, AlembicUpgrade(str(config)), processes=0).run(["tenant1"])
+    assert report.migrated == ["tenant1"]
+    assert create_engine(db_url).execute(
+        "SELECT version_num FROM alembic_version").scalar() == "rev1"
+
+
+@pytest.fixture
+def status_session():
+    from sqlalchemy.orm import Session
+
+    engine = create_engine("sqlite://")
+    revisions = {"tenant1": ["rev1"], "tenant2": ["rev2"], "tenant3": [],
+                 "tenant4": ["rev2", "rev1"], "unversioned": None}
+    for schema, schema_revisions in revisions.items():
+        engine.execute("ATTACH DATABASE ':memory:' AS {0}".format(schema))
+        if schema_revisions is None:
+            continue
+        engine.execute("CREATE TABLE {0}.alembic_version "
+                       "(version_num VARCHAR(32) NOT NULL)".format(schema))
+        for revision in schema_revisions:
+            engine.execute("INSERT INTO {0}.alembic_version VALUES ('{1}')"
+                           .format(schema, revision))
+    return Session(engine)
+
+
+def test_migration_status(status_session):
+    schemas = ["tenant1", "tenant2", "tenant3", "tenant4"]
+    statements = []
+    event.listen(status_session.bind, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args:
+                 statements.append(statement))
+    status = migration_status(status_session, schemas, chunk_size=3)
+    assert status == {"tenant1": "rev1", "tenant2": "rev2",
+                      "tenant4": ("rev1", "rev2")}
+    # one query per chunk, besides the table lookups of the inspector
+    assert len([statement for statement in statements
+                if "alembic_version" in statement]) == 2
+
+
+def test_migration_status_unversioned(status_session):
+    schemas = ["unversioned", "tenant1", "missing"]
+    assert migration_status(status_session, schemas) == {
+        "unversioned": None, "tenant1": "rev1", "missing": None}
+    assert migration_status(status_session, ["missing"]) == {"missing": None}
+
+
+def test_versioned_schemas_information_schema():
+    connection = mock.Mock()
+    connection.dialect.name = "postgresql"
+    connection.execute.return_value = [("tenant1",)]
+    assert _versioned_schemas(connection, ["tenant1", "tenant2"]) == \
+        set(["tenant1"])
+    query = connection.execute.call_args[0][0]
+    assert "information_schema.tables" in str(query)
+
+
+def test_iter_migration_status(status_session):
+    rows = iter_migration_status(status_session, iter(["tenant2", "tenant1"]),
+                                 chunk_size=1)
+    assert next(rows) == ("tenant2", "rev2")
+    assert list(rows) == [("tenant1", "rev1")]
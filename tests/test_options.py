@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Test the per-statement schema execution option.
+"""
+import gc
+
+import pytest
+from sqlalchemy import create_engine, event, Column, Integer
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+
+
+options = pytest.importorskip("sqlalchemy_sqlschema.options")
+enable_schema_option = options.enable_schema_option
+
+Base = declarative_base()
+
+
+class Order(Base):
+    __tablename__ = "orders"
+    id = Column(Integer, primary_key=True)
+
+
+orders = Order.__table__
+
+
+@pytest.yield_fixture
+def tenant_engine():
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def attach(dbapi_connection, connection_record):
+        dbapi_connection.execute("ATTACH DATABASE ':memory:' AS tenant1")
+    enable_schema_option(engine)
+    enable_schema_option(engine)
+    Base.metadata.create_all(engine)
+    Base.metadata.create_all(
+        engine.execution_options(schema_translate_map={None: "tenant1"}))
+    engine.execute(orders.insert(), [{"id": 1}])
+    with engine.connect() as conn:
+        conn.execution_options(
+            schema_translate_map={None: "tenant1"}).execute(
+                orders.insert(), [{"id": 2}, {"id": 3}])
+    yield engine
+    engine.dispose()
+
+
+def ids(result):
+    return sorted(row[0] for row in result)
+
+
+def test_connection_option(tenant_engine):
+    with tenant_engine.connect() as conn:
+        assert ids(conn.execute(orders.select())) == [1]
+        tenant_conn = conn.execution_options(sqlschema="tenant1")
+        assert ids(tenant_conn.execute(orders.select())) == [2, 3]
+        # the connection itself is untouched
+        assert ids(conn.execute(orders.select())) == [1]
+
+
+def test_compiled_cache(tenant_engine):
+    cache = {}
+    with tenant_engine.connect() as conn:
+        conn = conn.execution_options(compiled_cache=cache)
+        statement = orders.select()
+        assert ids(conn.execute(statement)) == [1]
+        assert ids(conn.execution_options(sqlschema="tenant1")
+                   .execute(statement)) == [2, 3]
+        assert ids(conn.execute(statement)) == [1]
+        assert len(cache) == 2
+
+
+def test_query_option(tenant_engine):
+    session = Session(tenant_engine)
+    assert [order.id for order in session.query(Order)] == [1]
+    query = session.query(Order.id).execution_options(sqlschema="tenant1")
+    assert ids(query) == [2, 3]
+    session.close()
+
+
+def test_engine_option(tenant_engine):
+    engine = tenant_engine.execution_options(sqlschema="tenant1")
+    assert ids(engine.execute(orders.select())) == [2, 3]
+
+
+def test_statement_option(tenant_engine):
+    cache = {}
+    statement = orders.select().execution_options(sqlschema="tenant1")
+    session = Session(tenant_engine)
+    assert ids(session.execute(statement)) == [2, 3]
+    with tenant_engine.connect() as conn:
+        conn = conn.execution_options(compiled_cache=cache)
+        assert ids(conn.execute(statement)) == [2, 3]
+        assert ids(conn.execute(statement)) == [2, 3]
+        assert ids(conn.execute(orders.select())) == [1]
+        assert len(cache) == 2
+        # the statement takes precedence over the connection
+        assert ids(conn.execution_options(sqlschema="main")
+                   .execute(statement)) == [2, 3]
+    session.close()
+
+
+def test_translation_dropped_with_statement(tenant_engine):
+    statement = orders.select().execution_options(sqlschema="tenant1")
+    assert ids(tenant_engine.execute(statement)) == [2, 3]
+    assert statement in options._translations
+    count = len(options._translations)
+    del statement
+    gc.collect()
+    assert len(options._translations) == count - 1
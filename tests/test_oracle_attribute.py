@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Test setting and getting the schema through the driver's current_schema
+attribute, with a fake driver connection.
+"""
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from sqlalchemy_sqlschema import maintain_schema
+from sqlalchemy_sqlschema.oracle import (
+    use_current_schema_attribute, read_current_schema)
+
+
+class FakeCursor(object):
+    """A sqlite3 cursor with a ``connection`` attribute like cx_Oracle's."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._connection.cursor()
+
+    def execute(self, statement, *args):
+        self.connection.executed.append(statement)
+        return self._cursor.execute(statement, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class FakeConnection(object):
+    """A sqlite3 connection with a ``current_schema`` attribute."""
+
+    def __init__(self):
+        self._connection = sqlite3.connect(":memory:")
+        self.current_schema = None
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+@pytest.yield_fixture
+def fake_engine():
+    engine = create_engine("sqlite://", creator=FakeConnection)
+    use_current_schema_attribute(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_maintain_schema(fake_engine):
+    session = Session(fake_engine)
+    dbapi_connection = session.connection().connection.connection
+    with maintain_schema("TENANT1", session):
+        assert dbapi_connection.current_schema == "TENANT1"
+        with maintain_schema("TENANT2", session):
+            assert dbapi_connection.current_schema == "TENANT2"
+            assert read_current_schema(session) == "TENANT2"
+        assert dbapi_connection.current_schema == "TENANT1"
+    # the schema was queried once as the attribute was not set yet
+    assert dbapi_connection.current_schema == "main"
+    session.close()
+
+
+def test_get_schema_from_attribute(fake_engine):
+    session = Session(fake_engine)
+    dbapi_connection = session.connection().connection.connection
+    dbapi_connection.current_schema = "TENANT1"
+    del dbapi_connection.executed[:]
+    with maintain_schema("TENANT2", session):
+        session.execute("SELECT 1")
+    assert dbapi_connection.current_schema == "TENANT1"
+    # no GetSchema query and no SET statements
+    assert dbapi_connection.executed == ["SELECT 1"]
+    session.close()
+
+
+def test_other_engines_unaffected(engine):
+    session = Session(engine)
+    assert read_current_schema(session) is None
+    session.close()
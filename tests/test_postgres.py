@@ -128,3 +128,50 @@ class TestMaintainSchemaNestedPostgres(object):
 
             # must be reverted to the original
             assert pg_session.execute("show search_path").scalar() == pg_test_schema
+
+
+def test_session_factory_restores_pooled_connection(pg_engine,
+                                                    pg_test_schema):
+    """Test that closing a session of the factory after a commit returns its
+    connection to the pool in the initial schema"""
+    from sqlalchemy import create_engine, event, pool
+    from sqlalchemy_sqlschema.sessions import schema_sessionmaker
+    engine = create_engine(pg_engine.url, poolclass=pool.QueuePool,
+                           pool_size=1, max_overflow=0)
+
+    @event.listens_for(engine, "connect")
+    def init_search_path(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("SET search_path TO {0}".format(pg_test_schema))
+        cursor.close()
+        dbapi_connection.commit()
+
+    factory = schema_sessionmaker(bind=engine, initial_schema=pg_test_schema)
+    session = factory("test_schema_1,public")
+    session.execute("SELECT 1")
+    session.commit()
+    assert session.execute("show search_path").scalar() == \
+        "test_schema_1, public"
+    session.close()
+    with engine.connect() as conn:
+        assert conn.execute("show search_path").scalar() == pg_test_schema
+    engine.dispose()
+
+
+def test_migration_status_unversioned_schema(pg_engine, pg_test_schema):
+    """Test that a schema without an alembic_version table is reported as
+    unversioned instead of failing the query of its chunk"""
+    from sqlalchemy_sqlschema.migrations import migration_status
+    pg_engine.execute(
+        "CREATE TABLE {0}.alembic_version (version_num VARCHAR(32) NOT NULL)"
+        .format(pg_test_schema))
+    pg_engine.execute("INSERT INTO {0}.alembic_version VALUES ('rev1')"
+                      .format(pg_test_schema))
+    with pg_engine.connect() as conn:
+        with conn.begin():
+            assert migration_status(
+                conn, [pg_test_schema, "public", "missing_schema"]) == \
+                {pg_test_schema: "rev1", "public": None,
+                 "missing_schema": None}
+            # the transaction is still usable
+            assert conn.execute("SELECT 1").scalar() == 1
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Test the sampling profiler of the maintain_schema context manager
+"""
+import pytest
+
+from sqlalchemy_sqlschema import maintain_schema
+from sqlalchemy_sqlschema.maintain_schema import SchemaContextManager
+from sqlalchemy_sqlschema.profiling import (
+    enable_profiling, disable_profiling, Histogram)
+
+
+@pytest.yield_fixture
+def profiler():
+    profiler = enable_profiling(sample_every=2)
+    yield profiler
+    disable_profiling()
+
+
+def test_histogram():
+    h = Histogram()
+    assert h.percentile(99) == 0.0
+    for seconds in (0.000001, 0.000003, 0.000003, 0.001):
+        h.add(seconds)
+    assert h.count == 4
+    assert h.max == 0.001
+    assert h.percentile(50) == 0.000004
+    assert h.percentile(100) == 0.001
+    assert sum(h.to_dict()["buckets"].values()) == 4
+
+
+def test_disabled_by_default():
+    assert SchemaContextManager.profiler is None
+    assert disable_profiling() is None
+
+
+def test_invalid_sample_period():
+    with pytest.raises(ValueError):
+        enable_profiling(sample_every=0)
+
+
+def test_sampling(profiler, mock_session):
+    for _ in range(4):
+        with maintain_schema("schema1", mock_session):
+            pass
+
+    dump = profiler.dump()
+    # 1 in 2 entries is sampled
+    assert dump["enter.total"]["count"] == 2
+    assert dump["exit.total"]["count"] == 2
+    for name in ("stack", "events", "compile", "db", "python"):
+        assert dump["enter." + name]["count"] == 2
+    assert dump["enter.db"]["max"] > 0
+    assert dump["enter.db"]["max"] <= dump["enter.total"]["max"]
+
+    # sampled instances are restored to their plain methods
+    m = maintain_schema("schema1", mock_session)
+    with m:
+        pass
+    assert "_execute_set_schema" not in vars(m)
+
+    profiler.reset()
+    assert profiler.dump() == {}
+
+
+def test_sampled_enter_failure(profiler, mock_session):
+    class ExecuteError(Exception): pass
+
+    m = maintain_schema("schema1", mock_session)
+    mock_session.execute.side_effect = ExecuteError
+    with pytest.raises(ExecuteError):
+        m.__enter__()
+
+    assert "_execute_set_schema" not in vars(m)
+    assert profiler.dump()["enter.total"]["count"] == 1
+
+
+def test_disabled_while_sampled(mock_session):
+    enable_profiling(sample_every=1)
+    m = maintain_schema("schema1", mock_session)
+    with m:
+        profiler = disable_profiling()
+    # the exit is timed by the profiler of the entry
+    assert profiler.dump()["exit.total"]["count"] == 1
+    assert "_execute_set_schema" not in vars(m)
+    assert m.sampled_by is None
+    assert mock_session.execute.call_count == 3
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Test the reflection cache of structurally identical schemas, using SQLite
+attached databases as schemas.
+"""
+try:
+    from unittest import mock
+except:
+    import mock
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from sqlalchemy_sqlschema import maintain_schema
+from sqlalchemy_sqlschema.reflection import SchemaTemplate, alembic_revision
+
+SCHEMAS = {"template": "rev1", "tenant1": "rev1", "tenant2": "rev1",
+           "tenant3": "rev2"}
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    for schema, revision in SCHEMAS.items():
+        engine.execute("ATTACH DATABASE ':memory:' AS {0}".format(schema))
+        engine.execute("CREATE TABLE {0}.parent (id INTEGER PRIMARY KEY)"
+                       .format(schema))
+        engine.execute("CREATE TABLE {0}.child (id INTEGER PRIMARY KEY, "
+                       "parent_id INTEGER REFERENCES parent(id))"
+                       .format(schema))
+        engine.execute("CREATE TABLE {0}.alembic_version "
+                       "(version_num VARCHAR(32) NOT NULL)".format(schema))
+        engine.execute("INSERT INTO {0}.alembic_version VALUES ('{1}')"
+                       .format(schema, revision))
+    engine.execute("ALTER TABLE tenant3.parent ADD COLUMN name VARCHAR")
+    return Session(engine)
+
+
+def test_alembic_revision(session):
+    assert alembic_revision(session.connection(), "tenant3") == ("rev2",)
+
+
+def test_reflect_template_once(session):
+    template = SchemaTemplate("template", only=["parent", "child"])
+    with mock.patch.object(template, "_reflect",
+                           side_effect=template._reflect) as reflect:
+        metadata = template.metadata(session, "tenant1")
+        assert template.metadata(session, "tenant2") is metadata
+        assert template.metadata(session, "template") is metadata
+        assert reflect.call_count == 1
+
+    parent = metadata.tables["parent"]
+    assert parent.schema is None
+    assert set(parent.c.keys()) == {"id"}
+    # foreign keys to the template schema become unqualified as well
+    fk, = metadata.tables["child"].foreign_keys
+    assert fk.column is parent.c.id
+
+
+def test_fingerprint_drift(session):
+    fingerprint = mock.Mock(side_effect=alembic_revision)
+    template = SchemaTemplate("template", fingerprint=fingerprint,
+                              only=["parent", "child"])
+
+    metadata = template.metadata(session, "tenant1")
+    assert template.metadata(session, "tenant2") is metadata
+    drifted = template.metadata(session, "tenant3")
+    assert drifted is not metadata
+    assert "name" in drifted.tables["parent"].c
+    assert template.drifted == {"tenant3"}
+
+    # each schema is only fingerprinted once
+    template.metadata(session, "tenant1")
+    assert fingerprint.call_count == 4
+
+    template.invalidate("tenant3")
+    assert template.drifted == set()
+    assert template.metadata(session, "tenant3") is drifted
+    assert fingerprint.call_count == 5
+
+
+def test_active_schema(session):
+    template = SchemaTemplate("template", only=["parent"])
+    with mock.patch.object(template, "_load",
+                           side_effect=template._load) as load:
+        with mock.patch.object(session, "execute"):
+            with maintain_schema("tenant2", session):
+                template.metadata(session)
+        assert [c[0][1] for c in load.call_args_list] == \
+               ["template", "tenant2"]
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Test the schema-batched task scheduler.
+"""
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from sqlalchemy_sqlschema import active_schema
+from sqlalchemy_sqlschema.scheduler import SchemaBatchScheduler
+
+
+class Queue(object):
+    """A job queue of ``(schema, number)`` tasks, recording the schema active
+    when each task ran."""
+
+    def __init__(self, tasks):
+        self.tasks = list(tasks)
+        self.ran = []
+
+    def fetch(self, count):
+        fetched, self.tasks = self.tasks[:count], self.tasks[count:]
+        return fetched
+
+    def handle(self, session, task):
+        self.ran.append((active_schema(session), task))
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    engine.statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, *args):
+        engine.statements.append(statement)
+    return engine
+
+
+def make_scheduler(engine, queue, **kwargs):
+    return SchemaBatchScheduler(Session(bind=engine), queue.fetch,
+                                queue.handle, lambda task: task[0], **kwargs)
+
+
+def test_tasks_grouped_by_schema(engine):
+    queue = Queue([("tenant1", 1), ("tenant2", 1), ("tenant1", 2),
+                   ("tenant2", 2), ("tenant1", 3)])
+    scheduler = make_scheduler(engine, queue)
+    assert scheduler.run() == 5
+    assert queue.ran == [("tenant1", ("tenant1", 1)),
+                         ("tenant1", ("tenant1", 2)),
+                         ("tenant1", ("tenant1", 3)),
+                         ("tenant2", ("tenant2", 1)),
+                         ("tenant2", ("tenant2", 2))]
+    assert scheduler.stats() == {"tasks": 5, "batches": 2, "switches": 2,
+                                 "queue_switches": 5, "switches_saved": 3}
+    assert engine.statements.count("SELECT 'tenant1'") == 1
+    assert engine.statements.count("SELECT 'tenant2'") == 1
+    assert scheduler.step() is None
+
+
+def test_schema_key(engine):
+    queue = Queue([{"tenant": "tenant1"}, {"tenant": "tenant1"}])
+    scheduler = SchemaBatchScheduler(Session(bind=engine), queue.fetch,
+                                     queue.handle, "tenant")
+    assert scheduler.step() == ("tenant1", 2)
+    assert scheduler.step() is None
+
+
+def test_window(engine):
+    queue = Queue([("tenant1", 1), ("tenant2", 1), ("tenant2", 2),
+                   ("tenant1", 2)])
+    scheduler = make_scheduler(engine, queue, window=2)
+    # tenant1 is oldest on the tie
+    assert scheduler.step() == ("tenant1", 1)
+    assert scheduler.buffered == 1
+    assert scheduler.step() == ("tenant2", 2)
+    assert scheduler.step() == ("tenant1", 1)
+    assert scheduler.stats()["switches_saved"] == 0
+
+
+def test_max_batch(engine):
+    queue = Queue([("tenant1", n) for n in range(5)])
+    scheduler = make_scheduler(engine, queue, max_batch=2)
+    assert scheduler.step() == ("tenant1", 2)
+    assert scheduler.step() == ("tenant1", 2)
+    assert scheduler.step() == ("tenant1", 1)
+    assert scheduler.step() is None
+    # no switch between batches of the same schema
+    assert scheduler.stats()["switches"] == 1
+    assert engine.statements.count("SELECT 'tenant1'") == 1
+    assert engine.statements.count("SELECT 'main'") == 2
+
+
+def test_max_batch_latency(engine):
+    queue = Queue([("tenant1", n) for n in range(3)])
+    with mock.patch("sqlalchemy_sqlschema.scheduler.timer",
+                    side_effect=[0.0, 0.0, 0.0, 0.5, 1.0]):
+        scheduler = make_scheduler(engine, queue, max_batch_latency=1.0)
+        assert scheduler.step() == ("tenant1", 2)
+
+
+def test_starving_by_skips(engine):
+    queue = Queue([("small", 1)] + [("big", n) for n in range(4)])
+    scheduler = make_scheduler(engine, queue, max_batch=1, max_skips=2)
+    schemas = [scheduler.step()[0] for _ in range(5)]
+    assert schemas == ["big", "big", "small", "big", "big"]
+
+
+def test_starving_by_wait(engine):
+    queue = Queue([("small", 1)] + [("big", n) for n in range(3)])
+    scheduler = make_scheduler(engine, queue, max_batch=1, max_skips=None,
+                               max_wait=10.0)
+    with mock.patch("sqlalchemy_sqlschema.scheduler.timer",
+                    return_value=0.0) as timer:
+        assert scheduler.step()[0] == "big"
+        timer.return_value = 10.0
+        assert scheduler.step()[0] == "small"
+
+
+def test_single_connection_per_batch(engine):
+    connections = []
+    event.listen(engine, "checkout", lambda *args: connections.append(args))
+    queue = Queue([("tenant1", 1), ("tenant1", 2)])
+
+    def handle(session, task):
+        session.execute("SELECT 1")
+        session.commit()
+    scheduler = SchemaBatchScheduler(Session(bind=engine), queue.fetch,
+                                     handle, lambda task: task[0])
+    scheduler.run()
+    assert len(connections) == 1
+    # the schema is set once, across the commits of the tasks
+    assert engine.statements.count("SELECT 'tenant1'") == 1
+
+
+def test_failing_task(engine):
+    queue = Queue([("tenant1", 1), ("tenant1", 2)])
+
+    def handle(session, task):
+        if task[1] == 1:
+            raise ValueError(task)
+    scheduler = SchemaBatchScheduler(Session(bind=engine), queue.fetch,
+                                     handle, lambda task: task[0])
+    with pytest.raises(ValueError):
+        scheduler.step()
+    assert scheduler.buffered == 1
+    assert scheduler.step() == ("tenant1", 1)
+    assert scheduler.stats()["tasks"] == 2
+    # the failure exited the context, which is entered again
+    assert scheduler.stats()["switches"] == 2
+    scheduler.close()
+    assert active_schema(scheduler.session) is None
+
+
+def test_close(engine):
+    queue = Queue([("tenant1", 1), ("tenant1", 2)])
+    scheduler = make_scheduler(engine, queue, max_batch=1)
+    scheduler.step()
+    assert active_schema(scheduler.session) == "tenant1"
+    scheduler.close()
+    scheduler.close()
+    assert active_schema(scheduler.session) is None
+    assert engine.statements[-1] == "SELECT 'main'"
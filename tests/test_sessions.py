@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Test the schema-bound session factory.
+"""
+import pytest
+from sqlalchemy import create_engine, event
+
+from sqlalchemy_sqlschema import active_schema
+from sqlalchemy_sqlschema.sessions import schema_sessionmaker
+from sqlalchemy_sqlschema.tracking import track_schema, tracked_schema
+
+
+class Statements(list):
+    """The statements executed on :attr:`engine`."""
+
+    def __init__(self):
+        super(Statements, self).__init__()
+        self.engine = create_engine("sqlite://")
+        event.listen(self.engine, "before_cursor_execute", self.record)
+
+    def record(self, conn, cursor, statement, *args):
+        self.append(statement)
+
+
+@pytest.fixture
+def statements():
+    return Statements()
+
+
+def test_session_in_schema(statements):
+    factory = schema_sessionmaker(bind=statements.engine,
+                                  initial_schema="main")
+    session = factory("tenant1")
+    assert session.schema == "tenant1"
+    assert active_schema(session) == "tenant1"
+    # the initial schema is known, no GetSchema
+    assert statements == ["SELECT 'tenant1'"]
+    session.rollback()
+    session.execute("SELECT 1")
+    assert statements[-2:] == ["SELECT 'tenant1'", "SELECT 1"]
+    session.close()
+    assert statements[-1] == "SELECT 'main'"
+    assert session.schema is None
+    assert active_schema(session) is None
+
+
+def test_initial_schema_looked_up(statements):
+    factory = schema_sessionmaker(bind=statements.engine)
+    session = factory("tenant1")
+    assert statements == ["SELECT 'main'", "SELECT 'tenant1'"]
+    session.close()
+
+
+def test_sessions_recycled(statements):
+    factory = schema_sessionmaker(bind=statements.engine,
+                                  initial_schema="main", free_list_size=2)
+    session = factory("tenant1")
+    session.info["user"] = "someone"
+    session.close()
+    assert factory.free == 1
+    # closing again is harmless
+    session.close()
+    assert factory.free == 1
+
+    recycled = factory("tenant2")
+    assert recycled is session
+    assert recycled.schema == "tenant2"
+    assert recycled.info == {}
+    assert factory.free == 0
+
+    sessions = [recycled, factory("tenant3"), factory("tenant4")]
+    for each in sessions:
+        each.close()
+    assert factory.free == 2
+
+
+def test_failed_restore_not_recycled(statements):
+    factory = schema_sessionmaker(bind=statements.engine,
+                                  initial_schema="main")
+    session = factory("tenant1")
+
+    @event.listens_for(statements.engine, "before_cursor_execute")
+    def fail(conn, cursor, statement, *args):
+        raise RuntimeError("connection lost")
+    with pytest.raises(RuntimeError):
+        session.close()
+    event.remove(statements.engine, "before_cursor_execute", fail)
+    assert factory.free == 0
+
+
+def test_restore_committed(statements):
+    track_schema(statements.engine)
+    factory = schema_sessionmaker(bind=statements.engine,
+                                  initial_schema="main")
+    session = factory("tenant1")
+    session.execute("SELECT 1")
+    session.commit()
+    session.execute("SELECT 2")
+    session.close()
+    # the restore is not rolled back by the close
+    with statements.engine.connect() as conn:
+        assert tracked_schema(conn) == "main"
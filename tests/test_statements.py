@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Test the namespacing of prepared statement caches on schema switches.
+"""
+try:
+    from unittest import mock
+except:
+    import mock
+import pytest
+from sqlalchemy import create_engine
+
+from sqlalchemy_sqlschema.sql import set_schema
+from sqlalchemy_sqlschema.statements import (
+    namespace_statement_cache, register_statement_cache_handler, _handlers)
+
+
+@pytest.yield_fixture
+def handler():
+    handler = mock.Mock()
+    register_statement_cache_handler("pysqlite", handler)
+    yield handler
+    del _handlers["pysqlite"]
+
+
+def test_handler_called_on_schema_change(handler):
+    engine = create_engine("sqlite://")
+    namespace_statement_cache(engine)
+    # idempotent
+    namespace_statement_cache(engine)
+    with engine.connect() as conn:
+        conn.execute(set_schema("tenant1"))
+        conn.execute(set_schema("tenant1"))
+        conn.execute("SELECT 1")
+        assert handler.call_count == 1
+        conn.execute(set_schema("tenant2"))
+        assert handler.call_count == 2
+        dbapi_connection, info, prev_schema, schema = handler.call_args[0]
+        assert dbapi_connection is conn.connection.connection
+        assert (prev_schema, schema) == ("tenant1", "tenant2")
+
+
+def test_other_engines_unaffected(handler):
+    engine = create_engine("sqlite://")
+    engine.execute(set_schema("tenant1"))
+    assert handler.called is False
+
+
+
+def test_no_builtin_handlers():
+    assert _handlers == {}
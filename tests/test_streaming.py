@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Test deferring the schema restore while results are streaming.
+"""
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from sqlalchemy_sqlschema import maintain_schema
+from sqlalchemy_sqlschema.streaming import (
+    track_streaming_results, open_streams, _PENDING_KEY)
+from sqlalchemy_sqlschema.tracking import track_schema, tracked_schema
+from sqlalchemy_sqlschema.util import sqlalchemy_version
+
+pytestmark = pytest.mark.skipif(
+    not (1, 0) <= sqlalchemy_version() < (1, 4),
+    reason="Tracking streaming results requires SQLAlchemy 1.0 to 1.3")
+
+
+@pytest.yield_fixture
+def streaming_engine():
+    engine = create_engine("sqlite://")
+    engine.execute("CREATE TABLE numbers (n INTEGER)")
+    engine.execute("INSERT INTO numbers VALUES (1), (2), (3)")
+    track_streaming_results(engine)
+    # idempotent
+    track_streaming_results(engine)
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    engine.statements = statements
+    yield engine
+    engine.dispose()
+
+
+def stream(session):
+    return session.connection().execution_options(stream_results=True) \
+        .execute("SELECT n FROM numbers")
+
+
+def test_restore_deferred_until_exhausted(streaming_engine):
+    session = sessionmaker(bind=streaming_engine)()
+    with maintain_schema("tenant1", session):
+        result = stream(session)
+        assert result.fetchone() == (1,)
+        del streaming_engine.statements[:]
+    # the restore waits for the stream
+    assert streaming_engine.statements == []
+    assert len(open_streams(session.connection())) == 1
+    assert [row.n for row in result] == [2, 3]
+    assert streaming_engine.statements == ["SELECT 'main'"]
+    assert open_streams(session.connection()) == []
+    session.close()
+
+
+def test_restore_deferred_until_closed(streaming_engine):
+    session = sessionmaker(bind=streaming_engine)()
+    with maintain_schema("tenant1", session):
+        result = stream(session)
+        del streaming_engine.statements[:]
+    result.close()
+    assert streaming_engine.statements == ["SELECT 'main'"]
+    session.close()
+
+
+def test_restore_before_next_statement(streaming_engine):
+    session = sessionmaker(bind=streaming_engine)()
+    with maintain_schema("tenant1", session):
+        with maintain_schema("tenant2", session):
+            result = stream(session)
+            del streaming_engine.statements[:]
+        session.execute("SELECT 1")
+        assert streaming_engine.statements == ["SELECT 'tenant1'",
+                                               "SELECT 1"]
+        result.close()
+    session.close()
+
+
+def test_restore_on_checkin(streaming_engine):
+    session = sessionmaker(bind=streaming_engine)()
+    with maintain_schema("tenant1", session):
+        result = stream(session)
+        connection = session.connection()
+        del streaming_engine.statements[:]
+    record_info = connection.info
+    assert record_info[_PENDING_KEY] == "main"
+    session.close()
+    assert _PENDING_KEY not in record_info
+    result.close()
+
+
+def test_not_deferred_without_streams(streaming_engine):
+    session = sessionmaker(bind=streaming_engine)()
+    with maintain_schema("tenant1", session):
+        session.execute("SELECT n FROM numbers").fetchall()
+        del streaming_engine.statements[:]
+    assert streaming_engine.statements == ["SELECT 'main'"]
+    session.close()
+
+
+def test_restore_dropped_on_invalidated_checkin(streaming_engine):
+    session = sessionmaker(bind=streaming_engine)()
+    with maintain_schema("tenant1", session):
+        result = stream(session)
+        connection = session.connection()
+        del streaming_engine.statements[:]
+    record_info = connection.info
+    connection.invalidate()
+    session.close()
+    assert _PENDING_KEY not in record_info
+    assert streaming_engine.statements == []
+    result.close()
+
+
+def test_restore_on_checkin_tracked(streaming_engine):
+    track_schema(streaming_engine)
+    session = sessionmaker(bind=streaming_engine)()
+    with maintain_schema("tenant1", session):
+        result = stream(session)
+    session.commit()
+    session.close()
+    with streaming_engine.connect() as conn:
+        assert tracked_schema(conn) == "main"
+    result.close()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Test the schema usage telemetry
+"""
+import random
+from collections import Counter
+
+import pytest
+
+from sqlalchemy_sqlschema import maintain_schema
+from sqlalchemy_sqlschema.maintain_schema import SchemaContextManager
+from sqlalchemy_sqlschema.telemetry import (
+    SpaceSaving, enable_usage_tracking, disable_usage_tracking)
+
+
+class TestSpaceSaving(object):
+
+    def test_exact_under_capacity(self):
+        summary = SpaceSaving(3)
+        for item in "abacab":
+            summary.add(item)
+        assert summary.top(2) == [("a", 3, 0, 0.0), ("b", 2, 0, 0.0)]
+        assert len(summary) == 3
+
+    def test_eviction(self):
+        summary = SpaceSaving(2)
+        for item in "aab":
+            summary.add(item)
+        summary.add("c")
+        # "b" had the minimum count and was replaced
+        assert "b" not in summary
+        assert sorted(summary.top(2)) == [("a", 2, 0, 0.0), ("c", 2, 1, 0.0)]
+
+    def test_error_bounds(self):
+        rng = random.Random(42)
+        # a skewed distribution over many more items than the capacity
+        stream = [int(rng.paretovariate(1.2)) for _ in range(20000)]
+        summary = SpaceSaving(50)
+        for item in stream:
+            summary.add(item)
+        exact = Counter(stream)
+        assert summary.total == len(stream)
+        assert len(summary) == 50
+        for item, count, error, _ in summary.top(50):
+            assert count - error <= exact[item] <= count
+        # the heavy hitters are found
+        top_items = [item for item, _, _, _ in summary.top(5)]
+        assert top_items == [item for item, _ in exact.most_common(5)]
+
+    def test_weight(self):
+        summary = SpaceSaving(1)
+        summary.add("a")
+        summary.add_weight("a", 1.5)
+        summary.add_weight("b", 1.0)
+        assert summary.top(1) == [("a", 1, 0, 1.5)]
+
+    def test_invalid_capacity(self):
+        with pytest.raises(ValueError):
+            SpaceSaving(0)
+
+
+@pytest.yield_fixture
+def tracker():
+    tracker = enable_usage_tracking(capacity=10)
+    yield tracker
+    disable_usage_tracking()
+
+
+def test_tracking(tracker, mock_session):
+    for schema in ("schema1", "schema2", "schema1"):
+        with maintain_schema(schema, mock_session):
+            pass
+    usage = tracker.top(2)
+    assert [(u.schema, u.count, u.error) for u in usage] == \
+           [("schema1", 2, 0), ("schema2", 1, 0)]
+    assert usage[0].hold_time > 0
+    assert tracker.total == 3
+
+
+def test_disabled(mock_session):
+    assert SchemaContextManager.tracker is None
+    with maintain_schema("schema1", mock_session):
+        tracker = enable_usage_tracking()
+    assert disable_usage_tracking() is tracker
+    assert tracker.top() == []
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Test tracking the schema of connections.
+"""
+import pytest
+from sqlalchemy import create_engine
+
+from sqlalchemy_sqlschema.sql import set_schema
+from sqlalchemy_sqlschema.tracking import (
+    track_schema, tracked_schema, forget_schema, sniff_schema)
+
+
+@pytest.mark.parametrize("statement, dialect, expected", [
+    ("SET search_path TO tenant1", "postgresql", (True, "tenant1")),
+    ("set search_path = tenant1, public;", "postgresql", (True, "tenant1")),
+    ("  SET SESSION search_path TO 'Tenant 1'", "postgresql",
+     (True, "Tenant 1")),
+    ('SET search_path TO "$user", public', "postgresql", (True, None)),
+    ("SET search_path TO $user", "postgresql", (True, None)),
+    ("SET LOCAL search_path TO tenant1", "postgresql", (True, None)),
+    ("SET search_path TO DEFAULT", "postgresql", (True, None)),
+    ("SET SCHEMA 'tenant1'", "postgresql", (True, "tenant1")),
+    ("SET statement_timeout TO 100", "postgresql", (False, None)),
+    ("SELECT 'SET search_path TO x'", "postgresql", (False, None)),
+    ("ALTER SESSION SET CURRENT_SCHEMA = tenant1", "oracle",
+     (True, "tenant1")),
+    ("alter session set nls_date_format = 'YYYY'", "oracle", (False, None)),
+    ("ALTER TABLE t ADD c INT", "oracle", (False, None)),
+    ("SET SCHEMA tenant1", "sqlite", (True, "tenant1")),
+    ("SET search_path TO tenant1", "sqlite", (False, None)),
+])
+def test_sniff_schema(statement, dialect, expected):
+    assert sniff_schema(statement, dialect) == expected
+
+
+def test_track_set_schema():
+    engine = create_engine("sqlite://")
+    track_schema(engine)
+    track_schema(engine)
+    with engine.connect() as conn:
+        assert tracked_schema(conn) is None
+        conn.execute(set_schema("tenant1"))
+        assert tracked_schema(conn) == "tenant1"
+        conn.execute("SELECT 1")
+        assert tracked_schema(conn) == "tenant1"
+        forget_schema(conn)
+        assert tracked_schema(conn) is None
+
+
+def test_reverted_on_rollback():
+    engine = create_engine("sqlite://")
+    track_schema(engine)
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        conn.execute(set_schema("tenant1"))
+        transaction.rollback()
+        assert tracked_schema(conn) is None
+        with conn.begin():
+            conn.execute(set_schema("tenant1"))
+        assert tracked_schema(conn) == "tenant1"
+        transaction = conn.begin()
+        conn.execute(set_schema("tenant2"))
+        transaction.rollback()
+        assert tracked_schema(conn) == "tenant1"
+        conn.execute(set_schema("tenant2"))
+    # reset by the pool when returned, without a commit
+    with engine.connect() as conn:
+        assert tracked_schema(conn) == "tenant1"
+
+
+def test_forgotten_on_savepoint_rollback():
+    engine = create_engine("sqlite://")
+    track_schema(engine)
+    with engine.connect() as conn:
+        with conn.begin():
+            conn.execute(set_schema("tenant1"))
+            savepoint = conn.begin_nested()
+            savepoint.rollback()
+            assert tracked_schema(conn) is None
+
+
+def test_disable_sniffing():
+    engine = create_engine("sqlite://")
+    track_schema(engine)
+    track_schema(engine, sniff=False)
+    with engine.connect() as conn:
+        conn.execute(set_schema("tenant1"))
+        assert tracked_schema(conn) == "tenant1"
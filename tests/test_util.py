@@ -1,6 +1,12 @@
 # -*- coding: utf-8 -*-
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+import pytest
 
-from sqlalchemy_sqlschema.util import Stack
+from sqlalchemy_sqlschema.util import (
+    Stack, require_sqlalchemy, sqlalchemy_version)
 
 class TestStack(object):
 
@@ -26,4 +32,18 @@ class TestStack(object):
         s = Stack([1,2])
         assert s.top == 2
         s = Stack()
-        assert s.top is None
\ No newline at end of file
+        assert s.top is None
+
+
+def test_require_sqlalchemy():
+    with mock.patch("sqlalchemy.__version__", "1.3.24"):
+        assert sqlalchemy_version() == (1, 3)
+        require_sqlalchemy("feature", (1, 2), (1, 4))
+        require_sqlalchemy("feature", (0, 9))
+        with pytest.raises(ImportError) as excinfo:
+            require_sqlalchemy("feature", (1, 2), (1, 3))
+        assert str(excinfo.value) == \
+            "feature requires SQLAlchemy >=1.2,<1.3, found 1.3.24"
+    with mock.patch("sqlalchemy.__version__", "1.4.0b1"):
+        with pytest.raises(ImportError):
+            require_sqlalchemy("feature", (1, 2), (1, 4))
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Test pool pre-warming against a SQLite database file where the schema switch
+is a stand-in.
+"""
+import pytest
+from sqlalchemy import create_engine, event, pool
+from sqlalchemy.orm import Session
+
+from sqlalchemy_sqlschema import maintain_schema
+from sqlalchemy_sqlschema.deferred import (
+    enable_deferred_restore, pending_restore)
+from sqlalchemy_sqlschema.warmup import prewarm_pool
+
+
+@pytest.fixture
+def engine(tmpdir):
+    engine = create_engine(
+        "sqlite:///" + str(tmpdir.join("db.sqlite")),
+        poolclass=pool.QueuePool, pool_size=5, max_overflow=0,
+        connect_args={"check_same_thread": False})
+    engine.statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, *args):
+        engine.statements.append((id(conn.connection.connection), statement))
+    return engine
+
+
+def test_prewarm(engine):
+    report = prewarm_pool(engine, {"tenant1": 3, "tenant2": 2},
+                          warmup="SELECT 2", concurrency=2)
+
+    assert report.connections == 5
+    assert len(report.durations["tenant1"]) == 3
+    assert not report.errors
+    assert report.elapsed > 0
+    # all the connections are distinct and back in the pool
+    assert engine.pool.checkedin() == 5
+    assert len(set(conn for conn, _ in engine.statements)) == 5
+    statements = [statement for _, statement in engine.statements]
+    assert statements.count("SELECT 'tenant1'") == 3
+    assert statements.count("SELECT 2") == 5
+    # each connection is restored to its default schema
+    for conn in set(conn for conn, _ in engine.statements):
+        assert [statement for other, statement in engine.statements
+                if other == conn][-1] == "SELECT 'main'"
+
+
+def test_prewarm_callable_and_errors(engine):
+    def warmup(connection, schema):
+        if schema == "bad":
+            raise ValueError(schema)
+        connection.execute("SELECT 3")
+
+    report = prewarm_pool(engine, {"tenant1": 1, "bad": 2}, warmup=warmup)
+    assert report.connections == 1
+    assert [str(e) for e in report.errors["bad"]] == ["bad", "bad"]
+    assert engine.pool.checkedin() == 3
+
+
+def test_prewarm_deferred(engine):
+    enable_deferred_restore(engine)
+    prewarm_pool(engine, {"tenant1": 1}, warmup="SELECT 2")
+    assert engine.statements[-1][1] == "SELECT 2"
+    with engine.connect() as conn:
+        assert pending_restore(conn) == "main"
+    del engine.statements[:]
+    session = Session(bind=engine)
+    with maintain_schema("tenant1", session):
+        session.execute("SELECT 3")
+    # the connection is taken over in its schema
+    assert [statement for _, statement in engine.statements] == ["SELECT 3"]
+    session.close()